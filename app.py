@@ -1,6 +1,4 @@
 from flask import Flask, render_template, jsonify, make_response
-import pandas as pd
-import requests
 from bs4 import BeautifulSoup as bs
 import time
 from datetime import datetime
@@ -9,6 +7,11 @@ import queue
 import logging
 import os
 
+import http_client
+import market_schedule
+import rate_limiter
+import ranking
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -88,9 +91,17 @@ update_thread = None
 running = True
 thread_started = False
 scan_results = {}
+scan_generation = 0  # Incremented every time the background updater publishes scan_results
+scan_updated_at = None  # time.time() of the last publish
+stale_conditions = {}  # condition name -> {'since', 'error'} while its last good result is being served
+refresh_requested = threading.Event()  # Set by /api/refresh to wake the updater early
+refresh_min_interval = 30  # Minimum seconds between manual refreshes
+last_manual_refresh = 0
+refresh_lock = threading.Lock()
+refresh_schedule = market_schedule.RefreshScheduler()  # Refreshes follow the NSE session and each scan's timeframe
 
-def fetch_and_process_data(session):
-    """Fetch and process stock data using the provided session"""
+def fetch_and_process_data(session, selected=None):
+    """Fetch and process stock data using the provided session (all conditions unless selected)"""
     url = "https://chartink.com/screener/process"
     all_scans = {}
 
@@ -109,7 +120,7 @@ def fetch_and_process_data(session):
         logger.info("CSRF token obtained successfully")
 
         stocks_found = False
-        for cond in conditions:
+        for cond in (conditions if selected is None else selected):
             if not running:
                 return
 
@@ -119,20 +130,11 @@ def fetch_and_process_data(session):
                 response.raise_for_status()
                 
                 data = response.json()
-                stock_list = pd.DataFrame(data["data"])
+                top_stocks = ranking.rank(data["data"], cond["name"])
 
-                if not stock_list.empty:
+                if top_stocks:
                     stocks_found = True
-                    stock_list["per_chg"] = pd.to_numeric(stock_list["per_chg"])
-                    stock_list["potential_score"] = stock_list["per_chg"] * stock_list["close"]
-                    
-                    if cond["name"] == "STRONG":
-                        sorted_stock_list = stock_list.sort_values(by="potential_score", ascending=False).head(10)
-                    else:
-                        sorted_stock_list = stock_list.sort_values(by="potential_score", ascending=False)
-                    
-                    # Convert DataFrame to dict for JSON serialization
-                    all_scans[cond["name"]] = sorted_stock_list.head(10).to_dict('records')
+                    all_scans[cond["name"]] = top_stocks
                     logger.info(f"Found {len(all_scans[cond['name']])} stocks for {cond['name']}")
                 else:
                     logger.info(f"No stocks found for {cond['name']}")
@@ -152,19 +154,38 @@ def fetch_and_process_data(session):
         logger.error(f"Error in fetch_and_process_data: {str(e)}")
         return {"error": str(e)}
 
-def fetch_data():
-    """Fetch data from all scan conditions"""
-    global scan_results, last_update_time
+def fetch_data(selected=None, priority=rate_limiter.BACKGROUND):
+    """Fetch data from the selected scan conditions (default: all) at the given rate-limiter priority"""
+    global scan_results, last_update_time, scan_generation, scan_updated_at
+    selected = conditions if selected is None else selected
+    names = [cond['name'] for cond in selected]
     
     try:
-        with requests.Session() as session:
-            session.headers.update({
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-            })
-            all_results = fetch_and_process_data(session)
-            scan_results = all_results
-            last_update_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            return True
+        # Reuse the process-wide Chartink client instead of reconnecting every cycle
+        with rate_limiter.priority(priority):
+            all_results = fetch_and_process_data(http_client.chartink(), selected)
+        if not all_results or 'error' in all_results:
+            # The whole cycle failed (e.g. no CSRF token): keep serving the last good results
+            error = (all_results or {}).get('error', 'fetch failed')
+            failed = {name: error for name in names}
+        else:
+            failed = {name: stocks['error'] for name, stocks in all_results.items() if not isinstance(stocks, list)}
+        succeeded = [name for name in names if name in (all_results or {}) and name not in failed]
+        refresh_schedule.mark_refreshed(succeeded)
+        refresh_schedule.mark_failed(failed, delay=max(market_schedule.RETRY_INTERVAL, http_client.chartink().breaker.retry_after()))
+        for name in succeeded:
+            stale_conditions.pop(name, None)
+        for name, error in failed.items():
+            stale_conditions[name] = {'since': stale_conditions.get(name, {}).get('since', time.time()), 'error': error}
+
+        # Conditions that were not due, or failed, keep their previous results
+        merged = dict(scan_results)
+        merged.update({name: all_results[name] for name in succeeded})
+        scan_results = merged
+        scan_generation += 1
+        scan_updated_at = time.time()
+        last_update_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        return True
     except Exception as e:
         logger.error(f"Error in fetch_data: {str(e)}")
         return False
@@ -173,8 +194,14 @@ def update_data():
     """Background thread function to update data periodically"""
     global running
     while running:
-        fetch_data()
-        time.sleep(30)
+        # A manual refresh fetches everything; otherwise only what the schedule says is due
+        manual = refresh_requested.is_set()
+        due = conditions if manual else refresh_schedule.due(conditions)
+        refresh_requested.clear()
+        if due:
+            # A user-triggered refresh goes ahead of background traffic in the rate limiter
+            fetch_data(due, rate_limiter.INTERACTIVE if manual else rate_limiter.BACKGROUND)
+        refresh_requested.wait(refresh_schedule.next_wake(conditions))
 
 def play_beep():
     """Play system beep using bell character"""
@@ -192,16 +219,23 @@ def play_beep():
 def index():
     return render_template('index.html')
 
+def snapshot_meta():
+    """Generation number and age in seconds of the scan_results snapshot"""
+    age = round(time.time() - scan_updated_at, 1) if scan_updated_at else None
+    return {'generation': scan_generation, 'snapshot_age': age}
+
 @app.route('/api/scan_results')
 def get_scan_results():
     """API endpoint to get scan results"""
-    # Force a fresh data fetch on each request
-    fetch_data()
-    
-    # Create response with no-cache headers
+    # Serve the snapshot maintained by the background thread; never scrape inline
+    now = time.time()
     response = make_response(jsonify({
         'results': scan_results,
-        'last_update': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        'last_update': last_update_time,
+        # Conditions served from an earlier fetch because the latest one failed
+        'stale': {name: {'stale_for': round(now - info['since'], 1), 'error': info['error']}
+                  for name, info in stale_conditions.items()},
+        **snapshot_meta()
     }))
     
     # Set headers to prevent caching
@@ -211,6 +245,32 @@ def get_scan_results():
     
     return response
 
+@app.route('/api/refresh', methods=['POST'])
+def refresh_now():
+    """Ask the background thread to refresh immediately (rate-limited)"""
+    global last_manual_refresh
+    with refresh_lock:
+        wait = refresh_min_interval - (time.time() - last_manual_refresh)
+        if wait > 0:
+            response = jsonify({'status': 'rate_limited', 'retry_after': int(wait) + 1, **snapshot_meta()})
+            response.status_code = 429
+            response.headers['Retry-After'] = str(int(wait) + 1)
+            return response
+        last_manual_refresh = time.time()
+    refresh_requested.set()
+    logger.info("Manual refresh requested")
+    return jsonify({'status': 'queued', **snapshot_meta()}), 202
+
+@app.route('/api/rate-limits')
+def rate_limits():
+    """Remaining request budget, queue depth and throttling per upstream host"""
+    return jsonify(http_client.rate_limits())
+
+@app.route('/api/schedule')
+def schedule_status():
+    """Market phase, per-condition cadence and last refresh times"""
+    return jsonify(refresh_schedule.status(conditions))
+
 def start_background_thread():
     """Start the background update thread"""
     global update_thread, running, thread_started
@@ -13,16 +13,30 @@ import threading
 import time
 import winsound
 
-from bs4 import BeautifulSoup as bs
-import pandas as pd
 import pygame
 import requests
 from flask import Flask, render_template, jsonify, make_response, send_from_directory, request, flash
-from flask_caching import Cache
 from flask_wtf import FlaskForm
 from wtforms import StringField, PasswordField, SubmitField
 from wtforms.validators import DataRequired, Email, EqualTo
 
+import csrf_token
+import dashboard_fragments
+import event_stream
+import http_client
+import index_feed
+import market_schedule
+import ohlcv_store
+import rate_limiter
+import ranking
+import score_history
+import snapshot_store
+import stock_query
+import symbol_table
+import fetch_engine
+import ttl_cache
+import volume_resolver
+
 # Set logging level to INFO to reduce verbosity
 logging.basicConfig(level=logging.INFO)
 logging.getLogger("urllib3").setLevel(logging.WARNING)  # Suppress urllib3 debug logs
@@ -75,7 +89,6 @@ def beep_worker():
 
 app = Flask(__name__, static_url_path='/static', static_folder='static')
 
-#cache = Cache(app)
 # Initialize pygame mixer with error handling
 try:
     pygame.mixer.quit()  # Ensure clean state
@@ -84,58 +97,8 @@ try:
 except Exception as e:
     logger.error(f"Failed to initialize pygame mixer: {e}")
 
-# Add formatNumber as a Jinja2 filter
-@app.template_filter('formatNumber')
-def format_number(num):
-    if num is None:
-        return ''
-    
-    # Handle potential score - round to nearest integer
-    if num > 1000:  # Potential scores are typically large numbers
-        return str(round(num))
-    
-    # For percentages and small numbers, keep 2 decimal places
-    if isinstance(num, (int, float)):
-        return f"{num:.2f}" if num < 100 else str(round(num))
-    
-    return str(num)
-
-# Add format_number as a Jinja2 filter
-def format_number(value, column_type='default'):
-    if value is None:
-        return '-'
-    
-    try:
-        num = float(value)
-        # print(f"Column: {column_type}, Raw Value: {num}")  # Debugging
-        
-        # Format Close with two decimal places
-        if column_type == 'close':
-            formatted_value = f"{num:.2f}"
-            # print(f"Formatted Close: {formatted_value}")  # Debugging
-            return formatted_value  
-
-        # Format Change % with two decimal places and add percentage sign
-        if column_type == 'change_percent':
-            formatted_value = f"{num:.2f}%"  # Ensure two decimal places
-            # print(f"Formatted Change %: {formatted_value}")  # Debugging
-            return formatted_value  
-
-        # Format Volume as an integer
-        # Format Volume as an integer
-        if column_type == 'volume':
-            return str(round(num))  # Round to nearest integer and return as string
-        
-        # Format Score as an integer
-        if column_type == 'score':
-            return str(round(num))  # Round to nearest integer and return as string  # Convert to integer and return as string
-         
-        return f"{num:.2f}"  # Default case to format to two decimal places
-    except (ValueError, TypeError):
-        return str(value)
-
-# Register the filter
-app.jinja_env.filters['format_number'] = format_number
+# One number formatter for templates; the dashboard fragments use its vectorized twin
+app.jinja_env.filters['format_number'] = dashboard_fragments.format_number
 
 class RegistrationForm(FlaskForm):
     username = StringField('Username', validators=[DataRequired()])
@@ -446,8 +409,25 @@ beep_thread = None
 threads_started = False
 running = True
 thread_started = False
-scan_results = {}
-previous_scores = {}  # Initialize previous_scores globally
+# Versioned, immutable scan result snapshots; each cycle publishes one version per condition plus the merge
+scan_store = snapshot_store.SnapshotStore(snapshot_store.history_for(len(conditions) + 1))
+scan_results = scan_store.current.results  # Read-only view of the current snapshot
+scan_events = event_stream.EventBroadcaster()  # Pushes scan deltas, index ticks and alerts to /stream clients
+score_trail = score_history.ScoreHistory()  # Bounded per-symbol score history, fed once per snapshot
+page_fragments = dashboard_fragments.DashboardFragments()  # Rendered cards and panels per snapshot
+fetch_max_in_flight = fetch_engine.DEFAULT_MAX_IN_FLIGHT  # Concurrent Chartink requests (1 = serial)
+fetch_condition_timeout = fetch_engine.DEFAULT_CONDITION_TIMEOUT  # Seconds allowed per condition
+last_fetch_report = None  # FetchReport from the most recent refresh
+refresh_requested = threading.Event()  # Set by /refresh-now to wake the updater early
+refresh_min_interval = 30  # Minimum seconds between manual refreshes
+last_manual_refresh = 0
+refresh_lock = threading.Lock()
+csrf_tokens = csrf_token.CsrfTokenManager()  # Chartink CSRF token shared across conditions and cycles
+http_client.configure('chartink', pool_maxsize=fetch_max_in_flight)  # One keep-alive connection per in-flight request
+nse_indices = index_feed.IndexFeed(on_update=lambda feed: publish_index_tick(feed))  # One allIndices download feeds every index endpoint
+scan_cache = ttl_cache.TTLCache('scans', maxsize=64, default_ttl=15)  # Chartink results per condition; overlapping refreshes share one request
+volume_lookup = volume_resolver.VolumeResolver(volume_resolver.default_sources(ohlcv_store.OhlcvStore(readonly=True)))  # Daily volume lookups across NSE, Yahoo, bhavcopy and the local store
+refresh_schedule = market_schedule.RefreshScheduler()  # Per-timeframe refresh cadence that follows the NSE session
 
 def load_settings():
     """
@@ -489,9 +469,14 @@ logger.info(f"Initial mute status loaded: {is_muted}")
 
 @app.route('/clear_cache')
 def clear_cache():
-    cache.clear()
+    ttl_cache.clear_all()
     return "Cache cleared!"
 
+@app.route('/debug/cache')
+def debug_cache():
+    """Hit/miss/eviction metrics for every upstream cache"""
+    return jsonify(ttl_cache.stats())
+
 @app.route('/update_mute_status', methods=['POST'])
 def update_mute_status():
     global is_muted, settings
@@ -502,31 +487,18 @@ def update_mute_status():
     logger.info(f"Mute status set to: {is_muted}")
     return jsonify({'status': 'success', 'isMuted': is_muted})
 
-def fetch_and_process_data(session, condition):
+def fetch_and_process_data(session, condition, timeout=None):
     """Fetch and process stock data using the provided session"""
-    url = "https://chartink.com/screener/process"
     # logger.info(f"Fetching data for condition: {condition['name']}")
     
     try:
-        # Get CSRF token
-        # logger.info("Fetching CSRF token...")
-        r_data = session.get(url)
-        r_data.raise_for_status()
-        soup = bs(r_data.content, "lxml")
-        meta = soup.find("meta", {"name": "csrf-token"})
-        if not meta:
-            logger.error("Could not find CSRF token")
-            return {"error": "Could not find CSRF token"}
-        
-        header = {"x-csrf-token": meta["content"]}
-        # logger.info("CSRF token obtained successfully")
-
+        # The CSRF token is cached per session and shared by every condition
         try:
             # logger.info(f"Request URL: {url}")
             # logger.info(f"Request Headers: {header}")
             # logger.info(f"Request Data: {{'scan_clause': {condition['scan_clause']}}}")
             
-            response = session.post(url, headers=header, data={"scan_clause": condition["scan_clause"]})
+            response = csrf_tokens.post(session, {"scan_clause": condition["scan_clause"]}, timeout=timeout)
             response.raise_for_status()
             
             data = response.json()
@@ -541,31 +513,10 @@ def fetch_and_process_data(session, condition):
             
             if 'data' not in data:
                 logger.error(f"Invalid response format for {condition['name']}: {data}")
-                return []
+                return {"error": "Invalid response format"}
             
-            stock_list = pd.DataFrame(data["data"])
-
-            if not stock_list.empty:
-                stock_list["per_chg"] = pd.to_numeric(stock_list["per_chg"])
-                stock_list["potential_score"] = stock_list["per_chg"] * stock_list["close"]
-                
-                if condition["name"] == "STRONG":
-                    sorted_stock_list = stock_list.sort_values(by="potential_score", ascending=False).head(10)
-                    
-                elif condition["name"] == "HARSH SELL STOCKS":
-                    sorted_stock_list = stock_list.sort_values(by="potential_score", ascending=True)  # Sort by potential_score ascending
-                
-                elif condition["name"] == "STRONG STOCKS NEGATIVE":
-                    sorted_stock_list = stock_list.sort_values(by="potential_score", ascending=True)  # Sort by potential_score ascending
-                
-                else:
-                    sorted_stock_list = stock_list.sort_values(by="potential_score", ascending=False)
-                
-                # Convert DataFrame to dict for JSON serialization
-                return sorted_stock_list.head(10).to_dict('records')
-            else:
-                # logger.info(f"No stocks found for {condition['name']}")
-                return []
+            # Top 10 by potential_score (lowest first for the bearish scans)
+            return ranking.rank(data["data"], condition["name"])
         
         except Exception as e:
             logger.error(f"Error processing {condition['name']}: {str(e)}")
@@ -575,28 +526,89 @@ def fetch_and_process_data(session, condition):
         logger.error(f"Error in fetch_and_process_data: {str(e)}")
         return {"error": str(e)}
 
-def fetch_data():
+def publish_scan_results(results=None, name=None, stocks=None):
+    """
+    Publish a full result set (or one condition) to the snapshot store and
+    push the resulting delta to /stream subscribers.
+    """
+    global scan_results
+    previous = scan_store.current
+    snapshot = scan_store.update(name, stocks) if name is not None else scan_store.publish(results)
+    if snapshot is not previous:
+        scan_events.publish('scan', scan_store.delta_json(previous.version, snapshot=snapshot), event_id=snapshot.version)
+    scan_results = snapshot.results
+    return snapshot
+
+def fetch_data(selected_conditions=None, priority=rate_limiter.BACKGROUND):
     """
     Fetch stock data from various sources and process them.
     Play alert sound after auto-refresh.
+
+    Args:
+        selected_conditions: conditions to refresh (default: all); the others
+            keep their current results
+        priority: rate-limiter class for the Chartink requests (INTERACTIVE
+            for user-triggered refreshes)
     """
     global scan_results, is_muted
+    targets = conditions if selected_conditions is None else selected_conditions
     
     def _fetch_data_impl():
         """Implementation of fetch_data that assumes app context exists"""
-        global scan_results, is_muted
+        global scan_results, is_muted, last_fetch_report
         
         try:
             # Create a new dictionary to store results
             new_scan_results = {}
-            with requests.Session() as session:
-                for condition in conditions:
-                    stocks = fetch_and_process_data(session, condition)
-                    if stocks:
-                        new_scan_results[condition['name']] = stocks
-
-            # Update the global variables
-            scan_results = new_scan_results
+
+            def _merge_result(name, stocks):
+                """Publish each condition as soon as it arrives"""
+                if stocks and isinstance(stocks, list):
+                    new_scan_results[name] = stocks
+                    publish_scan_results(name=name, stocks=stocks)
+
+            # The long-lived client keeps connections and the CSRF token across cycles
+            session = http_client.chartink()
+
+            def _fetch_one(condition):
+                # Runs on a fetch_engine worker, so the priority is set per thread
+                with rate_limiter.priority(priority):
+                    return scan_cache.get_or_load(
+                        (condition['name'], condition['scan_clause']),
+                        lambda: fetch_and_process_data(session, condition, timeout=fetch_condition_timeout),
+                        cacheable=lambda stocks: isinstance(stocks, list),
+                    )
+
+            results, report = fetch_engine.fetch_conditions(
+                targets,
+                _fetch_one,
+                on_result=_merge_result,
+                max_in_flight=fetch_max_in_flight,
+                timeout=fetch_condition_timeout,
+                should_continue=lambda: running,
+            )
+            last_fetch_report = report
+            logger.info(f"Fetch cycle complete: {report.summary()}")
+            failed = {name: stocks.get('error', 'fetch failed') for name, stocks in results.items() if not isinstance(stocks, list)}
+            failed.update({name: 'timed out' for name in report.timed_out})
+            succeeded = {name for name in results if name not in failed}
+            scan_store.mark_fresh(succeeded)
+            for name, error in failed.items():
+                scan_store.mark_stale(name, error)
+            # Failures are retried sooner than the normal cadence, but not before Chartink's circuit allows it
+            refresh_schedule.mark_refreshed(succeeded)
+            refresh_schedule.mark_failed(failed, delay=max(market_schedule.RETRY_INTERVAL, session.breaker.retry_after()))
+
+            # Drop conditions that came back empty; failed ones keep serving their last good result
+            current = scan_store.current.results
+            publish_scan_results({
+                condition['name']: new_scan_results.get(condition['name'], current.get(condition['name']))
+                for condition in conditions
+                if condition['name'] in new_scan_results
+                or (condition['name'] not in succeeded and condition['name'] in current)
+            })
+            # Score history advances once per refresh cycle, not per page render
+            jumps = record_score_history()
             
             # Load mute status from db.json
             settings = load_settings()
@@ -605,11 +617,15 @@ def fetch_data():
             # Play alert sound only if unmuted
             if not is_muted:
                 play_alert()
+                scan_events.publish('alert', {'version': scan_store.current.version, 'time': time.time(), 'jumps': jumps})
                 
             return scan_results
             
         except Exception as e:
             logger.error(f"Error in _fetch_data_impl: {e}", exc_info=True)
+            for condition in targets:
+                scan_store.mark_stale(condition['name'], str(e))
+            refresh_schedule.mark_failed([condition['name'] for condition in targets])
             return None
     
     # Ensure we're in an application context
@@ -629,23 +645,28 @@ def filter_stocks(stocks, condition):
         # Filter for positive percentage change
         return [stock for stock in stocks if stock['per_chg'] > 0]
 
+def get_refresh_interval():
+    """Seconds until the scheduler expects the next condition to be due"""
+    return math.ceil(refresh_schedule.next_wake(conditions))
+
 def update_data():
     """
-    Background thread function to update stock data every 2 minutes
+    Background thread function to refresh conditions as they fall due
     
     This function:
-    - Fetches fresh data
-    - Updates the countdown timer
+    - Fetches the conditions the market schedule says are due (all of them
+      on a manual refresh)
+    - Sets the countdown timer to the next due time
     - Handles errors gracefully
     - Respects the running flag for clean shutdown
     """
     global running, countdown_timer, last_alert_time
     
-    def _update_with_context():
+    def _update_with_context(due, priority):
         """Helper function to run with application context"""
         try:
             with app.app_context():
-                fetch_data()
+                fetch_data(due, priority)
                 return True
         except Exception as e:
             logger.error(f"Error in _update_with_context: {e}", exc_info=True)
@@ -653,23 +674,33 @@ def update_data():
     
     while running:
         try:
-            logger.info("Starting background data update...")
-            update_successful = _update_with_context()
+            manual = refresh_requested.is_set()
+            due = conditions if manual else refresh_schedule.due(conditions)
+            refresh_requested.clear()
+            if not due:
+                update_successful = True
+            else:
+                logger.info(f"Starting background data update for {len(due)} condition(s)...")
+                # A user-triggered refresh goes ahead of background traffic in the rate limiter
+                update_successful = _update_with_context(
+                    due, rate_limiter.INTERACTIVE if manual else rate_limiter.BACKGROUND
+                )
             
             if update_successful:
-                logger.info("Background data update completed successfully")
-                # Play alert sound after successful update
-                play_alert()
-                # Reset the countdown timer
-                countdown_timer = 120  # 2 minutes until next update
+                if due:
+                    logger.info("Background data update completed successfully")
+                    # Play alert sound after successful update
+                    play_alert()
+                # Sleep until the next condition is due (long outside market hours)
+                countdown_timer = get_refresh_interval()
                 
             else:
                 logger.warning("Background data update completed with errors")
                 # Don't reset the countdown timer on error, try again sooner
-                countdown_timer = 30  # Try again in 30 seconds
+                countdown_timer = min(30, get_refresh_interval())  # Try again in 30 seconds
             
-            # Count down the timer every second
-            while countdown_timer > 0 and running:
+            # Count down the timer every second (a manual refresh cuts it short)
+            while countdown_timer > 0 and running and not refresh_requested.is_set():
                 time.sleep(1)
                 countdown_timer -= 1
                 
@@ -680,44 +711,44 @@ def update_data():
             # Wait before retrying on error, but don't get stuck in a tight loop
             time.sleep(min(60, max(5, 60 - countdown_timer)))  # Wait at least 5 seconds
 
-def categorize_stocks():
-    """Categorize stocks into Buy and Sell suggestions, and detect significant score jumps."""
-    global scan_results, previous_scores
-    buy_suggestions = []
-    sell_suggestions = []
-    alert_triggered = False
-
-    for condition, stocks in scan_results.items():
-        for stock in stocks:
-            stock_code = stock["nsecode"]
-            new_score = stock.get("potential_score", 0)
-            stock_price = stock.get("close", 0)  # Get stock price
-
-            # **Exclude stocks with a close price above 2250**
-            if stock_price > 2250:
-                continue  # Skip this stock
-
-            # Check if we have a previous score for this stock
-            old_score = previous_scores.get(stock_code, 0)
-
-            # Detect a significant jump (customize the threshold, e.g., 20% increase)
-            if new_score > old_score * 1.2:  # 20% increase threshold
-                alert_triggered = True  # We will trigger the beep sound
-
-            # Store the new score for the next refresh
-            previous_scores[stock_code] = new_score
-
-            # Categorize as Buy/Sell
-            if stock.get("per_chg", 0) > 0:
-                buy_suggestions.append(stock)
-            else:
-                sell_suggestions.append(stock)
+def snapshot_meta():
+    """Generation number and age in seconds of the scan_results snapshot, plus conditions served stale"""
+    checked_at = scan_store.checked_at
+    age = round(time.time() - checked_at, 1) if checked_at else None
+    return {'generation': scan_store.current.version, 'snapshot_age': age, 'stale': scan_store.stale()}
+
+def add_snapshot_headers(response):
+    """Attach the snapshot generation and age (and any stale conditions) to a response"""
+    meta = snapshot_meta()
+    response.headers['X-Snapshot-Generation'] = str(meta['generation'])
+    response.headers['X-Snapshot-Age'] = '' if meta['snapshot_age'] is None else str(meta['snapshot_age'])
+    if meta['stale']:
+        # name -> seconds since the condition's last good result
+        response.headers['X-Stale-Conditions'] = json.dumps({name: info['age'] for name, info in meta['stale'].items()})
+    return response
+
+def categorize_stocks(snapshot=None):
+    """Buy and Sell suggestions (one row per symbol) from a snapshot's symbol table, the current one by default"""
+    # Top 20 of each side, a symbol listed once however many scans it hit
+    return current_symbol_table(snapshot).suggestions()
+
+def record_score_history():
+    """
+    Append the current snapshot to the score history (once per version) and
+    return the symbols whose score jumped since the previous one.
+    """
+    snapshot = scan_store.current
+    if not score_trail.record(current_symbol_table(snapshot), snapshot.version):
+        return []
+    return score_trail.jumps()
 
-    # Limit to top 10 results
-    buy_suggestions = sorted(buy_suggestions, key=lambda x: x["potential_score"], reverse=True)[:20]
-    sell_suggestions = sorted(sell_suggestions, key=lambda x: x["potential_score"])[:20]
+def current_symbol_table(snapshot=None):
+    """Merged per-symbol view of a snapshot, the current one by default (built once per version)"""
+    return symbol_table.for_snapshot(snapshot or scan_store.current, [condition['name'] for condition in conditions])
 
-    return buy_suggestions, sell_suggestions
+def current_stock_index(snapshot=None):
+    """Sorted per-field indexes over a snapshot's symbol table, the current one by default"""
+    return stock_query.for_snapshot(snapshot or scan_store.current, [condition['name'] for condition in conditions])
 
 @app.route('/get-scan-results')
 def get_scan_results():
@@ -737,9 +768,10 @@ def get_scan_results():
                 logger.warning("No conditions selected")
                 return jsonify({'error': 'No conditions selected'}), 400
             
-            # Get scan results for selected conditions
-            all_results = {}
-            found_stocks = False
+            # Read one snapshot so the whole response comes from the same version
+            snapshot = scan_store.current
+            all_results = []
+            selected_names = []
             
             # Create a mapping of potential name variations
             name_variations = {
@@ -747,11 +779,6 @@ def get_scan_results():
                 "STRONG STOCKS POSITIVE": "STRONG STOCKS POSITIVE"
             }
             
-            # Ensure scan_results is not None
-            if scan_results is None:
-                logger.warning("scan_results is None, attempting to fetch data")
-                fetch_data()
-            
             for condition in selected_conditions:
                 # Skip 'on' which is not a real condition
                 if condition == 'on':
@@ -759,26 +786,34 @@ def get_scan_results():
                 
                 # Check for name variations
                 normalized_condition = name_variations.get(condition, condition)
+                selected_names.append(normalized_condition)
                 
                 # Safely get stocks, default to empty list
-                stocks = scan_results.get(normalized_condition, [])
+                stocks = snapshot.results.get(normalized_condition, ())
                 logger.info(f"Condition: {normalized_condition}, Stocks found: {len(stocks)}")
                 
                 if stocks:
-                    all_results[normalized_condition] = stocks
-                    found_stocks = True
+                    all_results.append(normalized_condition)
             
             # If no stocks found, log a warning
             if not all_results:
                 logger.warning("No stocks found for any selected conditions")
             
-            # Create response with no-cache headers
-            response = make_response(jsonify(all_results))
-            response.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
-            response.headers['Pragma'] = 'no-cache'
-            response.headers['Expires'] = '0'
+            # Clients holding a version get a symbol-level delta (full payload if it expired)
+            since = request.args.get('since', type=int)
+            if since is not None:
+                body = scan_store.delta_json(since, selected=selected_names, snapshot=snapshot)
+                response = app.response_class(body, mimetype='application/json')
+                response.headers['Cache-Control'] = 'no-cache'
+                return add_snapshot_headers(response)
+
+            # Body is assembled from JSON serialized once at publish time;
+            # clients revalidate with If-None-Match and get a 304 when nothing changed
+            response = app.response_class(snapshot.to_json(all_results), mimetype='application/json')
+            response.set_etag(snapshot.etag(all_results))
+            response.headers['Cache-Control'] = 'no-cache'
             
-            return response
+            return add_snapshot_headers(response.make_conditional(request))
             
         except Exception as e:
             logger.error(f"Error in get_scan_results: {e}", exc_info=True)
@@ -812,7 +847,7 @@ def serve_static(filename):
 
 @app.route('/')
 def index():
-    fetch_data()  # Ensure latest data is fetched
+    # Serve the snapshot maintained by the background updater; never scrape inline
     settings = load_settings()
     selected_conditions = settings.get('conditions', [])
 
@@ -827,23 +862,57 @@ def index():
     else:
         flash_message = None
 
-    # Categorize stocks into Buy/Sell
-    buy_suggestions, sell_suggestions = categorize_stocks()
-
-    # Only include selected conditions
-    conditions_with_stocks = [
-        {**condition, "stocks": scan_results.get(condition["name"], [])}
-        for condition in conditions
-        if condition["name"] in selected_conditions
-    ]
+    # Cards and Buy/Sell panels come pre-rendered for this snapshot and selection
+    snapshot = scan_store.current
+    meta = snapshot_meta()
+    fragments = page_fragments.page(
+        snapshot,
+        [condition for condition in conditions if condition["name"] in selected_conditions],
+        meta['stale'],
+        lambda: categorize_stocks(snapshot),
+    )
 
-    return render_template(
+    response = make_response(render_template(
         'index.html',
-        conditions=conditions_with_stocks,
+        fragments=fragments,
         flash_message=flash_message,
-        buy_suggestions=buy_suggestions,
-        sell_suggestions=sell_suggestions
-    )
+        snapshot=meta
+    ))
+    return add_snapshot_headers(response)
+
+@app.route('/stream')
+def stream():
+    """Server-Sent Events: scan deltas, index ticks and alerts pushed by the background updater"""
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+
+    def _resume():
+        # Resume from history when the client's version is still held, otherwise send everything
+        since = int(last_event_id) if last_event_id and last_event_id.isdigit() else None
+        snapshot = scan_store.current
+        if since == snapshot.version:
+            return []
+        return [event_stream.format_event('scan', scan_store.delta_json(since, snapshot=snapshot), snapshot.version)]
+
+    response = app.response_class(scan_events.stream(_resume), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Disable proxy buffering
+    return response
+
+@app.route('/refresh-now', methods=['POST'])
+def refresh_now():
+    """Ask the background updater to refresh immediately (rate-limited)"""
+    global last_manual_refresh
+    with refresh_lock:
+        wait = refresh_min_interval - (time.time() - last_manual_refresh)
+        if wait > 0:
+            response = jsonify({'status': 'rate_limited', 'retry_after': math.ceil(wait), **snapshot_meta()})
+            response.status_code = 429
+            response.headers['Retry-After'] = str(math.ceil(wait))
+            return response
+        last_manual_refresh = time.time()
+    refresh_requested.set()
+    logger.info("Manual refresh requested")
+    return jsonify({'status': 'queued', **snapshot_meta()}), 202
 
 @app.route('/get-settings')
 def get_settings():
@@ -907,117 +976,37 @@ def fetch_nifty_data():
         logger.error(f"Error in nifty-data route: {str(e)}")
         return jsonify({}), 500
 
+def publish_index_tick(feed):
+    """Push each index refresh to /stream clients, but only when someone is listening"""
+    if scan_events.subscriber_count:
+        scan_events.publish('indices', feed.tracked())
+
 def get_nifty_data():
     """
-    Fetch Nifty indices data from NSE's official API
+    Tracked Nifty indices from the shared allIndices feed (a memory read)
     
     Returns:
     dict: A dictionary of Nifty indices with their current values, changes, and percentage changes
     """
-    url = "https://www.nseindia.com/api/allIndices"
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-        "Accept": "application/json",
-        "Accept-Language": "en-US,en;q=0.9",
-        "Referer": "https://www.nseindia.com/"
-    }
-    
-    # Specific indices in the EXACT order you specified
-    tracked_indices = [
-        'NIFTY 50', 
-        'NIFTY 100', 
-        'NIFTY 200', 
-        'NIFTY 500', 
-        'NIFTY ALPHA 50',
-        'NIFTY BANK', 
-        'NIFTY ENERGY', 
-        'NIFTY FMCG', 
-        'NIFTY HIGH BETA 50', 
-        'NIFTY HOUSING', 
-        'NIFTY METAL', 
-        'NIFTY PRIVATE BANK', 
-        'NIFTY PSE', 
-        'NIFTY PSU BANK', 
-        'NIFTY REALTY', 
-        'NIFTY OIL & GAS',
-        'NIFTY PHARMA'
-    ]
-    
-    nifty_data = {}
+    return nse_indices.tracked()
+
+def get_nse_indices():
+    """
+    All NSE indices (except bond and ex-bank series) from the shared allIndices feed
     
-    try:
-        # Create a session to handle cookies and maintain connection
-        session = requests.Session()
-        
-        # First, establish a session by visiting the main NSE website
-        logger.debug("Establishing session with NSE website")
-        pre_response = session.get("https://www.nseindia.com", headers=headers)
-        logger.debug(f"Pre-session response status: {pre_response.status_code}")
-        
-        # Fetch indices data
-        logger.debug(f"Fetching data from URL: {url}")
-        response = session.get(url, headers=headers)
-        
-        # Log full response details for debugging
-        logger.debug(f"Response status code: {response.status_code}")
-        
-        # Check if request was successful
-        if response.status_code == 200:
-            try:
-                data = response.json()
-            except ValueError as json_error:
-                logger.error(f"JSON parsing error: {json_error}")
-                logger.error(f"Response content: {response.text}")
-                return {}
-            
-            # Create a mapping of uppercase index names to their original data
-            index_map = {
-                index_data.get('index', '').upper(): index_data 
-                for index_data in data.get('data', [])
-            }
-            
-            # Extract values for specified indices in the specified order
-            for nse_index in tracked_indices:
-                try:
-                    # Get the index data from the map
-                    index_data = index_map.get(nse_index)
-                    if not index_data:
-                        continue
-                    
-                    # Prepend 'Nifty' to the display name
-                    display_name = f"Nifty {index_data['index'].replace('NIFTY ', '')}"
-                    
-                    # Calculate change as Last Price - Open Price
-                    last_price = float(index_data.get('last', 0))
-                    open_price = float(index_data.get('open', 0))
-                    change = last_price - open_price
-                    
-                    # Calculate percentage change
-                    pct_change = (change / open_price * 100) if open_price != 0 else 0
-                    
-                    nifty_data[display_name] = {
-                        "change": f"{change:+.2f}",
-                        "last": f"{last_price:,.2f}",
-                        "open": f"{open_price:,.2f}",
-                        "pChange": f"{pct_change:+.2f}"
-                    }
-                except Exception as parse_error:
-                    logger.error(f"Error parsing index data for {nse_index}: {parse_error}")
-            
-            logger.info(f"Fetched Nifty data: {nifty_data}")
-            return nifty_data
-        
-        else:
-            logger.error(f"Failed to fetch indices. Status code: {response.status_code}")
-            logger.error(f"Response content: {response.text}")
-            return {}
+    Returns:
+    dict: A dictionary of indices with their current values, changes, and percentage changes
+    """
+    return nse_indices.full()
+
+def get_nse_index_values():
+    """
+    NSE index last prices as numbers from the shared allIndices feed
     
-    except requests.exceptions.RequestException as req_error:
-        logger.error(f"Network error fetching NSE indices: {req_error}")
-        return {}
-    except Exception as e:
-        logger.error(f"Unexpected error fetching NSE indices: {str(e)}")
-        return {}
+    Returns:
+    dict: A dictionary of indices with their current values
+    """
+    return nse_indices.numeric()
 
 @app.route('/get_nifty_data')
 def fetch_get_nifty_data():
@@ -1101,6 +1090,7 @@ def start_background_thread():
         update_thread = threading.Thread(target=update_data)
         update_thread.daemon = True
         update_thread.start()
+        nse_indices.start()
         thread_started = True
         logger.info("Background thread started")
 
@@ -1117,6 +1107,7 @@ def cleanup():
         # Signal threads to stop
         running = False
         beep_running = False
+        nse_indices.stop()
         
         # Give threads a moment to notice the stop signal
         time.sleep(0.5)
@@ -1139,89 +1130,11 @@ def cleanup():
         running = False
         beep_running = False
 
-def get_nse_indices():
-    """
-    Fetch NSE indices values directly from NSE's official API
-    
-    Returns:
-    dict: A dictionary of indices with their current values
-    """
-    url = "https://www.nseindia.com/api/allIndices"
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-        "Accept": "application/json",
-        "Accept-Language": "en-US,en;q=0.9",
-        "Referer": "https://www.nseindia.com/"
-    }
-    
-    indices_data = {}
-    
-    try:
-        # Create a session to handle cookies and maintain connection
-        session = requests.Session()
-        
-        # First, establish a session by visiting the main NSE website
-        logger.debug("Establishing session with NSE website")
-        pre_response = session.get("https://www.nseindia.com", headers=headers)
-        logger.debug(f"Pre-session response status: {pre_response.status_code}")
-        
-        # Fetch indices data
-        logger.debug(f"Fetching data from URL: {url}")
-        response = session.get(url, headers=headers)
-        
-        # Log full response details for debugging
-        logger.debug(f"Response status code: {response.status_code}")
-        
-        # Check if request was successful
-        if response.status_code == 200:
-            try:
-                data = response.json()
-            except ValueError as json_error:
-                logger.error(f"JSON parsing error: {json_error}")
-                logger.error(f"Response content: {response.text}")
-                return {}
-            
-            # Create a mapping of uppercase index names to their original data
-            index_map = {
-                index_data.get('index', '').upper(): index_data 
-                for index_data in data.get('data', [])
-            }
-            
-            # Extract values for ALL indices
-            for index_data in data.get('data', []):
-                try:
-                    # Skip indices containing BOND INDEX or EX-BANK
-                    if any(forbidden in index_data.get('index', '').upper() for forbidden in ['BOND INDEX', 'EX-BANK','G-SEC','TOTAL MARKET', 'MOMENTUM QUALITY 100','TOTAL MARKET',' G-SEC','VOLATILITY']):
-                        logger.info(f"Skipping index: {index_data.get('index', 'N/A')}")
-                        continue
-                    
-                    # Prepend 'Nifty' to the display name
-                    display_name = f"Nifty {index_data['index'].replace('NIFTY ', '')}"
-                    
-                    indices_data[display_name] = float(index_data['last'])
-                except Exception as parse_error:
-                    logger.error(f"Error parsing index data: {parse_error}")
-            
-            logger.info(f"Fetched indices data: {indices_data}")
-            return indices_data
-        
-        else:
-            logger.error(f"Failed to fetch indices. Status code: {response.status_code}")
-            logger.error(f"Response content: {response.text}")
-            return {}
-    
-    except requests.exceptions.RequestException as req_error:
-        logger.error(f"Network error fetching NSE indices: {req_error}")
-        return {}
-    except Exception as e:
-        logger.error(f"Unexpected error fetching NSE indices: {str(e)}")
-        return {}
-
 @app.route('/get-nse-indices')
 def fetch_nse_indices():
-    """API endpoint to get NSE indices"""
+    """API endpoint to get NSE indices (``?view=numeric`` for plain last prices)"""
     try:
-        indices = get_nse_indices()
+        indices = get_nse_index_values() if request.args.get('view') == 'numeric' else get_nse_indices()
         return app.response_class(
             response=json.dumps(indices, indent=4),
             status=200,
@@ -1235,89 +1148,90 @@ def fetch_nse_indices():
             mimetype='application/json'
         )
 
-def get_nse_indices():
+@app.route('/filter_stocks', methods=['POST'])
+def filter_stocks():
+    score_threshold = float(request.json.get('score', 0))  # Convert to float
+    started = time.time()
+    # One row per symbol, best score first, answered from the snapshot's sorted indexes
+    result = current_stock_index().query([('potential_score', '>', score_threshold)], limit=stock_query.MAX_LIMIT)
+    logger.info(f"Filter score > {score_threshold}: {result['total']} stocks in {(time.time() - started) * 1000:.1f}ms")
+    return jsonify(result['stocks'])
+
+@app.route('/fetch-stats')
+def fetch_stats():
+    """Latency report for the most recent fetch cycle"""
+    if last_fetch_report is None:
+        return jsonify({'error': 'No fetch cycle has completed yet'}), 404
+    return jsonify({**last_fetch_report.as_dict(), 'csrf': csrf_tokens.stats(), 'http': http_client.stats(),
+                    'volumes': volume_lookup.stats(), 'stale': scan_store.stale(), 'indices': nse_indices.stats(),
+                    'symbols': current_symbol_table().stats()})
+
+@app.route('/volumes')
+def get_volumes():
+    """Daily volume for ?symbols=A,B,C on ?date=YYYY-MM-DD (default today)"""
+    symbols = [symbol.strip().upper() for symbol in request.args.get('symbols', '').split(',') if symbol.strip()]
+    if not symbols:
+        return jsonify({'error': 'symbols is required'}), 400
+    try:
+        day = datetime.strptime(request.args['date'], '%Y-%m-%d').date() if request.args.get('date') else None
+    except ValueError:
+        return jsonify({'error': 'date must be YYYY-MM-DD'}), 400
+    started = time.time()
+    found = volume_lookup.resolve(symbols, day)
+    logger.info(f"Resolved {len(found)}/{len(symbols)} volumes in {time.time() - started:.2f}s")
+    return jsonify({'volumes': found, 'missing': [symbol for symbol in symbols if symbol not in found]})
+
+@app.route('/rate-limits')
+def rate_limits():
+    """Remaining request budget, queue depth and throttling per upstream host"""
+    return jsonify(http_client.rate_limits())
+
+@app.route('/schedule')
+def schedule_status():
+    """Market phase, per-condition cadence and last refresh times"""
+    return jsonify(refresh_schedule.status(conditions))
+
+@app.route('/score-signals')
+def score_signals():
+    """Per-symbol score rates of change over 1/3/5 snapshots with jump and acceleration flags"""
+    symbol = request.args.get('symbol', '').strip().upper()
+    if symbol:
+        return jsonify({'symbol': symbol, 'series': score_trail.series(symbol)})
+    return jsonify({'signals': score_trail.signals(), 'history': score_trail.stats()})
+
+@app.route('/query')
+def query_stocks():
     """
-    Fetch NSE indices values from NSE's official API
-    
-    Returns:
-    dict: A dictionary of indices with their current values, changes, and percentage changes
+    Filter the merged symbols with ?where=potential_score>100,close<=2000,
+    ordered by ?sort=<field> (?order=asc|desc) and paginated with ?offset= and
+    ?limit=; ?conditions=A,B keeps symbols matching any of those scans.
     """
-    url = "https://www.nseindia.com/api/allIndices"
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-        "Accept": "application/json",
-        "Accept-Language": "en-US,en;q=0.9",
-        "Referer": "https://www.nseindia.com/"
-    }
-    
-    indices_data = {}
-    
     try:
-        # Create a session to handle cookies and maintain connection
-        session = requests.Session()
-        
-        # First, establish a session by visiting the main NSE website
-        logger.debug("Establishing session with NSE website")
-        pre_response = session.get("https://www.nseindia.com", headers=headers)
-        logger.debug(f"Pre-session response status: {pre_response.status_code}")
-        
-        # Fetch indices data
-        logger.debug(f"Fetching data from URL: {url}")
-        response = session.get(url, headers=headers)
-        
-        # Log full response details for debugging
-        logger.debug(f"Response status code: {response.status_code}")
-        
-        # Check if request was successful
-        if response.status_code == 200:
-            try:
-                data = response.json()
-            except ValueError as json_error:
-                logger.error(f"JSON parsing error: {json_error}")
-                logger.error(f"Response content: {response.text}")
-                return {}
-            
-            # Extract values for ALL indices
-            for index_data in data.get('data', []):
-                try:
-                    # Skip indices containing BOND INDEX or EX-BANK
-                    if any(forbidden in index_data.get('index', '').upper() for forbidden in ['BOND INDEX', 'EX-BANK']):
-                        logger.info(f"Skipping index: {index_data.get('index', 'N/A')}")
-                        continue
-                    
-                    # Prepend 'Nifty' to the display name
-                    display_name = f"Nifty {index_data['index'].replace('NIFTY ', '')}"
-                    
-                    indices_data[display_name] = {
-                        "last": f"{index_data['last']:,.2f}",
-                        "change": f"{index_data['change']:+.2f}",
-                        "pChange": f"{index_data['percentChange']:+.2f}"
-                    }
-                except Exception as parse_error:
-                    logger.error(f"Error parsing index data: {parse_error}")
-            
-            logger.info(f"Fetched indices data: {indices_data}")
-            return indices_data
-        
-        else:
-            logger.error(f"Failed to fetch indices. Status code: {response.status_code}")
-            logger.error(f"Response content: {response.text}")
-            return {}
-    
-    except requests.exceptions.RequestException as req_error:
-        logger.error(f"Network error fetching NSE indices: {req_error}")
-        return {}
-    except Exception as e:
-        logger.error(f"Unexpected error fetching NSE indices: {str(e)}")
-        return {}
+        predicates = stock_query.parse_where(request.args.get('where'))
+        names = [name.strip() for name in request.args.get('conditions', '').split(',') if name.strip()]
+        result = current_stock_index().query(
+            predicates,
+            sort=request.args.get('sort', stock_query.DEFAULT_SORT),
+            descending=request.args.get('order', 'desc').lower() != 'asc',
+            offset=int(request.args.get('offset', 0)),
+            limit=int(request.args.get('limit', stock_query.DEFAULT_LIMIT)),
+            conditions=names or None,
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return add_snapshot_headers(jsonify({**result, **snapshot_meta()}))
 
-@app.route('/filter_stocks', methods=['POST'])
-def filter_stocks():
-    score_threshold = float(request.json.get('score', 0))  # Convert to float
-    filtered_stocks = [stock for stocks in scan_results.values() for stock in stocks if stock['potential_score'] > score_threshold]
-    logger.info(f"Filter button clicked")
-    logger.info(f"Filtered stocks: {filtered_stocks}")
-    return jsonify(filtered_stocks)
+@app.route('/confluence')
+def confluence():
+    """Symbols hitting ?min=N or more scans (default 2), ranked by scan count then best score"""
+    try:
+        min_count = int(request.args.get('min', symbol_table.MIN_CONFLUENCE))
+        limit = int(request.args['limit']) if request.args.get('limit') else None
+    except ValueError:
+        return jsonify({'error': 'min and limit must be integers'}), 400
+    table = current_symbol_table()
+    response = jsonify({'min': min_count, 'stocks': table.confluent(min_count, limit=limit), **snapshot_meta()})
+    return add_snapshot_headers(response)
 
 @app.route('/get-refresh-interval')
 def refresh_interval():
@@ -1394,6 +1308,7 @@ if __name__ == '__main__':
             beep_thread = threading.Thread(target=beep_worker, daemon=True)
             update_thread.start()
             beep_thread.start()
+            nse_indices.start()
             threads_started = True
 
     # Patch the main route to start threads on first request
@@ -8,16 +8,28 @@ import re
 import threading
 import time
 
-from bs4 import BeautifulSoup as bs
-import pandas as pd
 import pygame
 import requests
 from flask import Flask, render_template, jsonify, make_response, send_from_directory, request, flash
-from flask_caching import Cache
 from flask_wtf import FlaskForm
 from wtforms import StringField, PasswordField, SubmitField
 from wtforms.validators import DataRequired, Email, EqualTo
 
+import csrf_token
+import dashboard_fragments
+import event_stream
+import fetch_engine
+import http_client
+import index_feed
+import market_schedule
+import rate_limiter
+import ranking
+import score_history
+import snapshot_store
+import stock_query
+import symbol_table
+import ttl_cache
+
 # Set logging level to INFO to reduce verbosity
 logging.basicConfig(level=logging.INFO)
 logging.getLogger("urllib3").setLevel(logging.WARNING)  # Suppress urllib3 debug logs
@@ -56,63 +68,11 @@ def play_alert():
         logger.error(f"Error playing alert sound: {e}")
 app = Flask(__name__, static_url_path='/static', static_folder='static')
 
-
-cache = Cache(app)
 pygame.mixer.init()  # Initialize Pygame mixer
 play_alert()  # Play sound when the application is loading
 
-# Add formatNumber as a Jinja2 filter
-@app.template_filter('formatNumber')
-def format_number(num):
-    if num is None:
-        return ''
-    
-    # Handle potential score - round to nearest integer
-    if num > 1000:  # Potential scores are typically large numbers
-        return str(round(num))
-    
-    # For percentages and small numbers, keep 2 decimal places
-    if isinstance(num, (int, float)):
-        return f"{num:.2f}" if num < 100 else str(round(num))
-    
-    return str(num)
-
-# Add format_number as a Jinja2 filter
-def format_number(value, column_type='default'):
-    if value is None:
-        return '-'
-    
-    try:
-        num = float(value)
-        # print(f"Column: {column_type}, Raw Value: {num}")  # Debugging
-        
-        # Format Close with two decimal places
-        if column_type == 'close':
-            formatted_value = f"{num:.2f}"
-            # print(f"Formatted Close: {formatted_value}")  # Debugging
-            return formatted_value  
-
-        # Format Change % with two decimal places and add percentage sign
-        if column_type == 'change_percent':
-            formatted_value = f"{num:.2f}%"  # Ensure two decimal places
-            # print(f"Formatted Change %: {formatted_value}")  # Debugging
-            return formatted_value  
-
-        # Format Volume as an integer
-        # Format Volume as an integer
-        if column_type == 'volume':
-            return str(round(num))  # Round to nearest integer and return as string
-        
-        # Format Score as an integer
-        if column_type == 'score':
-            return str(round(num))  # Round to nearest integer and return as string  # Convert to integer and return as string
-         
-        return f"{num:.2f}"  # Default case to format to two decimal places
-    except (ValueError, TypeError):
-        return str(value)
-
-# Register the filter
-app.jinja_env.filters['format_number'] = format_number
+# One number formatter for templates; the dashboard fragments use its vectorized twin
+app.jinja_env.filters['format_number'] = dashboard_fragments.format_number
 
 # Integrate backend support for Jinja Quick UI Kit components
 from flask_wtf import FlaskForm
@@ -172,8 +132,19 @@ last_update_time = None
 update_thread = None
 running = True
 thread_started = False
-scan_results = {}
-previous_scores = {}  # Initialize previous_scores here
+scan_store = snapshot_store.SnapshotStore()  # Versioned, immutable scan result snapshots
+scan_results = scan_store.current.results  # Read-only view of the current snapshot
+scan_events = event_stream.EventBroadcaster()  # Pushes scan deltas, index ticks and alerts to /stream clients
+score_trail = score_history.ScoreHistory()  # Bounded per-symbol score history, fed once per snapshot
+page_fragments = dashboard_fragments.DashboardFragments()  # Rendered cards and panels per snapshot
+csrf_tokens = csrf_token.CsrfTokenManager()  # Chartink CSRF token shared across conditions
+refresh_requested = threading.Event()  # Set by /refresh-now to wake the updater early
+refresh_min_interval = 30  # Minimum seconds between manual refreshes
+last_manual_refresh = 0
+refresh_lock = threading.Lock()
+nse_indices = index_feed.IndexFeed(on_update=lambda feed: publish_index_tick(feed))  # One allIndices download feeds every index endpoint
+scan_cache = ttl_cache.TTLCache('scans', maxsize=64, default_ttl=15)  # Chartink results per condition; overlapping refreshes share one request
+refresh_schedule = market_schedule.RefreshScheduler()  # Per-timeframe refresh cadence that follows the NSE session
 
 # Global variable to track mute status
 is_muted = False
@@ -216,9 +187,14 @@ is_muted = settings.get('mute_status', False)  # Default to False if not set
 
 @app.route('/clear_cache')
 def clear_cache():
-    cache.clear()
+    ttl_cache.clear_all()
     return "Cache cleared!"
 
+@app.route('/debug/cache')
+def debug_cache():
+    """Hit/miss/eviction metrics for every upstream cache"""
+    return jsonify(ttl_cache.stats())
+
 @app.route('/update-mute-status', methods=['POST'])
 def update_mute_status():
     global is_muted
@@ -237,29 +213,16 @@ def update_mute_status():
 
 def fetch_and_process_data(session, condition):
     """Fetch and process stock data using the provided session"""
-    url = "https://chartink.com/screener/process"
     # logger.info(f"Fetching data for condition: {condition['name']}")
     
     try:
-        # Get CSRF token
-        # logger.info("Fetching CSRF token...")
-        r_data = session.get(url)
-        r_data.raise_for_status()
-        soup = bs(r_data.content, "lxml")
-        meta = soup.find("meta", {"name": "csrf-token"})
-        if not meta:
-            logger.error("Could not find CSRF token")
-            return {"error": "Could not find CSRF token"}
-        
-        header = {"x-csrf-token": meta["content"]}
-        # logger.info("CSRF token obtained successfully")
-
+        # The CSRF token is cached per session and shared by every condition
         try:
             # logger.info(f"Request URL: {url}")
             # logger.info(f"Request Headers: {header}")
             # logger.info(f"Request Data: {{'scan_clause': {condition['scan_clause']}}}")
             
-            response = session.post(url, headers=header, data={"scan_clause": condition["scan_clause"]})
+            response = csrf_tokens.post(session, {"scan_clause": condition["scan_clause"]})
             response.raise_for_status()
             
             data = response.json()
@@ -274,31 +237,10 @@ def fetch_and_process_data(session, condition):
             
             if 'data' not in data:
                 logger.error(f"Invalid response format for {condition['name']}: {data}")
-                return []
+                return {"error": "Invalid response format"}
             
-            stock_list = pd.DataFrame(data["data"])
-
-            if not stock_list.empty:
-                stock_list["per_chg"] = pd.to_numeric(stock_list["per_chg"])
-                stock_list["potential_score"] = stock_list["per_chg"] * stock_list["close"]
-                
-                if condition["name"] == "STRONG":
-                    sorted_stock_list = stock_list.sort_values(by="potential_score", ascending=False).head(10)
-                    
-                elif condition["name"] == "HARSH SELL STOCKS":
-                    sorted_stock_list = stock_list.sort_values(by="potential_score", ascending=True)  # Sort by potential_score ascending
-                
-                elif condition["name"] == "STRONG STOCKS NEGATIVE":
-                    sorted_stock_list = stock_list.sort_values(by="potential_score", ascending=True)  # Sort by potential_score ascending
-                
-                else:
-                    sorted_stock_list = stock_list.sort_values(by="potential_score", ascending=False)
-                
-                # Convert DataFrame to dict for JSON serialization
-                return sorted_stock_list.head(10).to_dict('records')
-            else:
-                # logger.info(f"No stocks found for {condition['name']}")
-                return []
+            # Top 10 by potential_score (lowest first for the bearish scans)
+            return ranking.rank(data["data"], condition["name"])
         
         except Exception as e:
             logger.error(f"Error processing {condition['name']}: {str(e)}")
@@ -308,20 +250,26 @@ def fetch_and_process_data(session, condition):
         logger.error(f"Error in fetch_and_process_data: {str(e)}")
         return {"error": str(e)}
 
-def fetch_data():
+def fetch_data(selected_conditions=None, priority=rate_limiter.BACKGROUND):
     """
     Fetch stock data from various sources and process them.
     Play alert sound after auto-refresh.
+
+    Args:
+        selected_conditions: names of the conditions to refresh (default: all);
+            the others keep their current results
+        priority: rate-limiter class for the Chartink requests (INTERACTIVE
+            for user-triggered refreshes)
     """
     global last_alert_time, scan_results
-    
+
     # Ensure we're in an application context
     if not 'current_app' in globals() or current_app is None:
         with app.app_context():
-            return _fetch_data_impl()
-    return _fetch_data_impl()
+            return _fetch_data_impl(selected_conditions, priority)
+    return _fetch_data_impl(selected_conditions, priority)
 
-def _fetch_data_impl(selected_conditions=None):
+def _fetch_data_impl(selected_conditions=None, priority=rate_limiter.BACKGROUND):
     """Implementation of fetch_data that assumes app context exists"""
     global last_alert_time, scan_results
     try:
@@ -329,16 +277,64 @@ def _fetch_data_impl(selected_conditions=None):
         # If called from background, pass selected_conditions (default to all if None)
         if selected_conditions is None:
             selected_conditions = [cond['name'] for cond in conditions]
+
+        # Refresh the snapshot from Chartink, then publish it in one assignment
+        session = http_client.chartink()
+
+        def _fetch_one(condition):
+            # Runs on a fetch_engine worker, so the priority is set per thread
+            with rate_limiter.priority(priority):
+                return scan_cache.get_or_load(
+                    (condition['name'], condition['scan_clause']),
+                    lambda: fetch_and_process_data(session, condition),
+                    cacheable=lambda stocks: isinstance(stocks, list),
+                )
+
+        results, report = fetch_engine.fetch_conditions(
+            [cond for cond in conditions if cond['name'] in selected_conditions],
+            _fetch_one,
+        )
+        logger.info(f"Fetch cycle complete: {report.summary()}")
+        failed = {name: stocks.get('error', 'fetch failed') for name, stocks in results.items() if not isinstance(stocks, list)}
+        failed.update({name: 'timed out' for name in report.timed_out})
+        succeeded = {name for name in results if name not in failed}
+        scan_store.mark_fresh(succeeded)
+        for name, error in failed.items():
+            scan_store.mark_stale(name, error)
+        # Failures are retried sooner than the normal cadence, but not before Chartink's circuit allows it
+        refresh_schedule.mark_refreshed(succeeded)
+        refresh_schedule.mark_failed(failed, delay=max(market_schedule.RETRY_INTERVAL, session.breaker.retry_after()))
+
+        # Conditions outside this refresh, and failed ones, keep serving their last good result
+        previous = scan_store.current
+        merged = {
+            name: stocks for name, stocks in previous.results.items()
+            if name not in succeeded
+        }
+        merged.update({name: stocks for name, stocks in results.items() if stocks and isinstance(stocks, list)})
+        snapshot = scan_store.publish(
+            {cond['name']: merged[cond['name']] for cond in conditions if cond['name'] in merged}
+        )
+        if snapshot is not previous:
+            scan_events.publish('scan', scan_store.delta_json(previous.version, snapshot=snapshot), event_id=snapshot.version)
+        scan_results = snapshot.results
+        # Score history advances once per refresh cycle, not per page render
+        jumps = record_score_history()
+
         current_results = get_scan_results_internal(selected_conditions)
         if current_results:
             # Play alert sound if not muted and not on cooldown
             current_time = time.time()
             if not is_muted and (current_time - last_alert_time) > 300:  # 5 minutes cooldown
                 play_alert()
+                scan_events.publish('alert', {'version': scan_store.current.version, 'time': current_time, 'jumps': jumps})
                 last_alert_time = current_time
         return current_results
     except Exception as e:
         logger.error(f"Error in fetch_data: {e}")
+        for name in selected_conditions or [cond['name'] for cond in conditions]:
+            scan_store.mark_stale(name, str(e))
+        refresh_schedule.mark_failed(selected_conditions or [cond['name'] for cond in conditions])
         return None
 
 def filter_stocks(stocks, condition):
@@ -346,66 +342,80 @@ def filter_stocks(stocks, condition):
     # For now, we'll just return all stocks
     return stocks
 
+def get_refresh_interval():
+    """Seconds until the scheduler expects the next condition to be due"""
+    return math.ceil(refresh_schedule.next_wake(conditions))
+
 def update_data():
-    """Background thread function to update stock data every 2 minutes"""
+    """Background thread function to refresh conditions as the market schedule makes them due"""
     while True:
+        # A manual refresh fetches everything; otherwise only what is due
+        manual = refresh_requested.is_set()
+        due = conditions if manual else refresh_schedule.due(conditions)
+        refresh_requested.clear()
+        if not due:
+            refresh_requested.wait(get_refresh_interval())
+            continue
+        due = [cond['name'] for cond in due]
+        # A user-triggered refresh goes ahead of background traffic in the rate limiter
+        priority = rate_limiter.INTERACTIVE if manual else rate_limiter.BACKGROUND
         try:
-            logger.info("Starting background data update...")
+            logger.info(f"Starting background data update for {len(due)} condition(s)...")
             # Create application context
             with app.app_context():
                 try:
-                    fetch_data()
+                    fetch_data(due, priority)
                     logger.info("Background data update completed")
                 except Exception as e:
                     logger.error(f"Error in fetch_data: {e}")
                     # If there's an error, try to reinitialize the app context
                     try:
                         app.app_context().push()
-                        fetch_data()
+                        fetch_data(due, priority)
                     except Exception as e2:
                         logger.error(f"Retry failed in update_data: {e2}")
         except Exception as e:
             logger.error(f"Error in update_data: {e}")
-        time.sleep(120)  # Wait for 2 minutes before next update
-
-def categorize_stocks():
-    """Categorize stocks into Buy and Sell suggestions, and detect significant score jumps."""
-    global scan_results, previous_scores
-    buy_suggestions = []
-    sell_suggestions = []
-    alert_triggered = False
-
-    for condition, stocks in scan_results.items():
-        for stock in stocks:
-            stock_code = stock["nsecode"]
-            new_score = stock.get("potential_score", 0)
-            stock_price = stock.get("close", 0)  # Get stock price
-
-            # **Exclude stocks with a close price above 2250**
-            if stock_price > 2250:
-                continue  # Skip this stock
-
-            # Check if we have a previous score for this stock
-            old_score = previous_scores.get(stock_code, 0)
-
-            # Detect a significant jump (customize the threshold, e.g., 20% increase)
-            if new_score > old_score * 1.2:  # 20% increase threshold
-                alert_triggered = True  # We will trigger the beep sound
+        refresh_requested.wait(get_refresh_interval())  # Sleep until the next condition is due (or a manual refresh)
+
+def snapshot_meta():
+    """Generation number and age in seconds of the scan_results snapshot, plus conditions served stale"""
+    checked_at = scan_store.checked_at
+    age = round(time.time() - checked_at, 1) if checked_at else None
+    return {'generation': scan_store.current.version, 'snapshot_age': age, 'stale': scan_store.stale()}
+
+def add_snapshot_headers(response):
+    """Attach the snapshot generation and age (and any stale conditions) to a response"""
+    meta = snapshot_meta()
+    response.headers['X-Snapshot-Generation'] = str(meta['generation'])
+    response.headers['X-Snapshot-Age'] = '' if meta['snapshot_age'] is None else str(meta['snapshot_age'])
+    if meta['stale']:
+        # name -> seconds since the condition's last good result
+        response.headers['X-Stale-Conditions'] = json.dumps({name: info['age'] for name, info in meta['stale'].items()})
+    return response
 
-            # Store the new score for the next refresh
-            previous_scores[stock_code] = new_score
+def categorize_stocks(snapshot=None):
+    """Buy and Sell suggestions (one row per symbol) from a snapshot's symbol table, the current one by default"""
+    # Top 20 of each side, a symbol listed once however many scans it hit
+    return current_symbol_table(snapshot).suggestions()
 
-            # Categorize as Buy/Sell
-            if stock.get("per_chg", 0) > 0:
-                buy_suggestions.append(stock)
-            else:
-                sell_suggestions.append(stock)
+def record_score_history():
+    """
+    Append the current snapshot to the score history (once per version) and
+    return the symbols whose score jumped since the previous one.
+    """
+    snapshot = scan_store.current
+    if not score_trail.record(current_symbol_table(snapshot), snapshot.version):
+        return []
+    return score_trail.jumps()
 
-    # Limit to top 10 results
-    buy_suggestions = sorted(buy_suggestions, key=lambda x: x["potential_score"], reverse=True)[:20]
-    sell_suggestions = sorted(sell_suggestions, key=lambda x: x["potential_score"])[:20]
+def current_symbol_table(snapshot=None):
+    """Merged per-symbol view of a snapshot, the current one by default (built once per version)"""
+    return symbol_table.for_snapshot(snapshot or scan_store.current, [condition['name'] for condition in conditions])
 
-    return buy_suggestions, sell_suggestions
+def current_stock_index(snapshot=None):
+    """Sorted per-field indexes over a snapshot's symbol table, the current one by default"""
+    return stock_query.for_snapshot(snapshot or scan_store.current, [condition['name'] for condition in conditions])
 
 
 import pygame
@@ -449,30 +459,38 @@ def get_scan_results():
     if not selected_conditions:
         logger.warning("No conditions selected")
         return jsonify({'error': 'No conditions selected'}), 400
-    result = get_scan_results_internal(selected_conditions)
-    response = make_response(jsonify(result))
-    response.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
-    response.headers['Pragma'] = 'no-cache'
-    response.headers['Expires'] = '0'
-    return response
-
-def get_scan_results_internal(selected_conditions):
-    global scan_results
+    # Read one snapshot so the whole response comes from the same version
+    snapshot = scan_store.current
+    result = get_scan_results_internal(selected_conditions, snapshot.results)
+    if 'error' in result:
+        return jsonify(result), 500
+    names = list(result)
+    # Clients holding a version get a symbol-level delta (full payload if it expired)
+    since = request.args.get('since', type=int)
+    if since is not None:
+        selected_names = [name_variations.get(condition, condition) for condition in selected_conditions if condition != 'on']
+        body = scan_store.delta_json(since, selected=selected_names, snapshot=snapshot)
+        response = app.response_class(body, mimetype='application/json')
+        response.headers['Cache-Control'] = 'no-cache'
+        return add_snapshot_headers(response)
+    # Body is assembled from JSON serialized once at publish time;
+    # clients revalidate with If-None-Match and get a 304 when nothing changed
+    response = app.response_class(snapshot.to_json(names), mimetype='application/json')
+    response.set_etag(snapshot.etag(names))
+    response.headers['Cache-Control'] = 'no-cache'
+    return add_snapshot_headers(response.make_conditional(request))
+
+def get_scan_results_internal(selected_conditions, results=None):
+    if results is None:
+        results = scan_results
     try:
         logger.info(f"Selected conditions: {selected_conditions}")
         all_results = {}
-        name_variations = {
-            "STRONG STOCKS": "STRONG STOCKS POSITIVE",
-            "STRONG STOCKS POSITIVE": "STRONG STOCKS POSITIVE"
-        }
-        if scan_results is None:
-            logger.warning("scan_results is None, attempting to fetch data")
-            fetch_data()
         for condition in selected_conditions:
             if condition == 'on':
                 continue
             normalized_condition = name_variations.get(condition, condition)
-            stocks = scan_results.get(normalized_condition, [])
+            stocks = results.get(normalized_condition, [])
             logger.info(f"Condition: {normalized_condition}, Stocks found: {len(stocks)}")
             if stocks:
                 all_results[normalized_condition] = stocks
@@ -485,6 +503,12 @@ def get_scan_results_internal(selected_conditions):
 
 DB_FILE = 'db.json'
 
+# Alternate names the frontend may send for a condition
+name_variations = {
+    "STRONG STOCKS": "STRONG STOCKS POSITIVE",
+    "STRONG STOCKS POSITIVE": "STRONG STOCKS POSITIVE"
+}
+
 def get_default_settings():
     """Get default settings structure"""
     return {
@@ -505,7 +529,7 @@ def serve_static(filename):
 
 @app.route('/')
 def index():
-    fetch_data()  # Ensure latest data is fetched
+    # Serve the snapshot maintained by the background updater; never scrape inline
     settings = load_settings()
     selected_conditions = settings.get('conditions', [])
 
@@ -520,23 +544,57 @@ def index():
     else:
         flash_message = None
 
-    # Categorize stocks into Buy/Sell
-    buy_suggestions, sell_suggestions = categorize_stocks()
-
-    # Only include selected conditions
-    conditions_with_stocks = [
-        {**condition, "stocks": scan_results.get(condition["name"], [])}
-        for condition in conditions
-        if condition["name"] in selected_conditions
-    ]
+    # Cards and Buy/Sell panels come pre-rendered for this snapshot and selection
+    snapshot = scan_store.current
+    meta = snapshot_meta()
+    fragments = page_fragments.page(
+        snapshot,
+        [condition for condition in conditions if condition["name"] in selected_conditions],
+        meta['stale'],
+        lambda: categorize_stocks(snapshot),
+    )
 
-    return render_template(
+    response = make_response(render_template(
         'index.html',
-        conditions=conditions_with_stocks,
+        fragments=fragments,
         flash_message=flash_message,
-        buy_suggestions=buy_suggestions,
-        sell_suggestions=sell_suggestions
-    )
+        snapshot=meta
+    ))
+    return add_snapshot_headers(response)
+
+@app.route('/stream')
+def stream():
+    """Server-Sent Events: scan deltas, index ticks and alerts pushed by the background updater"""
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+
+    def _resume():
+        # Resume from history when the client's version is still held, otherwise send everything
+        since = int(last_event_id) if last_event_id and last_event_id.isdigit() else None
+        snapshot = scan_store.current
+        if since == snapshot.version:
+            return []
+        return [event_stream.format_event('scan', scan_store.delta_json(since, snapshot=snapshot), snapshot.version)]
+
+    response = app.response_class(scan_events.stream(_resume), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Disable proxy buffering
+    return response
+
+@app.route('/refresh-now', methods=['POST'])
+def refresh_now():
+    """Ask the background updater to refresh immediately (rate-limited)"""
+    global last_manual_refresh
+    with refresh_lock:
+        wait = refresh_min_interval - (time.time() - last_manual_refresh)
+        if wait > 0:
+            response = jsonify({'status': 'rate_limited', 'retry_after': math.ceil(wait), **snapshot_meta()})
+            response.status_code = 429
+            response.headers['Retry-After'] = str(math.ceil(wait))
+            return response
+        last_manual_refresh = time.time()
+    refresh_requested.set()
+    logger.info("Manual refresh requested")
+    return jsonify({'status': 'queued', **snapshot_meta()}), 202
 
 @app.route('/get-settings')
 def get_settings():
@@ -603,117 +661,37 @@ def fetch_nifty_data():
         logger.error(f"Error in nifty-data route: {str(e)}")
         return jsonify({}), 500
 
+def publish_index_tick(feed):
+    """Push each index refresh to /stream clients, but only when someone is listening"""
+    if scan_events.subscriber_count:
+        scan_events.publish('indices', feed.tracked())
+
 def get_nifty_data():
     """
-    Fetch Nifty indices data from NSE's official API
+    Tracked Nifty indices from the shared allIndices feed (a memory read)
     
     Returns:
     dict: A dictionary of Nifty indices with their current values, changes, and percentage changes
     """
-    url = "https://www.nseindia.com/api/allIndices"
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-        "Accept": "application/json",
-        "Accept-Language": "en-US,en;q=0.9",
-        "Referer": "https://www.nseindia.com/"
-    }
-    
-    # Specific indices in the EXACT order you specified
-    tracked_indices = [
-        'NIFTY 50', 
-        'NIFTY 100', 
-        'NIFTY 200', 
-        'NIFTY 500', 
-        'NIFTY ALPHA 50',
-        'NIFTY BANK', 
-        'NIFTY ENERGY', 
-        'NIFTY FMCG', 
-        'NIFTY HIGH BETA 50', 
-        'NIFTY HOUSING', 
-        'NIFTY METAL', 
-        'NIFTY PRIVATE BANK', 
-        'NIFTY PSE', 
-        'NIFTY PSU BANK', 
-        'NIFTY REALTY', 
-        'NIFTY OIL & GAS',
-        'NIFTY PHARMA'
-    ]
-    
-    nifty_data = {}
+    return nse_indices.tracked()
+
+def get_nse_indices():
+    """
+    All NSE indices (except bond and ex-bank series) from the shared allIndices feed
     
-    try:
-        # Create a session to handle cookies and maintain connection
-        session = requests.Session()
-        
-        # First, establish a session by visiting the main NSE website
-        logger.debug("Establishing session with NSE website")
-        pre_response = session.get("https://www.nseindia.com", headers=headers)
-        logger.debug(f"Pre-session response status: {pre_response.status_code}")
-        
-        # Fetch indices data
-        logger.debug(f"Fetching data from URL: {url}")
-        response = session.get(url, headers=headers)
-        
-        # Log full response details for debugging
-        logger.debug(f"Response status code: {response.status_code}")
-        
-        # Check if request was successful
-        if response.status_code == 200:
-            try:
-                data = response.json()
-            except ValueError as json_error:
-                logger.error(f"JSON parsing error: {json_error}")
-                logger.error(f"Response content: {response.text}")
-                return {}
-            
-            # Create a mapping of uppercase index names to their original data
-            index_map = {
-                index_data.get('index', '').upper(): index_data 
-                for index_data in data.get('data', [])
-            }
-            
-            # Extract values for specified indices in the specified order
-            for nse_index in tracked_indices:
-                try:
-                    # Get the index data from the map
-                    index_data = index_map.get(nse_index)
-                    if not index_data:
-                        continue
-                    
-                    # Prepend 'Nifty' to the display name
-                    display_name = f"Nifty {index_data['index'].replace('NIFTY ', '')}"
-                    
-                    # Calculate change as Last Price - Open Price
-                    last_price = float(index_data.get('last', 0))
-                    open_price = float(index_data.get('open', 0))
-                    change = last_price - open_price
-                    
-                    # Calculate percentage change
-                    pct_change = (change / open_price * 100) if open_price != 0 else 0
-                    
-                    nifty_data[display_name] = {
-                        "change": f"{change:+.2f}",
-                        "last": f"{last_price:,.2f}",
-                        "open": f"{open_price:,.2f}",
-                        "pChange": f"{pct_change:+.2f}"
-                    }
-                except Exception as parse_error:
-                    logger.error(f"Error parsing index data for {nse_index}: {parse_error}")
-            
-            logger.info(f"Fetched Nifty data: {nifty_data}")
-            return nifty_data
-        
-        else:
-            logger.error(f"Failed to fetch indices. Status code: {response.status_code}")
-            logger.error(f"Response content: {response.text}")
-            return {}
+    Returns:
+    dict: A dictionary of indices with their current values, changes, and percentage changes
+    """
+    return nse_indices.full()
+
+def get_nse_index_values():
+    """
+    NSE index last prices as numbers from the shared allIndices feed
     
-    except requests.exceptions.RequestException as req_error:
-        logger.error(f"Network error fetching NSE indices: {req_error}")
-        return {}
-    except Exception as e:
-        logger.error(f"Unexpected error fetching NSE indices: {str(e)}")
-        return {}
+    Returns:
+    dict: A dictionary of indices with their current values
+    """
+    return nse_indices.numeric()
 
 @app.route('/get_nifty_data')
 def fetch_get_nifty_data():
@@ -754,90 +732,15 @@ def start_background_thread():
         update_thread = threading.Thread(target=update_data)
         update_thread.daemon = True
         update_thread.start()
+        nse_indices.start()
         thread_started = True
         logger.info("Background thread started")
 
-def get_nse_indices():
-    """
-    Fetch NSE indices values directly from NSE's official API
-    
-    Returns:
-    dict: A dictionary of indices with their current values
-    """
-    url = "https://www.nseindia.com/api/allIndices"
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-        "Accept": "application/json",
-        "Accept-Language": "en-US,en;q=0.9",
-        "Referer": "https://www.nseindia.com/"
-    }
-    
-    indices_data = {}
-    
-    try:
-        # Create a session to handle cookies and maintain connection
-        session = requests.Session()
-        
-        # First, establish a session by visiting the main NSE website
-        logger.debug("Establishing session with NSE website")
-        pre_response = session.get("https://www.nseindia.com", headers=headers)
-        logger.debug(f"Pre-session response status: {pre_response.status_code}")
-        
-        # Fetch indices data
-        logger.debug(f"Fetching data from URL: {url}")
-        response = session.get(url, headers=headers)
-        
-        # Log full response details for debugging
-        logger.debug(f"Response status code: {response.status_code}")
-        
-        # Check if request was successful
-        if response.status_code == 200:
-            try:
-                data = response.json()
-                # Log ALL indices in the response
-                logger.info("ALL Indices in the response:")
-                for index_data in data.get('data', []):
-                    logger.info(f"Index: {index_data.get('index', 'N/A')}")
-            except ValueError as json_error:
-                logger.error(f"JSON parsing error: {json_error}")
-                logger.error(f"Response content: {response.text}")
-                return {}
-            
-            # Extract values for ALL indices
-            for index_data in data.get('data', []):
-                try:
-                    # Skip indices containing BOND INDEX or EX-BANK
-                    if any(forbidden in index_data.get('index', '').upper() for forbidden in ['BOND INDEX', 'EX-BANK','G-SEC','TOTAL MARKET', 'MOMENTUM QUALITY 100','TOTAL MARKET',' G-SEC','VOLATILITY']):
-                        logger.info(f"Skipping index: {index_data.get('index', 'N/A')}")
-                        continue
-                    
-                    # Prepend 'Nifty' to the display name
-                    display_name = f"Nifty {index_data['index'].replace('NIFTY ', '')}"
-                    
-                    indices_data[display_name] = float(index_data['last'])
-                except Exception as parse_error:
-                    logger.error(f"Error parsing index data: {parse_error}")
-            
-            logger.info(f"Fetched indices data: {indices_data}")
-            return indices_data
-        
-        else:
-            logger.error(f"Failed to fetch indices. Status code: {response.status_code}")
-            logger.error(f"Response content: {response.text}")
-            return {}
-    
-    except requests.exceptions.RequestException as req_error:
-        logger.error(f"Network error fetching NSE indices: {req_error}")
-        return {}
-    except Exception as e:
-        logger.error(f"Unexpected error fetching NSE indices: {str(e)}")
-        return {}
-
 @app.route('/get-nse-indices')
 def fetch_nse_indices():
-    """API endpoint to get NSE indices"""
+    """API endpoint to get NSE indices (``?view=numeric`` for plain last prices)"""
     try:
-        indices = get_nse_indices()
+        indices = get_nse_index_values() if request.args.get('view') == 'numeric' else get_nse_indices()
         return app.response_class(
             response=json.dumps(indices, indent=4),
             status=200,
@@ -851,85 +754,67 @@ def fetch_nse_indices():
             mimetype='application/json'
         )
 
-def get_nse_indices():
+
+@app.route('/rate-limits')
+def rate_limits():
+    """Remaining request budget, queue depth and throttling per upstream host"""
+    return jsonify(http_client.rate_limits())
+
+@app.route('/schedule')
+def schedule_status():
+    """Market phase, per-condition cadence and last refresh times"""
+    return jsonify(refresh_schedule.status(conditions))
+
+@app.route('/score-signals')
+def score_signals():
+    """Per-symbol score rates of change over 1/3/5 snapshots with jump and acceleration flags"""
+    symbol = request.args.get('symbol', '').strip().upper()
+    if symbol:
+        return jsonify({'symbol': symbol, 'series': score_trail.series(symbol)})
+    return jsonify({'signals': score_trail.signals(), 'history': score_trail.stats()})
+
+@app.route('/filter_stocks', methods=['POST'])
+def filter_stocks_by_score():
+    score_threshold = float(request.json.get('score', 0))
+    started = time.time()
+    # One row per symbol, best score first, answered from the snapshot's sorted indexes
+    result = current_stock_index().query([('potential_score', '>', score_threshold)], limit=stock_query.MAX_LIMIT)
+    logger.info(f"Filter score > {score_threshold}: {result['total']} stocks in {(time.time() - started) * 1000:.1f}ms")
+    return jsonify(result['stocks'])
+
+@app.route('/query')
+def query_stocks():
     """
-    Fetch NSE indices values from NSE's official API
-    
-    Returns:
-    dict: A dictionary of indices with their current values, changes, and percentage changes
+    Filter the merged symbols with ?where=potential_score>100,close<=2000,
+    ordered by ?sort=<field> (?order=asc|desc) and paginated with ?offset= and
+    ?limit=; ?conditions=A,B keeps symbols matching any of those scans.
     """
-    url = "https://www.nseindia.com/api/allIndices"
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-        "Accept": "application/json",
-        "Accept-Language": "en-US,en;q=0.9",
-        "Referer": "https://www.nseindia.com/"
-    }
-    
-    indices_data = {}
-    
     try:
-        # Create a session to handle cookies and maintain connection
-        session = requests.Session()
-        
-        # First, establish a session by visiting the main NSE website
-        logger.debug("Establishing session with NSE website")
-        pre_response = session.get("https://www.nseindia.com", headers=headers)
-        logger.debug(f"Pre-session response status: {pre_response.status_code}")
-        
-        # Fetch indices data
-        logger.debug(f"Fetching data from URL: {url}")
-        response = session.get(url, headers=headers)
-        
-        # Log full response details for debugging
-        logger.debug(f"Response status code: {response.status_code}")
-        
-        # Check if request was successful
-        if response.status_code == 200:
-            try:
-                data = response.json()
-                # Log ALL indices in the response
-                logger.info("ALL Indices in the response:")
-                for index_data in data.get('data', []):
-                    logger.info(f"Index: {index_data.get('index', 'N/A')}")
-            except ValueError as json_error:
-                logger.error(f"JSON parsing error: {json_error}")
-                logger.error(f"Response content: {response.text}")
-                return {}
-            
-            # Extract values for ALL indices
-            for index_data in data.get('data', []):
-                try:
-                    # Skip indices containing BOND INDEX or EX-BANK
-                    if any(forbidden in index_data.get('index', '').upper() for forbidden in ['BOND INDEX', 'EX-BANK']):
-                        logger.info(f"Skipping index: {index_data.get('index', 'N/A')}")
-                        continue
-                    
-                    # Prepend 'Nifty' to the display name
-                    display_name = f"Nifty {index_data['index'].replace('NIFTY ', '')}"
-                    
-                    indices_data[display_name] = {
-                        "last": f"{index_data['last']:,.2f}",
-                        "change": f"{index_data['change']:+.2f}",
-                        "pChange": f"{index_data['percentChange']:+.2f}"
-                    }
-                except Exception as parse_error:
-                    logger.error(f"Error parsing index data: {parse_error}")
-            
-            logger.info(f"Fetched indices data: {indices_data}")
-            return indices_data
-        
-        else:
-            logger.error(f"Failed to fetch indices. Status code: {response.status_code}")
-            logger.error(f"Response content: {response.text}")
-            return {}
-    
-    except requests.exceptions.RequestException as req_error:
-        logger.error(f"Network error fetching NSE indices: {req_error}")
-        return {}
-    except Exception as e:
-        logger.error(f"Unexpected error fetching NSE indices: {str(e)}")
-        return {}
+        predicates = stock_query.parse_where(request.args.get('where'))
+        names = [name.strip() for name in request.args.get('conditions', '').split(',') if name.strip()]
+        result = current_stock_index().query(
+            predicates,
+            sort=request.args.get('sort', stock_query.DEFAULT_SORT),
+            descending=request.args.get('order', 'desc').lower() != 'asc',
+            offset=int(request.args.get('offset', 0)),
+            limit=int(request.args.get('limit', stock_query.DEFAULT_LIMIT)),
+            conditions=names or None,
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return add_snapshot_headers(jsonify({**result, **snapshot_meta()}))
+
+@app.route('/confluence')
+def confluence():
+    """Symbols hitting ?min=N or more scans (default 2), ranked by scan count then best score"""
+    try:
+        min_count = int(request.args.get('min', symbol_table.MIN_CONFLUENCE))
+        limit = int(request.args['limit']) if request.args.get('limit') else None
+    except ValueError:
+        return jsonify({'error': 'min and limit must be integers'}), 400
+    table = current_symbol_table()
+    response = jsonify({'min': min_count, 'stocks': table.confluent(min_count, limit=limit), **snapshot_meta()})
+    return add_snapshot_headers(response)
 
 @app.route('/get-refresh-interval')
 def refresh_interval():
@@ -0,0 +1,268 @@
+"""
+Bulk ingestion of NSE equity bhavcopies into the OHLCV store.
+
+One bhavcopy holds the daily OHLCV of every listed symbol, so a date range
+is loaded with one download per trading day instead of one request per
+symbol. Zips are validated before use (NSE answers missing days with an
+HTML page, which is what "File is not a zip file" meant), the CSV inside is
+decompressed and parsed as a stream, and both the legacy
+``cmDDMMMYYYYbhav.csv`` and the UDiFF ``BhavCopy_NSE_CM_...`` layouts are
+understood.
+
+Days are downloaded and parsed in parallel and written to the store in
+batches of ``WRITE_BATCH`` days. A range older than what the store already
+holds is backfilled in date order, the stored history being copied once per
+batch. Re-running a range is cheap: valid zips already on disk are not
+downloaded again and days already in the store are skipped.
+"""
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import csv
+from datetime import date as date_type
+import io
+import itertools
+import logging
+import os
+import zipfile
+
+import pandas as pd
+
+import http_client
+from ohlcv_store import OhlcvStore
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DOWNLOAD_DIR = 'bhavcopy'
+DEFAULT_WORKERS = 4
+WRITE_BATCH = 64  # Days written (and flushed) together; a backfill copies the stored bars once per batch
+SERIES = ('EQ', 'BE')  # Equity series kept; others (bonds, ETFs' N-series, etc.) are ignored
+UDIFF_START = date_type(2024, 7, 8)  # First day NSE published the UDiFF format
+
+LEGACY_URL = "https://archives.nseindia.com/content/historical/EQUITIES/{year}/{month}/cm{day}{month}{year}bhav.csv.zip"
+UDIFF_URL = "https://nsearchives.nseindia.com/content/cm/BhavCopy_NSE_CM_0_0_0_{ymd}_F_0000.csv.zip"
+
+# Column names per layout: symbol, series, open, high, low, close, volume
+COLUMNS = {
+    'legacy': ('SYMBOL', 'SERIES', 'OPEN', 'HIGH', 'LOW', 'CLOSE', 'TOTTRDQTY'),
+    'udiff': ('TckrSymb', 'SctySrs', 'OpnPric', 'HghPric', 'LwPric', 'ClsPric', 'TtlTradgVol'),
+}
+
+
+class BhavcopyError(Exception):
+    """Raised for bhavcopies that are missing, corrupt or in an unknown layout"""
+
+
+def bhavcopy_url(day):
+    if day >= UDIFF_START:
+        return UDIFF_URL.format(ymd=day.strftime('%Y%m%d'))
+    month = day.strftime('%b').upper()
+    return LEGACY_URL.format(year=day.year, month=month, day=day.strftime('%d'))
+
+
+def local_path(day, directory):
+    return os.path.join(directory, os.path.basename(bhavcopy_url(day)))
+
+
+def validate_zip(path):
+    """Raise BhavcopyError unless path is a readable zip holding one CSV"""
+    if not zipfile.is_zipfile(path):
+        raise BhavcopyError(f"{path} is not a zip file")
+    with zipfile.ZipFile(path) as archive:
+        members = [name for name in archive.namelist() if name.lower().endswith('.csv')]
+        if len(members) != 1:
+            raise BhavcopyError(f"{path} should contain one CSV, found {len(members)}")
+        bad = archive.testzip()
+        if bad:
+            raise BhavcopyError(f"{path} has a corrupt member {bad}")
+        return members[0]
+
+
+def download(day, directory=DEFAULT_DOWNLOAD_DIR):
+    """
+    Fetch the bhavcopy for a day unless a valid copy is already on disk.
+
+    Returns:
+    str or None: Path of the zip, or None if NSE has no file for that day
+    (a holiday)
+    """
+    path = local_path(day, directory)
+    if os.path.exists(path):
+        try:
+            validate_zip(path)
+            return path
+        except BhavcopyError as e:
+            logger.warning(f"Re-downloading {path}: {e}")
+
+    os.makedirs(directory, exist_ok=True)
+    url = bhavcopy_url(day)
+    logger.info(f"Downloading NSE bhavcopy for {day:%d-%m-%Y}")
+    with http_client.nse().get(url, stream=True, headers={"Accept": "*/*"}) as response:
+        if response.status_code == 404:
+            logger.info(f"No bhavcopy for {day:%d-%m-%Y} (holiday?)")
+            return None
+        response.raise_for_status()
+        tmp_path = f"{path}.part"
+        with open(tmp_path, 'wb') as f:
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                f.write(chunk)
+    try:
+        validate_zip(tmp_path)
+    except BhavcopyError:
+        os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
+    return path
+
+
+def _number(value):
+    value = value.strip()
+    return float(value) if value and value != '-' else None
+
+
+def iter_rows(path):
+    """
+    Stream (symbol, open, high, low, close, volume) rows out of a bhavcopy
+    zip without extracting it, in either layout.
+    """
+    member = validate_zip(path)
+    with zipfile.ZipFile(path) as archive, archive.open(member) as raw:
+        reader = csv.reader(io.TextIOWrapper(raw, encoding='utf-8', newline=''))
+        header = [name.strip() for name in next(reader, [])]
+        for layout, columns in COLUMNS.items():
+            if all(column in header for column in columns):
+                break
+        else:
+            raise BhavcopyError(f"Unrecognised bhavcopy header in {path}: {header[:6]}")
+        positions = [header.index(column) for column in columns]
+
+        for row in reader:
+            if len(row) < len(header):
+                continue
+            symbol, series, open_, high, low, close, volume = (row[i] for i in positions)
+            if series.strip() not in SERIES:
+                continue
+            yield symbol.strip(), _number(open_), _number(high), _number(low), _number(close), _number(volume)
+
+
+def parse_day(path):
+    """Parse one bhavcopy into {symbol: {field: value}}"""
+    bars = {}
+    for symbol, open_, high, low, close, volume in iter_rows(path):
+        bars[symbol] = {
+            'open': open_,
+            'high': high,
+            'low': low,
+            'close': close,
+            'volume': int(volume) if volume is not None else None,
+        }
+    return bars
+
+
+def _load(day, source_dir, download_dir):
+    """Locate or download, then parse, one day; runs in the worker pool"""
+    if source_dir:
+        path = local_path(day, source_dir)
+        if not os.path.exists(path):
+            return None
+    else:
+        path = download(day, download_dir)
+        if path is None:
+            return None
+    return parse_day(path)
+
+
+def ingest(start, end, store=None, source_dir=None, download_dir=DEFAULT_DOWNLOAD_DIR,
+           workers=DEFAULT_WORKERS, overwrite=False):
+    """
+    Load every trading day in [start, end] into the store's daily table.
+
+    Args:
+        start, end: date range (anything pandas.Timestamp accepts)
+        store: OhlcvStore to write to (default ./store)
+        source_dir: read zips from this directory instead of downloading
+        download_dir: where downloaded zips are kept for reuse
+        workers: days downloaded and parsed concurrently
+        overwrite: rewrite days that are already in the store
+
+    Returns:
+    dict: written, skipped (already stored), missing (no file) and errors
+    (day -> message)
+    """
+    store = store or OhlcvStore()
+    table = store.table('daily')
+    days = [day.date() for day in pd.bdate_range(start, end)]
+    report = {'written': [], 'skipped': [], 'missing': [], 'errors': {}}
+
+    pending = []
+    for day in days:
+        if not overwrite and table.locate(day) is not None:
+            report['skipped'].append(str(day))
+        else:
+            pending.append(day)
+
+    batch = {}
+
+    def write():
+        try:
+            table.upsert_many(batch)
+        except (ValueError, OSError) as e:
+            logger.error(f"Writing bhavcopies {min(batch)}..{max(batch)} failed: {e}")
+            report['errors'].update((str(day), str(e)) for day in batch)
+        else:
+            report['written'].extend(str(day) for day in batch)
+            logger.info(f"Stored bhavcopies {min(batch)}..{max(batch)}: {len(batch)} days")
+        batch.clear()
+
+    workers = max(1, workers)
+    queued = iter(pending)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # Only a few days are in flight at once; parsed bars are held until
+        # their day is written, not for the whole range
+        in_flight = deque((day, pool.submit(_load, day, source_dir, download_dir))
+                          for day in itertools.islice(queued, workers * 2))
+        while in_flight:
+            day, future = in_flight.popleft()
+            following = next(queued, None)
+            if following is not None:
+                in_flight.append((following, pool.submit(_load, following, source_dir, download_dir)))
+            try:
+                bars = future.result()
+            except Exception as e:
+                logger.error(f"Bhavcopy for {day} failed: {e}")
+                report['errors'][str(day)] = str(e)
+                continue
+            if bars is None:
+                report['missing'].append(str(day))
+                continue
+            batch[day] = bars
+            if len(batch) >= WRITE_BATCH:
+                write()
+        if batch:
+            write()
+
+    logger.info(
+        f"Bhavcopy ingest {start}..{end}: {len(report['written'])} written, "
+        f"{len(report['skipped'])} skipped, {len(report['missing'])} missing, {len(report['errors'])} errors"
+    )
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load NSE bhavcopies into the OHLCV store")
+    parser.add_argument('start', help="First day, e.g. 2025-06-01")
+    parser.add_argument('end', nargs='?', default=None, help="Last day (default: start)")
+    parser.add_argument('--source-dir', help="Read zips from this directory instead of downloading")
+    parser.add_argument('--store', default=None, help="Store directory")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    parser.add_argument('--overwrite', action='store_true', help="Rewrite days already stored")
+    args = parser.parse_args()
+
+    store = OhlcvStore(args.store) if args.store else OhlcvStore()
+    ingest(args.start, args.end or args.start, store, source_dir=args.source_dir,
+           workers=args.workers, overwrite=args.overwrite)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main()
@@ -0,0 +1,131 @@
+"""
+Circuit breaker for upstream data sources.
+
+A source that keeps failing is skipped for a cool-down period instead of
+being retried on every lookup. States follow the usual pattern:
+
+- closed: calls go through; consecutive failures are counted
+- open: calls are refused until the cool-down has passed
+- half-open: a limited number of trial calls decide whether to close again
+
+The cool-down starts at ``reset_timeout`` and is multiplied by ``backoff``
+(up to ``max_reset_timeout``) every time a trial call fails, with a little
+jitter, so a long outage is probed less and less often instead of every
+``reset_timeout`` seconds.
+"""
+import logging
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+DEFAULT_FAILURE_THRESHOLD = 3  # Consecutive failures before opening
+DEFAULT_RESET_TIMEOUT = 60  # Seconds to stay open before a trial call
+DEFAULT_HALF_OPEN_CALLS = 1  # Trial calls allowed while half-open
+DEFAULT_BACKOFF = 2.0  # Cool-down multiplier after a failed trial call
+DEFAULT_MAX_RESET_TIMEOUT = 600  # Longest cool-down in seconds
+JITTER = 0.1  # +/- fraction applied to each cool-down
+
+
+class CircuitBreaker:
+    """Tracks the health of one upstream and decides whether to call it"""
+
+    def __init__(self, name, failure_threshold=DEFAULT_FAILURE_THRESHOLD,
+                 reset_timeout=DEFAULT_RESET_TIMEOUT, half_open_calls=DEFAULT_HALF_OPEN_CALLS,
+                 backoff=DEFAULT_BACKOFF, max_reset_timeout=DEFAULT_MAX_RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_calls = half_open_calls
+        self.backoff = backoff
+        self.max_reset_timeout = max(max_reset_timeout, reset_timeout)
+        self.cooldown = reset_timeout  # Current cool-down before the next trial call
+        self.failures = 0  # Consecutive failures
+        self.opened_at = None
+        self.total_failures = 0
+        self.total_successes = 0
+        self.rejected = 0
+        self._state = CLOSED
+        self._trials = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self):
+        if self._state == OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+            self._state = HALF_OPEN
+            self._trials = 0
+            logger.info(f"Circuit {self.name} half-open, allowing a trial call")
+        return self._state
+
+    def allow(self):
+        """Return True if a call may be made now"""
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and self._trials < self.half_open_calls:
+                self._trials += 1
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.total_successes += 1
+            self.failures = 0
+            if self._state != CLOSED:
+                logger.info(f"Circuit {self.name} closed")
+            self._state = CLOSED
+            self.cooldown = self.reset_timeout
+
+    def _open(self, cooldown):
+        """Trip the breaker for a jittered cool-down; caller holds the lock"""
+        self._state = OPEN
+        self.opened_at = time.monotonic()
+        self.cooldown = cooldown * random.uniform(1 - JITTER, 1 + JITTER)
+
+    def release(self):
+        """Give back a trial call that ended without a verdict (e.g. it was never sent)"""
+        with self._lock:
+            if self._state == HALF_OPEN and self._trials > 0:
+                self._trials -= 1
+
+    def record_failure(self):
+        with self._lock:
+            self.total_failures += 1
+            self.failures += 1
+            state = self._current_state()
+            if state == HALF_OPEN:
+                # The trial call failed: wait longer before the next one
+                self._open(min(self.max_reset_timeout, self.cooldown * self.backoff))
+                logger.warning(f"Circuit {self.name} trial call failed, reopened for {self.cooldown:.0f}s")
+            elif state == CLOSED and self.failures >= self.failure_threshold:
+                self._open(self.reset_timeout)
+                logger.warning(f"Circuit {self.name} opened after {self.failures} consecutive failures")
+
+    def retry_after(self):
+        """Seconds until an open circuit allows a trial call (0 if not open)"""
+        with self._lock:
+            if self._current_state() != OPEN:
+                return 0.0
+            return max(0.0, self.cooldown - (time.monotonic() - self.opened_at))
+
+    def stats(self):
+        return {
+            'state': self.state,
+            'failures': self.failures,
+            'total_failures': self.total_failures,
+            'total_successes': self.total_successes,
+            'rejected': self.rejected,
+            'cooldown': round(self.cooldown, 1),
+            'retry_after': round(self.retry_after(), 1),
+        }
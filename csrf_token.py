@@ -0,0 +1,129 @@
+"""
+CSRF token cache for the Chartink screener.
+
+Chartink only needs the ``x-csrf-token`` header to match the session cookie,
+so one token can be reused for every scan POST made with the same session.
+The token is read with a streaming regex scan of the page head instead of
+building a full DOM, and is refreshed only after a 419/403 or once the TTL
+has elapsed.
+"""
+import logging
+import re
+import threading
+import time
+import weakref
+
+logger = logging.getLogger(__name__)
+
+CHARTINK_PROCESS_URL = "https://chartink.com/screener/process"
+DEFAULT_TOKEN_TTL = 30 * 60  # Seconds before a token is fetched again
+REFRESH_STATUS_CODES = (403, 419)  # Responses that mean the token went stale
+
+_META_PATTERNS = (
+    re.compile(rb'<meta[^>]*name=["\']csrf-token["\'][^>]*content=["\']([^"\']+)["\']', re.IGNORECASE),
+    re.compile(rb'<meta[^>]*content=["\']([^"\']+)["\'][^>]*name=["\']csrf-token["\']', re.IGNORECASE),
+)
+_MAX_SCAN_BYTES = 256 * 1024  # The meta tag lives in <head>; never read more than this
+
+
+class CsrfTokenError(Exception):
+    """Raised when the CSRF token cannot be found in the screener page"""
+
+
+def extract_csrf_token(chunks):
+    """
+    Scan an iterable of byte chunks for the csrf-token meta tag.
+
+    Stops reading as soon as the token is found, so only the first few
+    kilobytes of the page are ever downloaded.
+
+    Returns:
+    str or None: The token value
+    """
+    buffer = b''
+    scanned = 0
+    for chunk in chunks:
+        if not chunk:
+            continue
+        buffer += chunk
+        scanned += len(chunk)
+        for pattern in _META_PATTERNS:
+            match = pattern.search(buffer)
+            if match:
+                return match.group(1).decode('utf-8', 'replace')
+        if b'</head>' in buffer.lower() or scanned > _MAX_SCAN_BYTES:
+            break
+        # Keep a tail so a tag split across chunks is still matched
+        buffer = buffer[-1024:] if len(buffer) > 4096 else buffer
+    return None
+
+
+class CsrfTokenManager:
+    """Caches one Chartink CSRF token per requests session"""
+
+    def __init__(self, url=CHARTINK_PROCESS_URL, ttl=DEFAULT_TOKEN_TTL):
+        self.url = url
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0  # Tokens discarded because of a 419/403
+        self._tokens = weakref.WeakKeyDictionary()  # session -> (token, fetched_at)
+        self._lock = threading.Lock()
+
+    def _fetch_token(self, session, timeout=None):
+        with session.get(self.url, timeout=timeout, stream=True) as response:
+            response.raise_for_status()
+            token = extract_csrf_token(response.iter_content(chunk_size=8192))
+        if not token:
+            raise CsrfTokenError("Could not find CSRF token")
+        return token
+
+    def get_token(self, session, timeout=None):
+        """Return a cached token for the session, fetching one on a miss"""
+        with self._lock:
+            cached = self._tokens.get(session)
+            if cached and time.monotonic() - cached[1] < self.ttl:
+                self.hits += 1
+                return cached[0]
+
+            # Fetch under the lock so concurrent misses share one GET
+            self.misses += 1
+            token = self._fetch_token(session, timeout=timeout)
+            self._tokens[session] = (token, time.monotonic())
+            logger.info("CSRF token obtained successfully")
+            return token
+
+    def invalidate(self, session=None):
+        """Forget the token for one session, or for all sessions"""
+        with self._lock:
+            if session is None:
+                self._tokens.clear()
+            else:
+                self._tokens.pop(session, None)
+
+    def post(self, session, data, timeout=None):
+        """
+        POST to the screener with the cached token.
+
+        On a 419/403 the token is discarded and the request is retried once
+        with a fresh token.
+        """
+        for attempt in range(2):
+            header = {"x-csrf-token": self.get_token(session, timeout=timeout)}
+            response = session.post(self.url, headers=header, data=data, timeout=timeout)
+            if response.status_code not in REFRESH_STATUS_CODES or attempt:
+                return response
+            logger.info(f"CSRF token rejected with {response.status_code}, refreshing")
+            self.refreshes += 1
+            self.invalidate(session)
+        return response
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'refreshes': self.refreshes,
+            'hit_rate': round(self.hits / total, 3) if total else 0.0,
+            'ttl': self.ttl,
+        }
@@ -0,0 +1,196 @@
+"""
+Pre-rendered dashboard fragments, cached per snapshot.
+
+The dashboard's dynamic parts are the condition cards and the buy/sell
+panels. Their numbers are formatted once per snapshot, column by column
+with NumPy (``formatted_results``). The HTML is rendered from the
+``_condition_card.html`` and ``_suggestions.html`` partials and cached:
+
+- each card by its condition's content digest and stale badge, so a card
+  is reused across snapshots and selections until its stocks change;
+- the buy/sell panels by snapshot version;
+- the assembled block by (snapshot version, selected conditions, stale
+  badges).
+
+A page render then only drops the cached blocks into ``index.html``.
+
+``format_number`` is the scalar formatter behind the ``format_number``
+Jinja filter; both paths produce the same strings.
+"""
+import logging
+import math
+
+from flask import render_template
+import numpy as np
+
+import ttl_cache
+
+logger = logging.getLogger(__name__)
+
+FRAGMENT_TTL = 60 * 60  # Seconds; keys carry the content, so this only bounds idle entries
+FRAGMENT_CACHE_SIZE = 256
+CARD_TEMPLATE = '_condition_card.html'
+SUGGESTIONS_TEMPLATE = '_suggestions.html'
+
+
+def format_number(value, column_type='default'):
+    """
+    Format one value for display.
+
+    close -> '12.30', change_percent -> '1.25%', volume/score -> rounded
+    integer, anything else -> two decimals; None and NaN -> '-'.
+    """
+    if value is None:
+        return '-'
+    try:
+        num = float(value)
+    except (ValueError, TypeError):
+        return str(value)
+    if math.isnan(num):
+        return '-'
+    if column_type == 'change_percent':
+        return f"{num:.2f}%"
+    if column_type in ('volume', 'score'):
+        return str(round(num))
+    return f"{num:.2f}"
+
+
+def format_column(values, column_type='default'):
+    """
+    Vectorized ``format_number`` over a column.
+
+    Returns:
+    list: formatted strings, '-' where the value is missing or not numeric
+    (the scalar filter echoes non-numeric text instead)
+    """
+    numbers = np.array([_number(value) for value in values], dtype=np.float64)
+    missing = np.isnan(numbers)
+    if column_type in ('volume', 'score'):
+        # np.rint rounds half to even, like round()
+        formatted = np.char.mod('%d', np.rint(np.where(missing, 0, numbers)).astype(np.int64))
+    elif column_type == 'change_percent':
+        formatted = np.char.mod('%.2f%%', numbers)
+    else:
+        formatted = np.char.mod('%.2f', numbers)
+    return np.where(missing, '-', formatted).tolist()
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def format_rows(stocks):
+    """
+    Display rows for a list of stock dicts, every column formatted in one pass.
+
+    Returns:
+    list: dicts with nsecode, close, change, volume, score (strings) and rising (bool)
+    """
+    if not stocks:
+        return []
+    per_chg = np.array([_number(stock.get('per_chg')) for stock in stocks], dtype=np.float64)
+    columns = zip(
+        format_column([stock.get('close') for stock in stocks], 'close'),
+        format_column(per_chg, 'change_percent'),
+        # Volumes are shown with two decimals, as the template filter always did
+        format_column([stock.get('volume') for stock in stocks]),
+        format_column([stock.get('potential_score') for stock in stocks], 'score'),
+        (per_chg >= 0).tolist(),
+    )
+    return [
+        {'nsecode': stock.get('nsecode'), 'close': close, 'change': change, 'volume': volume,
+         'score': score, 'rising': rising}
+        for stock, (close, change, volume, score, rising) in zip(stocks, columns)
+    ]
+
+
+def _format_snapshot(snapshot):
+    """All conditions of a snapshot formatted together, then split back per condition"""
+    names = snapshot.names()
+    everything = [stock for name in names for stock in snapshot.results[name]]
+    rows = format_rows(everything)
+    formatted, start = {}, 0
+    for name in names:
+        end = start + len(snapshot.results[name])
+        formatted[name] = rows[start:end]
+        start = end
+    return formatted
+
+
+def formatted_results(snapshot):
+    """
+    Display rows of every condition in a snapshot, built once per version.
+
+    Returns:
+    dict: condition name -> list of formatted rows
+    """
+    return snapshot.derived('formatted_rows', _format_snapshot)
+
+
+def stale_badges(stale):
+    """Reduce snapshot stale info to what the card badge shows (error, whole minutes)"""
+    return {
+        name: {'error': info['error'], 'minutes': None if info['age'] is None else int(round(info['age'] / 60))}
+        for name, info in (stale or {}).items()
+    }
+
+
+class DashboardFragments:
+    """Renders and caches the condition cards and buy/sell panels"""
+
+    def __init__(self, name='fragments', maxsize=FRAGMENT_CACHE_SIZE, ttl=FRAGMENT_TTL):
+        self.cache = ttl_cache.TTLCache(name, maxsize=maxsize, default_ttl=ttl)
+
+    def _card(self, snapshot, condition, badge):
+        name = condition['name']
+        key = ('card', name, snapshot.digests.get(name), condition.get('link'), condition.get('chart_link'),
+               tuple(sorted(badge.items())) if badge else None)
+        return self.cache.get_or_load(key, lambda: render_template(
+            CARD_TEMPLATE, condition=condition, stocks=formatted_results(snapshot).get(name, []), stale=badge,
+        ))
+
+    def conditions(self, snapshot, conditions, stale=None):
+        """
+        HTML of the cards for the selected conditions, in order.
+
+        Args:
+            conditions: condition dicts (name, link, chart_link) to show
+            stale: snapshot stale info (name -> {'error', 'age', ...})
+        """
+        badges = stale_badges(stale)
+        selected = tuple(condition['name'] for condition in conditions)
+        key = ('conditions', snapshot.version, selected,
+               tuple((name, tuple(sorted(badges[name].items()))) for name in selected if name in badges))
+        return self.cache.get_or_load(key, lambda: ''.join(
+            self._card(snapshot, condition, badges.get(condition['name'])) for condition in conditions
+        ))
+
+    def suggestions(self, snapshot, build):
+        """
+        HTML of the buy/sell panels for a snapshot.
+
+        Args:
+            build: callable returning (buy records, sell records) for the snapshot
+        """
+        def render():
+            buy, sell = build()
+            return render_template(SUGGESTIONS_TEMPLATE, buy=format_rows(buy), sell=format_rows(sell))
+        return self.cache.get_or_load(('suggestions', snapshot.version), render)
+
+    def page(self, snapshot, conditions, stale, suggestions):
+        """
+        Both fragments for ``index.html``.
+
+        Returns:
+        dict: {'conditions': html, 'suggestions': html}
+        """
+        return {
+            'conditions': self.conditions(snapshot, conditions, stale),
+            'suggestions': self.suggestions(snapshot, suggestions),
+        }
+
+    def stats(self):
+        return self.cache.stats()
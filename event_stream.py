@@ -0,0 +1,104 @@
+"""
+Server-Sent Events fan-out for the dashboard.
+
+The background updater publishes each event once; it is serialized to its
+wire format a single time and the same bytes are queued for every
+connected client. Idle connections receive a comment heartbeat so proxies
+keep them open. A client that falls too far behind is disconnected; the
+browser reconnects on its own and resumes with ``Last-Event-ID``.
+"""
+import json
+import logging
+import queue
+import threading
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HEARTBEAT = 15  # Seconds between keep-alive comments
+DEFAULT_QUEUE_SIZE = 64  # Events buffered per client before it is dropped
+HEARTBEAT = ": heartbeat\n\n"
+
+
+def format_event(event, data, event_id=None):
+    """Encode one SSE message; data may be a pre-serialized JSON string"""
+    if not isinstance(data, str):
+        data = json.dumps(data, separators=(',', ':'), default=str)
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.extend(f"data: {line}" for line in data.splitlines() or [''])
+    return "\n".join(lines) + "\n\n"
+
+
+class EventBroadcaster:
+    """Fans one serialized event out to every subscribed client"""
+
+    def __init__(self, heartbeat=DEFAULT_HEARTBEAT, queue_size=DEFAULT_QUEUE_SIZE):
+        self.heartbeat = heartbeat
+        self.queue_size = queue_size
+        self.published = 0
+        self.dropped = 0
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def subscribe(self):
+        subscriber = queue.Queue(maxsize=self.queue_size)
+        subscriber.overflowed = False
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def publish(self, event, data, event_id=None):
+        """Serialize once and queue the message for all subscribers"""
+        message = format_event(event, data, event_id)
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(message)
+            except queue.Full:
+                # Too far behind: disconnect so it reconnects and resumes from history
+                subscriber.overflowed = True
+                self.unsubscribe(subscriber)
+                self.dropped += 1
+        self.published += 1
+        return message
+
+    def stream(self, initial=()):
+        """
+        Generator of SSE messages for one client.
+
+        Args:
+            initial: messages to send before live events (e.g. a resume delta),
+                or a callable returning them; a callable is evaluated after
+                subscribing so no event published in between is missed
+        """
+        subscriber = self.subscribe()
+        try:
+            if callable(initial):
+                initial = initial()
+            for message in initial:
+                yield message
+            while not subscriber.overflowed:
+                try:
+                    yield subscriber.get(timeout=self.heartbeat)
+                except queue.Empty:
+                    yield HEARTBEAT
+        finally:
+            self.unsubscribe(subscriber)
+
+    def stats(self):
+        return {
+            'subscribers': self.subscriber_count,
+            'published': self.published,
+            'dropped': self.dropped,
+        }
@@ -0,0 +1,123 @@
+"""
+Bounded-concurrency fetch engine for Chartink scan conditions.
+
+All selected scan clauses are submitted to a thread pool at once; at most
+``max_in_flight`` requests are outstanding against Chartink at any moment.
+Results are handed back through ``on_result`` as soon as each condition
+completes so callers can merge them into ``scan_results`` incrementally.
+"""
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_IN_FLIGHT = 6  # Concurrent Chartink requests
+DEFAULT_CONDITION_TIMEOUT = 20  # Seconds allowed per condition
+
+
+class FetchReport:
+    """Wall-clock and per-condition latency for one fetch cycle"""
+
+    def __init__(self, max_in_flight):
+        self.max_in_flight = max_in_flight
+        self.wall_clock = 0.0
+        self.latencies = {}  # condition name -> seconds
+        self.errors = {}  # condition name -> error message
+        self.timed_out = []
+
+    @property
+    def serial_estimate(self):
+        """Time the same cycle would have taken with one request at a time"""
+        return sum(self.latencies.values())
+
+    def as_dict(self):
+        return {
+            'max_in_flight': self.max_in_flight,
+            'wall_clock': round(self.wall_clock, 3),
+            'serial_estimate': round(self.serial_estimate, 3),
+            'latencies': {name: round(secs, 3) for name, secs in self.latencies.items()},
+            'errors': dict(self.errors),
+            'timed_out': list(self.timed_out),
+        }
+
+    def summary(self):
+        slowest = max(self.latencies.items(), key=lambda item: item[1], default=(None, 0))
+        return (
+            f"{len(self.latencies)} conditions in {self.wall_clock:.2f}s "
+            f"(serial estimate {self.serial_estimate:.2f}s, in-flight limit {self.max_in_flight}, "
+            f"slowest {slowest[0]} {slowest[1]:.2f}s, errors {len(self.errors)}, "
+            f"timed out {len(self.timed_out)})"
+        )
+
+
+def fetch_conditions(conditions, fetch_one, on_result=None,
+                     max_in_flight=DEFAULT_MAX_IN_FLIGHT,
+                     timeout=DEFAULT_CONDITION_TIMEOUT,
+                     should_continue=None):
+    """
+    Run ``fetch_one(condition)`` for every condition with bounded concurrency.
+
+    Args:
+        conditions: list of condition dicts (must contain 'name')
+        fetch_one: callable taking a condition and returning its result
+        on_result: optional callable ``(name, result)`` invoked in the calling
+            thread as each condition completes
+        max_in_flight: maximum number of concurrent requests (1 = serial path)
+        timeout: seconds a single condition may run before it is abandoned
+        should_continue: optional callable; when it returns False the
+            remaining queued conditions are cancelled
+
+    Returns:
+    tuple: (dict of condition name -> result, FetchReport)
+    """
+    max_in_flight = max(1, int(max_in_flight))
+    report = FetchReport(max_in_flight)
+    results = {}
+    started_at = {}
+
+    def _run(condition):
+        started_at[condition['name']] = time.monotonic()
+        return fetch_one(condition)
+
+    cycle_start = time.monotonic()
+    executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix='chartink-fetch')
+    try:
+        pending = {executor.submit(_run, condition): condition['name'] for condition in conditions}
+
+        while pending:
+            done, _ = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+            now = time.monotonic()
+
+            for future in done:
+                name = pending.pop(future)
+                report.latencies[name] = now - started_at.get(name, now)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.error(f"Error fetching {name}: {e}")
+                    report.errors[name] = str(e)
+                    result = {"error": str(e)}
+                results[name] = result
+                if on_result:
+                    on_result(name, result)
+
+            # Abandon conditions that have been running longer than the timeout
+            for future, name in list(pending.items()):
+                begun = started_at.get(name)
+                if begun is not None and now - begun > timeout:
+                    future.cancel()
+                    pending.pop(future)
+                    report.latencies[name] = now - begun
+                    report.timed_out.append(name)
+                    logger.warning(f"Condition {name} timed out after {timeout}s")
+
+            if should_continue is not None and not should_continue():
+                for future in pending:
+                    future.cancel()
+                break
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    report.wall_clock = time.monotonic() - cycle_start
+    return results, report
@@ -0,0 +1,281 @@
+"""
+Long-lived pooled HTTP clients for Chartink, NSE and Yahoo Finance.
+
+Every upstream host gets one ``requests.Session`` that lives for the whole
+process, so TCP/TLS connections and cookies are reused across dashboard
+polls instead of being re-established on every call. Transient failures are
+retried with jittered exponential backoff, and NSE's cookie warm-up is
+repeated automatically when the API answers 401/403.
+
+Every request (warm-ups and retries included) first takes a token from the
+host's ``RateLimiter``, so bursts are spread out at a rate the host
+tolerates instead of tripping its throttling.
+
+Each host also has a ``CircuitBreaker``. Once a host keeps failing
+(connection errors, timeouts, 429/5xx after retries), requests to it fail
+fast with ``CircuitOpenError`` until a trial request succeeds, rather than
+adding load to a host that is already down.
+"""
+import logging
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from circuit_breaker import CircuitBreaker
+import rate_limiter
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+
+NSE_HEADERS = {
+    "User-Agent": USER_AGENT,
+    "Accept": "application/json",
+    "Accept-Language": "en-US,en;q=0.9",
+    "Referer": "https://www.nseindia.com/"
+}
+
+# Per-host settings; pool_maxsize is the number of keep-alive connections kept open,
+# rate/burst the sustained requests per second and the burst the host tolerates
+HOSTS = {
+    'chartink': {
+        'headers': {"User-Agent": USER_AGENT},
+        'pool_maxsize': 10,
+        'warmup_url': None,
+        'rate': 2,
+        'burst': 5,
+    },
+    'nse': {
+        'headers': NSE_HEADERS,
+        'pool_maxsize': 4,
+        'warmup_url': "https://www.nseindia.com",
+        'rate': 1,
+        'burst': 3,
+    },
+    'yahoo': {
+        'headers': {"User-Agent": USER_AGENT, "Accept": "application/json"},
+        'pool_maxsize': 4,
+        'warmup_url': None,
+        'rate': 2,
+        'burst': 5,
+    },
+}
+
+DEFAULT_TIMEOUT = 15  # Seconds
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+REWARM_STATUS_CODES = (401, 403)
+BREAKER_RESET_TIMEOUT = 30  # Seconds before the first trial request to a failing host
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised instead of sending a request to a host whose circuit is open"""
+
+
+class HostClient:
+    """Keep-alive session for one upstream host with retries and cookie warm-up"""
+
+    def __init__(self, name, headers=None, pool_maxsize=10, warmup_url=None,
+                 retries=3, backoff=0.5, backoff_cap=8.0, rate=None, burst=None):
+        self.name = name
+        self.limiter = rate_limiter.RateLimiter(name, rate, burst or rate) if rate else None
+        self.breaker = CircuitBreaker(f"http:{name}", reset_timeout=BREAKER_RESET_TIMEOUT)
+        self.warmup_url = warmup_url
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_cap = backoff_cap
+        self.pool_maxsize = pool_maxsize
+        self.warmups = 0
+        self._warmed = False
+        self._warm_lock = threading.Lock()
+
+        self.session = requests.Session()
+        if headers:
+            self.session.headers.update(headers)
+        self._mount(pool_maxsize)
+
+    def _mount(self, pool_maxsize):
+        # Retries are handled here so they can be jittered and logged
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.pool_maxsize = pool_maxsize
+
+    def resize(self, pool_maxsize):
+        """Change the connection pool size (existing idle connections are dropped)"""
+        if pool_maxsize != self.pool_maxsize:
+            self._mount(pool_maxsize)
+
+    def warm_up(self, force=False):
+        """Visit the warm-up page once so the host sets its session cookies"""
+        if not self.warmup_url:
+            return
+        with self._warm_lock:
+            if self._warmed and not force:
+                return
+            logger.debug(f"Establishing session with {self.name}")
+            try:
+                self._throttle()
+                response = self.session.get(self.warmup_url, timeout=DEFAULT_TIMEOUT)
+                logger.debug(f"Pre-session response status: {response.status_code}")
+                self._warmed = True
+                self.warmups += 1
+            except (requests.exceptions.RequestException, rate_limiter.RateLimitTimeout) as e:
+                logger.error(f"Warm-up request to {self.name} failed: {e}")
+
+    def _throttle(self, level=None, queue_timeout=None):
+        """Wait for the host's request budget (no-op for unlimited hosts)"""
+        if self.limiter is not None:
+            waited = self.limiter.acquire(level, queue_timeout)
+            if waited > 1:
+                logger.debug(f"{self.name} request waited {waited:.1f}s for rate budget")
+
+    def _penalize(self, response):
+        """Back off the whole host after a 429, honouring Retry-After when given in seconds"""
+        if self.limiter is None:
+            return
+        retry_after = response.headers.get('Retry-After')
+        self.limiter.penalize(float(retry_after) if retry_after and retry_after.isdigit() else None)
+
+    def _sleep_before_retry(self, attempt):
+        # Full jitter: spread retries so concurrent callers don't stampede the host
+        delay = random.uniform(0, min(self.backoff_cap, self.backoff * (2 ** attempt)))
+        time.sleep(delay)
+
+    def request(self, method, url, priority=None, queue_timeout=None, **kwargs):
+        """
+        Send a request, retrying transient failures and re-warming cookies on 401/403.
+
+        ``priority`` (a rate_limiter class, default: the calling thread's) and
+        ``queue_timeout`` control how the request waits for the host's rate
+        budget; ``rate_limiter.RateLimitTimeout`` is raised if it never gets one.
+        """
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"{self.name} is unavailable; next trial request in {self.breaker.retry_after():.0f}s")
+        try:
+            response = self._send(method, url, priority, queue_timeout, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            self.breaker.record_failure()
+            raise
+        except Exception:
+            self.breaker.release()
+            raise
+        if response.status_code == 429 or response.status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+
+    def _send(self, method, url, priority, queue_timeout, **kwargs):
+        """The request itself: rate budget, retries with backoff and cookie re-warming"""
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = DEFAULT_TIMEOUT
+        self.warm_up()
+
+        rewarmed = False
+        attempt = 0
+        while True:
+            self._throttle(priority, queue_timeout)
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if attempt >= self.retries:
+                    raise
+                logger.warning(f"{self.name} request failed ({e}), retrying")
+                self._sleep_before_retry(attempt)
+                attempt += 1
+                continue
+
+            if response.status_code in REWARM_STATUS_CODES and self.warmup_url and not rewarmed:
+                logger.info(f"{self.name} answered {response.status_code}, re-warming cookies")
+                response.close()
+                self.warm_up(force=True)
+                rewarmed = True
+                continue
+
+            if response.status_code == 429:
+                self._penalize(response)
+
+            if response.status_code in RETRY_STATUS_CODES and attempt < self.retries:
+                logger.warning(f"{self.name} answered {response.status_code}, retrying")
+                response.close()
+                self._sleep_before_retry(attempt)
+                attempt += 1
+                continue
+
+            return response
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def stats(self):
+        return {
+            'pool_maxsize': self.pool_maxsize,
+            'warmed': self._warmed,
+            'warmups': self.warmups,
+            'rate_limit': self.limiter.stats() if self.limiter else None,
+            'circuit': self.breaker.stats(),
+        }
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(name):
+    """Return the shared client for a host defined in HOSTS"""
+    client = _clients.get(name)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(name)
+            if client is None:
+                client = HostClient(name, **HOSTS[name])
+                _clients[name] = client
+    return client
+
+
+def configure(name, pool_maxsize=None, rate=None, burst=None):
+    """Tune a host's pool size or rate budget before or after the client is created"""
+    if pool_maxsize is not None:
+        HOSTS[name]['pool_maxsize'] = pool_maxsize
+        if name in _clients:
+            _clients[name].resize(pool_maxsize)
+    if rate is not None or burst is not None:
+        if rate is not None:
+            HOSTS[name]['rate'] = rate
+        if burst is not None:
+            HOSTS[name]['burst'] = burst
+        client = _clients.get(name)
+        if client is not None and client.limiter is not None:
+            client.limiter.configure(rate, burst)
+
+
+def chartink():
+    return get_client('chartink')
+
+
+def nse():
+    return get_client('nse')
+
+
+def yahoo():
+    return get_client('yahoo')
+
+
+def stats():
+    return {name: client.stats() for name, client in _clients.items()}
+
+
+def circuits():
+    """Circuit state of every host client created so far"""
+    return {name: client.breaker.stats() for name, client in _clients.items()}
+
+
+def rate_limits():
+    """Remaining request budget and queue depth for every host"""
+    return {name: get_client(name).limiter.stats() for name in HOSTS if HOSTS[name].get('rate')}
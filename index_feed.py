@@ -0,0 +1,231 @@
+"""
+Single background-refreshed feed of NSE's allIndices payload.
+
+The dashboards show the same NSE data three ways: the tracked Nifty indices
+(``/nifty-data``, ``/get_nifty_data``), every index minus bonds/ex-bank
+(``/get-nse-indices``), and plain numeric last prices. ``IndexFeed``
+downloads ``allIndices`` once per interval, parses it once, derives all
+three views from that parse and swaps them in together, so the endpoints
+are memory reads. A failed refresh keeps serving the previous views.
+
+Outside market hours the payload does not change, so the feed slows down
+to ``off_hours_interval``.
+"""
+import logging
+import threading
+import time
+
+import http_client
+import market_schedule
+
+logger = logging.getLogger(__name__)
+
+ALL_INDICES_URL = "https://www.nseindia.com/api/allIndices"
+DEFAULT_INTERVAL = 15  # Seconds between refreshes while the market is open
+OFF_HOURS_INTERVAL = 5 * 60
+FIRST_FETCH_WAIT = 10  # Seconds a reader waits for the background thread's first fetch
+
+# Tracked indices, in display order
+TRACKED_INDICES = (
+    'NIFTY 50',
+    'NIFTY 100',
+    'NIFTY 200',
+    'NIFTY 500',
+    'NIFTY ALPHA 50',
+    'NIFTY BANK',
+    'NIFTY ENERGY',
+    'NIFTY FMCG',
+    'NIFTY HIGH BETA 50',
+    'NIFTY HOUSING',
+    'NIFTY METAL',
+    'NIFTY PRIVATE BANK',
+    'NIFTY PSE',
+    'NIFTY PSU BANK',
+    'NIFTY REALTY',
+    'NIFTY OIL & GAS',
+    'NIFTY PHARMA',
+)
+FULL_EXCLUDED = ('BOND INDEX', 'EX-BANK')
+NUMERIC_EXCLUDED = ('BOND INDEX', 'EX-BANK', 'G-SEC', 'TOTAL MARKET', 'MOMENTUM QUALITY 100', 'VOLATILITY')
+
+
+def display_name(index):
+    """'NIFTY BANK' -> 'Nifty BANK'"""
+    return f"Nifty {index.replace('NIFTY ', '')}"
+
+
+def tracked_view(rows):
+    """
+    Tracked indices with the change since the open.
+
+    Returns:
+    dict: display name -> {'change', 'last', 'open', 'pChange'} as formatted strings
+    """
+    by_name = {row.get('index', '').upper(): row for row in rows}
+    view = {}
+    for index in TRACKED_INDICES:
+        row = by_name.get(index)
+        if not row:
+            continue
+        try:
+            last_price = float(row.get('last', 0))
+            open_price = float(row.get('open', 0))
+        except (TypeError, ValueError) as e:
+            logger.error(f"Error parsing index data for {index}: {e}")
+            continue
+        change = last_price - open_price
+        pct_change = (change / open_price * 100) if open_price != 0 else 0
+        view[display_name(row['index'])] = {
+            "change": f"{change:+.2f}",
+            "last": f"{last_price:,.2f}",
+            "open": f"{open_price:,.2f}",
+            "pChange": f"{pct_change:+.2f}"
+        }
+    return view
+
+
+def full_view(rows):
+    """
+    Every index except bond and ex-bank series.
+
+    Returns:
+    dict: display name -> {'last', 'change', 'pChange'} as formatted strings
+    """
+    view = {}
+    for row in rows:
+        name = row.get('index', '')
+        if any(excluded in name.upper() for excluded in FULL_EXCLUDED):
+            continue
+        try:
+            view[display_name(name)] = {
+                "last": f"{row['last']:,.2f}",
+                "change": f"{row['change']:+.2f}",
+                "pChange": f"{row['percentChange']:+.2f}"
+            }
+        except (KeyError, TypeError, ValueError) as e:
+            logger.error(f"Error parsing index data for {name}: {e}")
+    return view
+
+
+def numeric_view(rows):
+    """
+    Last prices as numbers, without bond, G-Sec, volatility and total-market series.
+
+    Returns:
+    dict: display name -> float
+    """
+    view = {}
+    for row in rows:
+        name = row.get('index', '')
+        if any(excluded in name.upper() for excluded in NUMERIC_EXCLUDED):
+            continue
+        try:
+            view[display_name(name)] = float(row['last'])
+        except (KeyError, TypeError, ValueError) as e:
+            logger.error(f"Error parsing index data for {name}: {e}")
+    return view
+
+
+class IndexFeed:
+    """Fetches allIndices on a schedule and serves the derived views from memory"""
+
+    def __init__(self, interval=DEFAULT_INTERVAL, off_hours_interval=OFF_HOURS_INTERVAL,
+                 calendar=None, on_update=None):
+        self.interval = interval
+        self.off_hours_interval = off_hours_interval
+        self.calendar = calendar or market_schedule.MarketCalendar()
+        self.on_update = on_update  # Called with the feed after each successful refresh
+        self.fetches = 0
+        self.errors = 0
+        self.last_error = None
+        self.fetched_at = None  # time.time() of the views being served
+        self._views = {'tracked': {}, 'full': {}, 'numeric': {}}
+        self._ready = threading.Event()  # Set once the first refresh succeeded
+        self._refresh_lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def refresh(self):
+        """Download and parse allIndices once; returns True if the views were replaced"""
+        with self._refresh_lock:
+            self.fetches += 1
+            try:
+                response = http_client.nse().get(ALL_INDICES_URL)
+                if response.status_code != 200:
+                    raise ValueError(f"status code {response.status_code}")
+                rows = response.json().get('data', [])
+            except Exception as e:
+                self.errors += 1
+                self.last_error = str(e)
+                logger.error(f"Failed to fetch NSE indices: {e}")
+                return False
+            if not rows:
+                self.errors += 1
+                self.last_error = 'empty payload'
+                logger.error("NSE returned no index data")
+                return False
+
+            # Swap all three views in one assignment so readers never mix refreshes
+            self._views = {'tracked': tracked_view(rows), 'full': full_view(rows), 'numeric': numeric_view(rows)}
+            self.fetched_at = time.time()
+            self.last_error = None
+            self._ready.set()
+            logger.debug(f"Refreshed {len(rows)} NSE indices")
+
+        if self.on_update is not None:
+            try:
+                self.on_update(self)
+            except Exception as e:
+                logger.error(f"Index feed update callback failed: {e}")
+        return True
+
+    def _view(self, name):
+        if not self._ready.is_set():
+            if self._thread is not None and self._thread.is_alive():
+                self._ready.wait(FIRST_FETCH_WAIT)
+            else:
+                # Feed not started (e.g. a script): fetch inline
+                self.refresh()
+        return self._views[name]
+
+    def tracked(self):
+        return self._view('tracked')
+
+    def full(self):
+        return self._view('full')
+
+    def numeric(self):
+        return self._view('numeric')
+
+    def current_interval(self):
+        phase = self.calendar.phase()
+        if phase in (market_schedule.OPEN, market_schedule.PRE_OPEN):
+            return self.interval
+        return self.off_hours_interval
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.refresh()
+            self._stop.wait(self.current_interval())
+
+    def start(self):
+        """Start the background refresher (idempotent)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='index-feed', daemon=True)
+        self._thread.start()
+        logger.info("Index feed started")
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        return {
+            'fetches': self.fetches,
+            'errors': self.errors,
+            'last_error': self.last_error,
+            'age': round(time.time() - self.fetched_at, 1) if self.fetched_at else None,
+            'interval': self.current_interval(),
+            'indices': {name: len(view) for name, view in self._views.items()},
+        }
@@ -0,0 +1,333 @@
+"""
+NSE session calendar and market-hours-aware refresh scheduling.
+
+``MarketCalendar`` knows the trading sessions (pre-open 09:00-09:15,
+continuous trading 09:15-15:30 IST) and the exchange holidays listed in
+``nse_holidays.json``. ``RefreshScheduler`` decides which conditions are due
+for a refresh. A condition's results can only change when one of its
+candles closes, so each condition has a refresh period (declared, or the
+finest timeframe its ``scan_clause`` reads) and is refetched once per bar
+close on a grid anchored at the 09:15 open, plus at the open and at the
+15:30 close.
+Nothing is fetched between sessions, on weekends or on holidays. A
+condition that has never been fetched is always due, so the dashboard is
+populated after a restart on any day.
+"""
+from datetime import datetime, time as dtime, timedelta, timezone
+import json
+import logging
+import os
+import re
+
+import scan_clause
+
+logger = logging.getLogger(__name__)
+
+IST = timezone(timedelta(hours=5, minutes=30))
+HOLIDAYS_FILE = 'nse_holidays.json'
+
+PRE_OPEN_START = dtime(9, 0)
+SESSION_OPEN = dtime(9, 15)
+SESSION_CLOSE = dtime(15, 30)
+POST_CLOSE_END = dtime(16, 0)
+
+# Session phases
+HOLIDAY = 'holiday'
+WEEKEND = 'weekend'
+PRE_MARKET = 'pre-market'
+PRE_OPEN = 'pre-open'
+OPEN = 'open'
+POST_CLOSE = 'post-close'
+CLOSED = 'closed'
+
+DAILY_PERIOD = 60  # Minutes between refreshes of daily scans while the day's candle is forming
+CANDLE_SETTLE = 15  # Seconds after a candle closes before Chartink reflects it
+DEFAULT_INTERVAL = 120  # Seconds, for conditions without a known timeframe
+PRE_OPEN_INTERVAL = 300
+RETRY_INTERVAL = 30  # Seconds before a failed condition is tried again
+OFF_HOURS_INTERVAL = 30 * 60
+MAX_SLEEP = 15 * 60  # The updater re-evaluates at least this often
+
+
+def now_ist():
+    return datetime.now(IST)
+
+
+def timeframe_minutes(timeframe):
+    """'15 minute' -> 15; daily and longer timeframes -> None"""
+    match = re.match(r'(\d+) minute$', timeframe or '')
+    return int(match.group(1)) if match else None
+
+
+def infer_timeframe(condition):
+    """
+    The finest timeframe a condition reads, from its scan_clause or else its
+    chart_link (``timeframe=30_minute``).
+
+    Returns:
+    str: e.g. '5 minute' or 'daily', or None if neither is conclusive
+    """
+    clause = condition.get('scan_clause')
+    if clause:
+        try:
+            found = scan_clause.timeframes(clause)
+        except scan_clause.ScanClauseError as e:
+            logger.debug(f"Cannot infer timeframe of {condition.get('name')}: {e}")
+            found = set()
+        if found:
+            return min(found, key=lambda timeframe: timeframe_minutes(timeframe) or float('inf'))
+    match = re.search(r'[?&]timeframe=(\d+)_minute|[?&]timeframe=(daily)', condition.get('chart_link', ''))
+    if match:
+        return f"{match.group(1)} minute" if match.group(1) else scan_clause.DAILY
+    return None
+
+
+def today_ist():
+    return now_ist().date()
+
+
+class MarketCalendar:
+    """NSE trading days and session phases"""
+
+    def __init__(self, holidays_file=HOLIDAYS_FILE):
+        self.holidays_file = holidays_file
+        self.holidays = {}  # date -> description
+        self.years = set()  # Years the holiday file has a list for
+        self._warned_years = set()
+        self.load()
+
+    def load(self):
+        """
+        (Re)read the holiday list; a missing file means no holidays are known.
+        Warns when the current year has no list.
+        """
+        self.holidays = {}
+        self.years = set()
+        self._warned_years = set()
+        if not os.path.exists(self.holidays_file):
+            logger.warning(f"{self.holidays_file} not found; only weekends are treated as closed")
+            return
+        try:
+            with open(self.holidays_file, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not read {self.holidays_file}: {e}")
+            return
+        for year, year_holidays in data.get('holidays', {}).items():
+            self.years.add(int(year))
+            for entry in year_holidays:
+                day = datetime.strptime(entry['date'], '%Y-%m-%d').date()
+                self.holidays[day] = entry.get('description', '')
+        logger.info(f"Loaded {len(self.holidays)} NSE holidays for {', '.join(map(str, sorted(self.years)))}")
+        self.check_year(today_ist().year)
+
+    def check_year(self, year):
+        """
+        Warn (once per year) when the holiday file has no list for ``year``;
+        its holidays would otherwise be reported as trading days.
+
+        Returns:
+        bool: True if the year is covered
+        """
+        if year in self.years:
+            return True
+        if year not in self._warned_years:
+            self._warned_years.add(year)
+            logger.warning(f"{self.holidays_file} has no NSE holidays for {year}; only weekends are treated as "
+                           f"closed. Add the year's list from the NSE trading holidays circular.")
+        return False
+
+    def is_trading_day(self, day):
+        return day.weekday() < 5 and day not in self.holidays
+
+    def phase(self, now=None):
+        now = (now or now_ist()).astimezone(IST)
+        day, clock = now.date(), now.time()
+        if day.weekday() >= 5:
+            return WEEKEND
+        self.check_year(day.year)
+        if day in self.holidays:
+            return HOLIDAY
+        if clock < PRE_OPEN_START:
+            return PRE_MARKET
+        if clock < SESSION_OPEN:
+            return PRE_OPEN
+        if clock < SESSION_CLOSE:
+            return OPEN
+        if clock < POST_CLOSE_END:
+            return POST_CLOSE
+        return CLOSED
+
+    def is_open(self, now=None):
+        return self.phase(now) == OPEN
+
+    def session_open(self, day):
+        return datetime.combine(day, SESSION_OPEN, IST)
+
+    def session_close(self, day):
+        return datetime.combine(day, SESSION_CLOSE, IST)
+
+    def next_bar_boundary(self, period, moment):
+        """
+        First candle boundary strictly after ``moment`` for bars of
+        ``period`` minutes anchored at the session open. The open itself
+        counts (a new candle starts) and the last bar of a session closes at
+        15:30 even when it is shorter.
+        """
+        moment = moment.astimezone(IST)
+        day = moment.date()
+        if not self.is_trading_day(day) or moment >= self.session_close(day):
+            return self.session_open(self.next_trading_day(day))
+        opened = self.session_open(day)
+        if moment < opened:
+            return opened
+        bars = int((moment - opened).total_seconds() // (period * 60)) + 1
+        return min(opened + timedelta(minutes=period * bars), self.session_close(day))
+
+    def next_trading_day(self, day):
+        day += timedelta(days=1)
+        while not self.is_trading_day(day):
+            day += timedelta(days=1)
+        return day
+
+    def next_transition(self, now=None):
+        """The next moment the phase can change (a session boundary or midnight)"""
+        now = (now or now_ist()).astimezone(IST)
+        for boundary in (PRE_OPEN_START, SESSION_OPEN, SESSION_CLOSE, POST_CLOSE_END):
+            moment = datetime.combine(now.date(), boundary, IST)
+            if moment > now:
+                return moment
+        return datetime.combine(now.date() + timedelta(days=1), dtime(0, 0), IST)
+
+
+class RefreshScheduler:
+    """
+    Tracks when each condition was last fetched and which ones are due.
+
+    A condition may declare ``refresh_period`` (minutes) or ``timeframe``
+    (e.g. '15 minute' or 'daily'); otherwise the timeframe is inferred from
+    its scan_clause or chart_link. Conditions whose timeframe cannot be
+    determined fall back to ``default_interval`` while the market is open
+    and ``off_hours_interval`` outside it.
+    """
+
+    def __init__(self, calendar=None, default_interval=DEFAULT_INTERVAL,
+                 off_hours_interval=OFF_HOURS_INTERVAL, daily_period=DAILY_PERIOD, settle=CANDLE_SETTLE):
+        self.calendar = calendar or MarketCalendar()
+        self.default_interval = default_interval
+        self.off_hours_interval = off_hours_interval
+        self.daily_period = daily_period
+        self.settle = timedelta(seconds=settle)
+        self._timeframes = {}  # (name, scan_clause, chart_link) -> inferred timeframe
+        self.last_refresh = {}  # condition name -> aware datetime of the last fetch
+        self.retry_at = {}  # condition name -> when a failed fetch is tried again
+        self.fetches = 0
+        self.skipped = 0  # Condition checks that did not need a fetch
+
+    def timeframe(self, condition):
+        if condition.get('timeframe'):
+            return condition['timeframe']
+        key = (condition['name'], condition.get('scan_clause'), condition.get('chart_link'))
+        if key not in self._timeframes:
+            self._timeframes[key] = infer_timeframe(condition)
+        return self._timeframes[key]
+
+    def period(self, condition):
+        """Minutes between the candle closes that can change the condition's results, or None if unknown"""
+        if condition.get('refresh_period'):
+            return int(condition['refresh_period'])
+        timeframe = self.timeframe(condition)
+        if timeframe is None:
+            return None
+        return timeframe_minutes(timeframe) or self.daily_period
+
+    def interval(self, condition, now=None):
+        """Fallback seconds between refreshes for a condition without a period, or None when the market is shut"""
+        phase = self.calendar.phase(now)
+        if phase in (HOLIDAY, WEEKEND):
+            return None
+        if phase == OPEN:
+            return self.default_interval
+        if phase == PRE_OPEN:
+            return PRE_OPEN_INTERVAL
+        return self.off_hours_interval
+
+    def _due_at(self, condition, now):
+        """When the condition next needs a fetch, or None if not before the market reopens"""
+        last = self.last_refresh.get(condition['name'])
+        retry = self.retry_at.get(condition['name'])
+        if last is None:
+            return retry or now
+        period = self.period(condition)
+        if period is not None:
+            # The first bar boundary the last fetch could not have seen yet
+            due = self.calendar.next_bar_boundary(period, last - self.settle) + self.settle
+        else:
+            interval = self.interval(condition, now)
+            if interval is None:
+                return retry
+            due = last + timedelta(seconds=interval)
+            if self.calendar.phase(now) in (POST_CLOSE, CLOSED):
+                # One pass after the bell picks up closing prices
+                close = self.calendar.session_close(now.date())
+                if last < close:
+                    due = min(due, close)
+        if retry is not None:
+            due = min(due, retry)
+        return due
+
+    def is_due(self, condition, now=None):
+        now = now or now_ist()
+        due = self._due_at(condition, now)
+        return due is not None and due <= now
+
+    def due(self, conditions, now=None):
+        """Conditions that should be fetched now"""
+        now = now or now_ist()
+        due = [condition for condition in conditions if self.is_due(condition, now)]
+        self.skipped += len(conditions) - len(due)
+        return due
+
+    def mark_refreshed(self, names, now=None):
+        now = now or now_ist()
+        for name in names:
+            self.last_refresh[name] = now
+            self.retry_at.pop(name, None)
+        self.fetches += len(names)
+
+    def mark_failed(self, names, now=None, delay=RETRY_INTERVAL):
+        """Schedule a retry for conditions whose fetch failed"""
+        retry = (now or now_ist()) + timedelta(seconds=delay)
+        for name in names:
+            self.retry_at[name] = retry
+
+    def next_wake(self, conditions, now=None):
+        """Seconds the updater can sleep before something may be due"""
+        now = now or now_ist()
+        wake = min(self.calendar.next_transition(now), now + timedelta(seconds=MAX_SLEEP))
+        for condition in conditions:
+            due = self._due_at(condition, now)
+            if due is not None and due < wake:
+                wake = due
+        return max(1.0, (wake - now).total_seconds())
+
+    def status(self, conditions, now=None):
+        now = now or now_ist()
+        per_condition = {}
+        for condition in conditions:
+            name = condition['name']
+            due = self._due_at(condition, now)
+            per_condition[name] = {
+                'timeframe': self.timeframe(condition),
+                'period': self.period(condition),
+                'next_due': due.isoformat() if due is not None else None,
+                'last_refresh': self.last_refresh[name].isoformat() if name in self.last_refresh else None,
+                'retry_at': self.retry_at[name].isoformat() if name in self.retry_at else None,
+            }
+        return {
+            'phase': self.calendar.phase(now),
+            'fetches': self.fetches,
+            'skipped': self.skipped,
+            'next_wake': round(self.next_wake(conditions, now), 1),
+            'conditions': per_condition,
+        }
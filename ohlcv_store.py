@@ -0,0 +1,410 @@
+"""
+Columnar OHLCV store backed by memory-mapped files.
+
+Each timeframe is a directory holding one contiguous array per field
+(float64, NaN where a symbol has no bar) laid out bars x symbols, plus an
+int64 timestamp column and a small ``meta.json`` with the symbol index and the
+number of committed bars::
+
+    store/daily/meta.json
+    store/daily/timestamps.i8
+    store/daily/close.f8
+    store/daily/volume.f8
+    ...
+
+Files are preallocated in chunks of bars, so a daily append writes one new
+row at the end of every file and never touches history. A bar older than
+the last one (a backfill) is inserted in date order by copying the table
+into a new generation of files (``close.g1.f8``, ...) with the new rows in
+place; ``upsert_many`` copies once for a whole range. Readers in any process
+open the files read-only and get zero-copy NumPy views (and pandas frames
+over them); ``meta.json`` is replaced only after the data is flushed and
+names the generation to map, so a reader never sees a partly written bar or
+rows moving under its views. Views held across a backfill keep showing the
+table as it was; call ``refresh`` and slice again to see the new bars. The
+previous generation is deleted once the new one is published (on Windows,
+where a mapped file cannot be deleted, after a later write).
+"""
+import glob
+import json
+import logging
+import os
+import re
+import threading
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ROOT = 'store'
+PRICE_FIELDS = ('open', 'high', 'low', 'close')
+FIELDS = PRICE_FIELDS + ('volume',)
+DTYPES = {'open': np.float64, 'high': np.float64, 'low': np.float64, 'close': np.float64, 'volume': np.float64}
+ROW_CHUNK = 256  # Bars added to the files each time they grow
+SYMBOL_CAPACITY = 2048  # Columns allocated up front; exceeding it rewrites the files once with double the room
+LAYOUT_KEYS = ('generation', 'row_capacity', 'symbol_capacity')  # meta.json keys that change the files to map
+
+
+def _suffix(dtype):
+    return 'i8' if np.dtype(dtype) == np.int64 else 'f8'
+
+
+def _to_ns(timestamp):
+    return pd.Timestamp(timestamp).value
+
+
+class OhlcvTable:
+    """Bars x symbols arrays for one timeframe"""
+
+    def __init__(self, path, readonly=False):
+        self.path = path
+        self.readonly = readonly
+        self._lock = threading.Lock()
+        self._arrays = {}
+        if not os.path.exists(self._meta_path):
+            if readonly:
+                raise FileNotFoundError(f"No OHLCV table at {path}")
+            os.makedirs(path, exist_ok=True)
+            self._meta = {'rows': 0, 'row_capacity': 0, 'symbol_capacity': SYMBOL_CAPACITY, 'symbols': [],
+                          'generation': 0}
+            self._grow_rows(ROW_CHUNK)
+            self._write_meta()
+        self.refresh()
+
+    @property
+    def _meta_path(self):
+        return os.path.join(self.path, 'meta.json')
+
+    def _file(self, name, dtype, generation=None):
+        if generation is None:
+            generation = self._meta.get('generation', 0)
+        tag = f".g{generation}" if generation else ''
+        return os.path.join(self.path, f"{name}{tag}.{_suffix(dtype)}")
+
+    @staticmethod
+    def _columns():
+        """(name, dtype) of every file in a generation"""
+        return [('timestamps', np.int64)] + [(field, DTYPES[field]) for field in FIELDS]
+
+    def _write_meta(self):
+        tmp_path = f"{self._meta_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self._meta, f)
+        os.replace(tmp_path, self._meta_path)
+
+    def _map(self):
+        """(Re)open the memory maps of the current generation at the current capacity"""
+        mode = 'r' if self.readonly else 'r+'
+        rows, columns = self._meta['row_capacity'], self._meta['symbol_capacity']
+        arrays = {}
+        for name, dtype in self._columns():
+            shape = (rows,) if name == 'timestamps' else (rows, columns)
+            arrays[name] = np.memmap(self._file(name, dtype), dtype=dtype, mode=mode, shape=shape)
+        self._arrays = arrays
+
+    def refresh(self):
+        """Pick up bars and symbols committed by a writer (possibly in another process)"""
+        with open(self._meta_path, 'r') as f:
+            meta = json.load(f)
+        remap = not self._arrays or any(meta.get(key, 0) != self._meta.get(key, 0) for key in LAYOUT_KEYS)
+        self._meta = meta
+        self.symbols = list(meta['symbols'])
+        self.symbol_index = {symbol: i for i, symbol in enumerate(self.symbols)}
+        if remap:
+            try:
+                self._map()
+            except FileNotFoundError:
+                # A writer published a newer generation and deleted this one after meta.json was read
+                self._arrays = {}
+                self.refresh()
+
+    def __len__(self):
+        return self._meta['rows']
+
+    @property
+    def timestamps(self):
+        return self._arrays['timestamps'][:len(self)]
+
+    @property
+    def index(self):
+        return pd.to_datetime(self.timestamps)
+
+    def column(self, field):
+        """Zero-copy bars x symbols view of one field"""
+        return self._arrays[field][:len(self), :len(self.symbols)]
+
+    def series(self, field, symbol):
+        """Zero-copy (strided) view of one symbol's history"""
+        return self._arrays[field][:len(self), self.symbol_index[symbol]]
+
+    def locate(self, timestamp):
+        """Row of a timestamp, or None if the store has no bar at that time"""
+        value = _to_ns(timestamp)
+        row = int(np.searchsorted(self.timestamps, value))
+        return row if row < len(self) and self.timestamps[row] == value else None
+
+    def frame(self, field, start=None, end=None):
+        """DataFrame over the stored field without copying, optionally limited to [start, end]"""
+        timestamps = self.timestamps
+        lo = int(np.searchsorted(timestamps, _to_ns(start))) if start is not None else 0
+        hi = int(np.searchsorted(timestamps, _to_ns(end), side='right')) if end is not None else len(self)
+        return pd.DataFrame(self.column(field)[lo:hi], index=pd.to_datetime(timestamps[lo:hi]),
+                            columns=self.symbols, copy=False)
+
+    # --- Writing --------------------------------------------------------------
+
+    def _grow_rows(self, row_capacity):
+        """Extend every file at the end; existing bytes are left in place"""
+        columns = self._meta['symbol_capacity']
+        with open(self._file('timestamps', np.int64), 'ab') as f:
+            f.truncate(row_capacity * 8)
+        for field in FIELDS:
+            with open(self._file(field, DTYPES[field]), 'ab') as f:
+                f.truncate(row_capacity * columns * np.dtype(DTYPES[field]).itemsize)
+        self._meta['row_capacity'] = row_capacity
+        self._map()
+
+    def _rewrite(self, row_capacity, symbol_capacity, positions=()):
+        """
+        Copy the committed bars into a new generation of files, leaving one
+        empty row before each of the stored rows in ``positions``; caller
+        holds the lock.
+
+        The new generation is published with the next ``meta.json``; until
+        then readers keep mapping the previous one, which is never modified.
+        """
+        rows = len(self)
+        generation = self._meta.get('generation', 0) + 1
+        # Block k of the stored rows moves down by the k new rows before it
+        bounds = [0] + [int(position) for position in positions] + [rows]
+        arrays = {}
+        for name, dtype in self._columns():
+            source = self._arrays[name]
+            shape = (row_capacity,) if name == 'timestamps' else (row_capacity, symbol_capacity)
+            target = np.memmap(self._file(name, dtype, generation), dtype=dtype, mode='w+', shape=shape)
+            for shift in range(len(bounds) - 1):
+                start, end = bounds[shift], bounds[shift + 1]
+                if start < end and name == 'timestamps':
+                    target[start + shift:end + shift] = source[start:end]
+                elif start < end:
+                    target[start + shift:end + shift, :source.shape[1]] = source[start:end]
+            if name != 'timestamps':
+                target[:, source.shape[1]:] = np.nan
+            arrays[name] = target
+        self._arrays = arrays
+        self._meta.update(generation=generation, row_capacity=row_capacity, symbol_capacity=symbol_capacity)
+
+    def _sweep(self):
+        """Delete the files of generations meta.json no longer names"""
+        current = {self._file(name, dtype) for name, dtype in self._columns()}
+        for path in glob.glob(os.path.join(self.path, '*.[fi]8')):
+            if path in current:
+                continue
+            try:
+                os.remove(path)
+            except OSError as e:
+                # Still mapped by a reader on Windows; retried after the next write
+                logger.debug(f"Keeping {path} for now: {e}")
+
+    def _grow_symbols(self, symbol_capacity):
+        """Rewrite the files with more columns; only happens when the universe outgrows the capacity"""
+        logger.info(f"Growing {self.path} from {self._meta['symbol_capacity']} to {symbol_capacity} symbols")
+        self._rewrite(self._meta['row_capacity'], symbol_capacity)
+
+    def _add_symbols(self, symbols):
+        new = [symbol for symbol in dict.fromkeys(symbols) if symbol not in self.symbol_index]
+        if not new:
+            return
+        needed = len(self.symbols) + len(new)
+        if needed > self._meta['symbol_capacity']:
+            capacity = self._meta['symbol_capacity']
+            while capacity < needed:
+                capacity *= 2
+            self._grow_symbols(capacity)
+        start = len(self.symbols)
+        for field in FIELDS:
+            # Bars stored before the symbol existed are missing (NaN), not zero
+            self._arrays[field][:len(self), start:needed] = np.nan
+        self.symbols.extend(new)
+        self.symbol_index.update((symbol, start + i) for i, symbol in enumerate(new))
+
+    def _make_room(self, values, rows):
+        """
+        Open empty rows for new timestamps, keeping the table in date order;
+        caller holds the lock.
+
+        Bars newer than the stored ones are appended in place. A backfill
+        copies the table once into a new generation, each block of stored
+        bars moved down by the number of new timestamps before it, so a batch
+        of backfilled days costs one copy of the history rather than one per
+        day, and readers of the old generation never see rows move.
+
+        Returns:
+        numpy.ndarray: the row of each of the sorted new ``values``
+        """
+        capacity = self._meta['row_capacity']
+        while capacity < rows + len(values):
+            capacity += ROW_CHUNK
+        positions = np.searchsorted(self._arrays['timestamps'][:rows], values)
+        if positions[0] < rows:
+            logger.info(f"Backfilling {len(values)} bars into {self.path}: copying {rows} stored bars to a new generation")
+            self._rewrite(capacity, self._meta['symbol_capacity'], positions)
+        elif capacity > self._meta['row_capacity']:
+            self._grow_rows(capacity)
+        targets = positions + np.arange(len(values))
+        self._arrays['timestamps'][targets] = values
+        for field in FIELDS:
+            self._arrays[field][targets, :] = np.nan
+        return targets
+
+    def upsert(self, timestamp, bars):
+        """
+        Write one bar for many symbols.
+
+        A timestamp newer than the last bar is appended as a new row; an
+        existing timestamp is updated in place (fields not given are kept).
+        An earlier timestamp is inserted in date order, which rewrites the
+        table into a new generation of files.
+
+        Args:
+            timestamp: bar time (anything pandas.Timestamp accepts)
+            bars: {symbol: {field: value}}
+
+        Returns:
+        int: the row written
+        """
+        return self.upsert_many({timestamp: bars})[_to_ns(timestamp)]
+
+    def upsert_many(self, bars_by_time):
+        """
+        Write bars for several timestamps at once, e.g. a backfilled range.
+
+        Same rules as ``upsert``, but the history is copied once for the
+        whole batch and the data is flushed and published once.
+
+        Args:
+            bars_by_time: {timestamp: {symbol: {field: value}}}
+
+        Returns:
+        dict: nanosecond timestamp -> row written
+        """
+        if self.readonly:
+            raise PermissionError("Table is opened read-only")
+        batch = {}
+        for timestamp, bars in bars_by_time.items():
+            batch.setdefault(_to_ns(timestamp), []).append(bars)
+        with self._lock:
+            rows = len(self)
+            for bar_sets in batch.values():
+                for bars in bar_sets:
+                    self._add_symbols(bars)
+            new = np.array(sorted(value for value in batch if self.locate(value) is None), dtype=np.int64)
+            if len(new):
+                self._make_room(new, rows)
+            # Rows as they are after the move, looked up before the new rows are published
+            stamps = self._arrays['timestamps'][:rows + len(new)]
+            written = {value: int(np.searchsorted(stamps, value)) for value in batch}
+
+            for value, bar_sets in batch.items():
+                row = written[value]
+                for bars in bar_sets:
+                    for symbol, fields in bars.items():
+                        column = self.symbol_index[symbol]
+                        for field, field_value in fields.items():
+                            if field in DTYPES and field_value is not None:
+                                self._arrays[field][row, column] = field_value
+
+            for array in self._arrays.values():
+                array.flush()
+            # Publish only after the data is on disk
+            self._meta['rows'] = rows + len(new)
+            self._meta['symbols'] = list(self.symbols)
+            self._write_meta()
+            self._sweep()
+            return written
+
+
+class OhlcvStore:
+    """Directory of OhlcvTables, one per timeframe"""
+
+    def __init__(self, root=DEFAULT_ROOT, readonly=False):
+        self.root = root
+        self.readonly = readonly
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _slug(timeframe):
+        return timeframe.replace(' ', '_')
+
+    def timeframes(self):
+        paths = glob.glob(os.path.join(self.root, '*', 'meta.json'))
+        return sorted(os.path.basename(os.path.dirname(path)).replace('_', ' ') for path in paths)
+
+    def table(self, timeframe):
+        with self._lock:
+            table = self._tables.get(timeframe)
+            if table is None:
+                table = OhlcvTable(os.path.join(self.root, self._slug(timeframe)), readonly=self.readonly)
+                self._tables[timeframe] = table
+            return table
+
+    def upsert(self, timeframe, timestamp, bars):
+        return self.table(timeframe).upsert(timestamp, bars)
+
+    def upsert_many(self, timeframe, bars_by_time):
+        return self.table(timeframe).upsert_many(bars_by_time)
+
+    def panel(self, timeframes=None, start=None, end=None, universes=None):
+        """Build a scan_clause.OhlcvPanel over the stored data"""
+        from scan_clause import OhlcvPanel
+
+        frames = {}
+        for timeframe in timeframes or self.timeframes():
+            table = self.table(timeframe)
+            table.refresh()
+            frames[timeframe] = {field: table.frame(field, start, end) for field in FIELDS}
+        return OhlcvPanel(frames, universes)
+
+
+_VOLUME_FILE_RE = re.compile(r'^(?:yesterday_)?volume_(?P<symbol>.+)_(?P<date>\d{8})\.json$')
+
+
+def migrate_volume_cache(store, cache_dir='cache'):
+    """
+    Load the per-symbol, per-day volume JSON files from ``cache_dir`` into
+    the store's daily table.
+
+    Both ``volume_<SYMBOL>_<YYYYMMDD>.json`` and
+    ``yesterday_volume_<SYMBOL>_<YYYYMMDD>.json`` hold the daily volume of
+    SYMBOL on that date. Days missing from the table are inserted in date
+    order; the JSON files are left untouched.
+
+    Returns:
+    int: Number of symbol-days written
+    """
+    by_date = {}
+    for path in glob.glob(os.path.join(cache_dir, '*.json')):
+        match = _VOLUME_FILE_RE.match(os.path.basename(path))
+        if not match:
+            continue
+        try:
+            with open(path, 'r') as f:
+                volume = json.load(f).get('volume')
+        except (OSError, ValueError) as e:
+            logger.warning(f"Skipping {path}: {e}")
+            continue
+        if volume is None:
+            continue
+        by_date.setdefault(match.group('date'), {})[match.group('symbol')] = {'volume': int(volume)}
+
+    store.upsert_many('daily', {pd.Timestamp(date): volumes for date, volumes in by_date.items()})
+    written = sum(len(volumes) for volumes in by_date.values())
+    logger.info(f"Migrated {written} cached volumes from {cache_dir} into {store.root}")
+    return written
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    migrate_volume_cache(OhlcvStore())
@@ -0,0 +1,152 @@
+"""
+Top-k ranking of Chartink scan rows.
+
+Every condition keeps only its ten best rows by ``potential_score``
+(``per_chg * close``). Building a DataFrame, coercing columns and fully
+sorting it 25+ times per cycle to pick ten rows is mostly overhead, so
+``rank`` reads the two numeric columns straight into NumPy arrays,
+selects the top k with ``argpartition`` and only orders those k. Bearish scans (``ASCENDING_CONDITIONS``) rank the lowest scores first.
+
+Only the fields the dashboards read are emitted. Rows whose price or
+change cannot be parsed have no score and are dropped: the payloads are
+JSON, which has no NaN the browser can parse.
+
+Run ``python ranking.py`` for a microbenchmark against the pandas path.
+"""
+from operator import itemgetter
+import logging
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+TOP_K = 10  # Rows kept per condition
+ASCENDING_CONDITIONS = frozenset({'HARSH SELL STOCKS', 'STRONG STOCKS NEGATIVE'})  # Lowest score first
+TEXT_FIELDS = ('nsecode', 'name')  # Copied from the Chartink row as-is
+BENCHMARK_SIZES = (10, 500, 3000)
+
+_CLOSE = itemgetter('close')
+_PER_CHG = itemgetter('per_chg')
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def parse_rows(rows):
+    """
+    Parse close and per_chg out of Chartink rows straight into arrays.
+
+    Returns:
+    tuple: (close, per_chg) float64 arrays aligned with rows
+    """
+    count = len(rows)
+    try:
+        return (np.fromiter(map(_CLOSE, rows), np.float64, count),
+                np.fromiter(map(_PER_CHG, rows), np.float64, count))
+    except (KeyError, TypeError, ValueError):
+        # Missing or malformed values: parse field by field, NaN for the bad ones
+        return (np.fromiter((_number(row.get('close')) for row in rows), np.float64, count),
+                np.fromiter((_number(row.get('per_chg')) for row in rows), np.float64, count))
+
+
+def top_k(scores, k=TOP_K, ascending=False):
+    """
+    Indices of the k best scores, best first; NaN scores rank last.
+
+    Returns:
+    numpy.ndarray: row indices
+    """
+    keys = scores if ascending else -scores
+    if len(keys) > k:
+        # argpartition places NaN at the end, like a full sort would
+        candidates = np.argpartition(keys, k - 1)[:k]
+    else:
+        candidates = np.arange(len(keys))
+    return candidates[np.argsort(keys[candidates], kind='stable')]
+
+
+def rank(rows, condition_name=None, k=TOP_K):
+    """
+    The top k Chartink rows of a condition by potential_score.
+
+    Returns:
+    list: dicts with nsecode, name, close, per_chg, volume and potential_score;
+    rows without a finite score are left out
+    """
+    if not rows:
+        return []
+    close, per_chg = parse_rows(rows)
+    scores = per_chg * close
+    scored = np.flatnonzero(np.isfinite(scores))
+    ranked = []
+    for i in scored[top_k(scores[scored], k, condition_name in ASCENDING_CONDITIONS)]:
+        row = rows[i]
+        stock = {field: row.get(field) for field in TEXT_FIELDS}
+        stock['close'] = float(close[i])
+        stock['per_chg'] = float(per_chg[i])
+        stock['volume'] = row.get('volume')
+        stock['potential_score'] = float(scores[i])
+        ranked.append(stock)
+    return ranked
+
+
+def _pandas_rank(rows, condition_name=None, k=TOP_K):
+    """The DataFrame path rank() replaced, kept for the benchmark"""
+    import pandas as pd
+    stock_list = pd.DataFrame(rows)
+    if stock_list.empty:
+        return []
+    stock_list["per_chg"] = pd.to_numeric(stock_list["per_chg"])
+    stock_list["potential_score"] = stock_list["per_chg"] * stock_list["close"]
+    ascending = condition_name in ASCENDING_CONDITIONS
+    return stock_list.sort_values(by="potential_score", ascending=ascending).head(k).to_dict('records')
+
+
+def sample_rows(count, seed=0):
+    """Synthetic Chartink rows (per_chg as a string, like the API sends it)"""
+    rng = np.random.default_rng(seed)
+    closes = rng.uniform(10, 2000, count).round(2)
+    changes = rng.normal(0, 3, count).round(2)
+    volumes = rng.integers(1_000, 5_000_000, count)
+    return [
+        {'sr': i + 1, 'nsecode': f"SYM{i}", 'name': f"Symbol {i}", 'bsecode': str(500000 + i),
+         'per_chg': f"{changes[i]:.2f}", 'close': float(closes[i]), 'volume': int(volumes[i])}
+        for i in range(count)
+    ]
+
+
+def benchmark(sizes=BENCHMARK_SIZES, repeat=200):
+    """
+    Time rank() against the pandas path for each row count.
+
+    Returns:
+    dict: row count -> {'pandas_us', 'numpy_us', 'speedup'}
+    """
+    results = {}
+    for size in sizes:
+        rows = sample_rows(size)
+        timings = {}
+        for label, ranker in (('pandas_us', _pandas_rank), ('numpy_us', rank)):
+            ranker(rows)  # Warm up
+            started = time.perf_counter()
+            for _ in range(repeat):
+                ranker(rows)
+            timings[label] = (time.perf_counter() - started) / repeat * 1e6
+        results[size] = {
+            'pandas_us': round(timings['pandas_us'], 1),
+            'numpy_us': round(timings['numpy_us'], 1),
+            'speedup': round(timings['pandas_us'] / timings['numpy_us'], 1),
+        }
+    return results
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    for size, timing in benchmark().items():
+        logger.info(f"{size:>5} rows: pandas {timing['pandas_us']:>9.1f}us  numpy {timing['numpy_us']:>8.1f}us  "
+                    f"x{timing['speedup']}")
@@ -0,0 +1,185 @@
+"""
+Per-host token-bucket rate limiting with priority classes.
+
+Each upstream host gets a ``RateLimiter``: a bucket refilled at ``rate``
+tokens per second that holds at most ``burst`` tokens. Every HTTP request
+takes one token. Requests that find the bucket empty join a priority queue
+and are served in order: a user-triggered refresh (``INTERACTIVE``) goes
+ahead of background polling (``BACKGROUND``), and requests of the same
+class go first come, first served. A queued request that cannot get a
+token before its deadline gives up with ``RateLimitTimeout`` instead of
+piling onto an already saturated host.
+
+When a host answers 429 anyway, ``penalize`` empties the bucket and pauses
+it for the Retry-After period.
+
+The priority of requests made by the current thread is set with::
+
+    with rate_limiter.priority(rate_limiter.INTERACTIVE):
+        ...
+"""
+from contextlib import contextmanager
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Priority classes; lower is served first
+INTERACTIVE = 0
+BACKGROUND = 1
+PRIORITY_NAMES = {INTERACTIVE: 'interactive', BACKGROUND: 'background'}
+
+DEFAULT_QUEUE_TIMEOUT = 30  # Seconds a request may wait for a token
+DEFAULT_PENALTY = 10  # Seconds to pause after a 429 without Retry-After
+
+_local = threading.local()
+
+
+class RateLimitTimeout(Exception):
+    """Raised when a request's deadline passes while it waits for a token"""
+
+
+@contextmanager
+def priority(level):
+    """Run the enclosed requests (made by this thread) at the given priority"""
+    previous = getattr(_local, 'priority', None)
+    _local.priority = level
+    try:
+        yield
+    finally:
+        _local.priority = previous
+
+
+def current_priority():
+    level = getattr(_local, 'priority', None)
+    return BACKGROUND if level is None else level
+
+
+class RateLimiter:
+    """Token bucket with a deadline-aware priority queue of waiters"""
+
+    def __init__(self, name, rate, burst, queue_timeout=DEFAULT_QUEUE_TIMEOUT):
+        self.name = name
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.queue_timeout = queue_timeout
+        self.tokens = float(burst)
+        self.granted = {level: 0 for level in PRIORITY_NAMES}
+        self.waited = 0  # Requests that had to queue
+        self.wait_time = 0.0  # Total seconds spent queueing
+        self.expired = 0  # Requests that gave up at their deadline
+        self.throttled = 0  # 429 answers reported through penalize()
+        self.paused_until = 0.0  # monotonic time before which no tokens are handed out
+        self._updated = time.monotonic()
+        self._queue = []  # heap of (priority, seq, deadline)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def configure(self, rate=None, burst=None):
+        with self._cond:
+            self._refill()
+            if rate is not None:
+                self.rate = float(rate)
+            if burst is not None:
+                self.burst = float(burst)
+                self.tokens = min(self.tokens, self.burst)
+            self._cond.notify_all()
+
+    def _refill(self):
+        """Add the tokens earned since the last refill; caller holds the lock"""
+        now = time.monotonic()
+        if now > self.paused_until:
+            earned_from = max(self._updated, self.paused_until)
+            self.tokens = min(self.burst, self.tokens + (now - earned_from) * self.rate)
+        self._updated = now
+
+    def _until_token(self):
+        """Seconds until one token is available; caller holds the lock"""
+        now = time.monotonic()
+        if now < self.paused_until:
+            return self.paused_until - now + max(0.0, 1 - self.tokens) / self.rate
+        return max(0.0, 1 - self.tokens) / self.rate
+
+    def acquire(self, level=None, timeout=None):
+        """
+        Take one token, waiting behind higher-priority and earlier requests.
+
+        Args:
+            level: priority class (default: the current thread's priority)
+            timeout: seconds to wait before giving up (default: queue_timeout)
+
+        Returns:
+        float: seconds spent waiting
+
+        Raises:
+        RateLimitTimeout: if no token became available in time
+        """
+        level = current_priority() if level is None else level
+        timeout = self.queue_timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+        with self._cond:
+            self._refill()
+            if not self._queue and self.tokens >= 1:
+                self.tokens -= 1
+                self.granted[level] += 1
+                return 0.0
+
+            entry = (level, next(self._seq), deadline)
+            heapq.heappush(self._queue, entry)
+            self.waited += 1
+            try:
+                while True:
+                    self._refill()
+                    if self._queue[0] is entry and self.tokens >= 1:
+                        heapq.heappop(self._queue)
+                        self.tokens -= 1
+                        self.granted[level] += 1
+                        waited = time.monotonic() - started
+                        self.wait_time += waited
+                        return waited
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._queue.remove(entry)
+                        heapq.heapify(self._queue)
+                        self.expired += 1
+                        raise RateLimitTimeout(
+                            f"{self.name}: no request budget within {timeout:.1f}s "
+                            f"({len(self._queue)} request(s) still queued)"
+                        )
+                    self._cond.wait(min(remaining, max(0.01, self._until_token())))
+            finally:
+                # The next waiter may now be at the head of the queue
+                self._cond.notify_all()
+
+    def penalize(self, retry_after=None):
+        """Empty the bucket and hand out nothing for retry_after seconds (after a 429)"""
+        pause = DEFAULT_PENALTY if retry_after is None else retry_after
+        with self._cond:
+            self._refill()
+            self.tokens = 0.0
+            self.paused_until = max(self.paused_until, time.monotonic() + pause)
+            self.throttled += 1
+        logger.warning(f"{self.name} is throttling us; pausing requests for {pause:.1f}s")
+
+    def stats(self):
+        with self._cond:
+            self._refill()
+            queued = {name: 0 for name in PRIORITY_NAMES.values()}
+            for level, _, _ in self._queue:
+                queued[PRIORITY_NAMES.get(level, str(level))] += 1
+            return {
+                'rate': self.rate,
+                'burst': self.burst,
+                'remaining': round(self.tokens, 2),
+                'queued': queued,
+                'granted': {PRIORITY_NAMES[level]: count for level, count in self.granted.items()},
+                'waited': self.waited,
+                'avg_wait': round(self.wait_time / self.waited, 3) if self.waited else 0.0,
+                'expired': self.expired,
+                'throttled': self.throttled,
+                'paused_for': round(max(0.0, self.paused_until - time.monotonic()), 1),
+            }
@@ -0,0 +1,947 @@
+"""
+Local evaluator for Chartink ``scan_clause`` strings.
+
+A clause such as::
+
+    ( {57960} ( latest close > latest ema( latest close , 21 ) and
+                [0] 15 minute volume > [0] 15 minute sma( volume , 20 ) ) )
+
+is compiled into a small AST (``parse``) and evaluated with vectorized
+pandas/NumPy operations over an ``OhlcvPanel`` holding one DataFrame per
+field per timeframe (rows = bars, columns = symbols). Every symbol in the
+universe is evaluated at once, so a whole ``conditions`` list runs locally
+without any Chartink requests.
+
+Offsets follow Chartink's meaning:
+
+- ``latest X`` / ``N days ago X``: daily bar 0 / N bars back
+- ``[0] 15 minute X`` / ``[-1] 15 minute X``: latest / previous 15 minute bar
+- ``[=1] 10 minute X``: first 10 minute candle of the latest session (``[=0]`` is the current one)
+- ``N candle ago X``: N bars back on the enclosing timeframe
+
+An offset selects a single row from the indicator series it applies to;
+offsets inside function arguments shift the input series instead.
+
+``ScanPlan`` evaluates a batch of clauses together: identical indicator
+terms across all of them are computed once and shared.
+"""
+from collections import namedtuple
+import logging
+import math
+import re
+import time
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+DAILY = 'daily'
+FIELDS = ('open', 'high', 'low', 'close', 'volume')
+
+# Segments that mean "the whole cash market"; other {ids} are looked up in OhlcvPanel.universes
+MARKET_SEGMENTS = ('57960', 'cash')
+
+
+class ScanClauseError(ValueError):
+    """Raised for clauses that cannot be parsed or evaluated locally"""
+
+
+# --- AST -------------------------------------------------------------------
+
+Num = namedtuple('Num', 'value')
+Field = namedtuple('Field', 'name')
+Call = namedtuple('Call', 'name args')
+# timeframe None inherits the enclosing timeframe; kind is 'ago' (bars back) or 'session' (nth candle of day)
+Offset = namedtuple('Offset', 'timeframe kind n node')
+Neg = namedtuple('Neg', 'node')
+BinOp = namedtuple('BinOp', 'op left right')
+Compare = namedtuple('Compare', 'op left right')
+BoolOp = namedtuple('BoolOp', 'op items')
+Not = namedtuple('Not', 'node')
+Segment = namedtuple('Segment', 'universe node')
+
+
+# --- Tokenizer -------------------------------------------------------------
+
+_TOKEN_RE = re.compile(r'''
+    (?P<ws>\s+|\\)
+  | (?P<segment>\{[^}]*\})
+  | (?P<quoted>"[^"]*")
+  | (?P<number>\d+(?:\.\d+)?)
+  | (?P<word>[A-Za-z_][A-Za-z_0-9]*)
+  | (?P<op>>=|<=|!=|==|[-+*/()\[\],=<>])
+''', re.VERBOSE)
+
+Token = namedtuple('Token', 'kind value')
+
+
+def tokenize(text):
+    tokens = []
+    pos = 0
+    while pos < len(text):
+        match = _TOKEN_RE.match(text, pos)
+        if not match:
+            raise ScanClauseError(f"Unexpected character {text[pos]!r} at {pos}")
+        kind = match.lastgroup
+        value = match.group(kind)
+        pos = match.end()
+        if kind == 'ws':
+            continue
+        if kind == 'word':
+            value = value.lower()
+        elif kind == 'segment':
+            value = value[1:-1].strip()
+        elif kind == 'quoted':
+            value = value[1:-1]
+        tokens.append(Token(kind, value))
+    return tokens
+
+
+# --- Parser ----------------------------------------------------------------
+
+# Function names that span several words, longest first
+_MULTIWORD_FUNCTIONS = (
+    (('avg', 'true', 'range'), 'atr'),
+    (('macd', 'line'), 'macd_line'),
+    (('macd', 'signal'), 'macd_signal'),
+    (('macd', 'histogram'), 'macd_histogram'),
+)
+_FUNCTIONS = {
+    'ema', 'sma', 'wma', 'tma', 'rsi', 'vwap', 'supertrend', 'greatest', 'least',
+    'max', 'min', 'sum', 'atr', 'adx',
+}
+_NO_ARG_FUNCTIONS = {'vwap'}
+_AGO_UNITS = {
+    'day': DAILY, 'days': DAILY,
+    'candle': None, 'candles': None,
+}
+_TIMEFRAME_UNITS = {'minute': 'minute', 'minutes': 'minute', 'hour': 'hour', 'hours': 'hour'}
+
+
+def normalize_timeframe(n, unit):
+    """'15', 'minute' -> '15 minute'; hours are expressed in minutes"""
+    if unit == 'hour':
+        return f"{int(n) * 60} minute"
+    return f"{int(n)} minute"
+
+
+class _Parser:
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self, offset=0):
+        index = self.pos + offset
+        return self.tokens[index] if index < len(self.tokens) else Token('eof', None)
+
+    def next(self):
+        token = self.peek()
+        self.pos += 1
+        return token
+
+    def accept(self, kind, value=None):
+        token = self.peek()
+        if token.kind == kind and (value is None or token.value == value):
+            self.pos += 1
+            return token
+        return None
+
+    def expect(self, kind, value=None):
+        token = self.accept(kind, value)
+        if token is None:
+            found = self.peek()
+            raise ScanClauseError(f"Expected {value or kind}, found {found.value!r}")
+        return token
+
+    # Boolean layer
+    def parse_or(self):
+        items = [self.parse_and()]
+        while self.accept('word', 'or'):
+            items.append(self.parse_and())
+        return items[0] if len(items) == 1 else BoolOp('or', tuple(items))
+
+    def parse_and(self):
+        items = [self.parse_not()]
+        while self.accept('word', 'and'):
+            items.append(self.parse_not())
+        return items[0] if len(items) == 1 else BoolOp('and', tuple(items))
+
+    def parse_not(self):
+        if self.accept('word', 'not'):
+            return Not(self.parse_not())
+        return self.parse_comparison()
+
+    def parse_comparison(self):
+        left = self.parse_additive()
+        token = self.peek()
+        if token.kind == 'op' and token.value in ('>', '<', '>=', '<=', '=', '==', '!='):
+            self.next()
+            op = '=' if token.value == '==' else token.value
+            return Compare(op, left, self.parse_additive())
+        return left
+
+    # Arithmetic layer
+    def parse_additive(self):
+        node = self.parse_multiplicative()
+        while self.peek().kind == 'op' and self.peek().value in ('+', '-'):
+            op = self.next().value
+            node = BinOp(op, node, self.parse_multiplicative())
+        return node
+
+    def parse_multiplicative(self):
+        node = self.parse_unary()
+        while self.peek().kind == 'op' and self.peek().value in ('*', '/'):
+            op = self.next().value
+            node = BinOp(op, node, self.parse_unary())
+        return node
+
+    def parse_unary(self):
+        if self.accept('op', '-'):
+            return Neg(self.parse_unary())
+        if self.accept('op', '+'):
+            return self.parse_unary()
+        return self.parse_primary()
+
+    def parse_primary(self):
+        token = self.peek()
+
+        if token.kind == 'op' and token.value == '(':
+            self.next()
+            if self.peek().kind == 'segment':
+                universe = self.next().value
+                node = Segment(universe, self.parse_or())
+            else:
+                node = self.parse_or()
+            self.expect('op', ')')
+            return node
+
+        if token.kind == 'segment':
+            self.next()
+            return Segment(token.value, self.parse_primary())
+
+        if token.kind == 'op' and token.value == '[':
+            timeframe, kind, n = self.parse_bracket_offset()
+            return Offset(timeframe, kind, n, self.parse_series())
+
+        if token.kind == 'word' and token.value == 'latest':
+            self.next()
+            return Offset(DAILY, 'ago', 0, self.parse_series())
+
+        if token.kind == 'number':
+            unit = self.peek(1)
+            if unit.kind == 'word' and unit.value in _AGO_UNITS and self.peek(2) == Token('word', 'ago'):
+                self.pos += 3
+                return Offset(_AGO_UNITS[unit.value], 'ago', int(float(token.value)), self.parse_series())
+            self.next()
+            return Num(float(token.value))
+
+        if token.kind in ('word', 'quoted'):
+            # A bare series takes its timeframe and offset from the enclosing context
+            return Offset(None, 'ago', 0, self.parse_series())
+
+        raise ScanClauseError(f"Unexpected token {token.value!r}")
+
+    def parse_bracket_offset(self):
+        self.expect('op', '[')
+        kind = 'session' if self.accept('op', '=') else 'ago'
+        sign = -1 if self.accept('op', '-') else 1
+        n = int(float(self.expect('number').value)) * sign
+        self.expect('op', ']')
+        size = self.expect('number').value
+        unit = self.expect('word').value
+        if unit not in _TIMEFRAME_UNITS:
+            raise ScanClauseError(f"Unsupported timeframe unit {unit!r}")
+        timeframe = normalize_timeframe(size, _TIMEFRAME_UNITS[unit])
+        # [0] is the latest bar, [-1] the one before; [=1] is the first candle of the session
+        # and [=0] the one in progress, i.e. the same as [0]
+        if kind == 'session' and n == 0:
+            kind = 'ago'
+        return timeframe, kind, (n if kind == 'session' else -n)
+
+    def parse_series(self):
+        token = self.peek()
+        if token.kind == 'quoted':
+            self.next()
+            return parse_expression(token.value)
+
+        for words, name in _MULTIWORD_FUNCTIONS:
+            if all(self.peek(i) == Token('word', word) for i, word in enumerate(words)):
+                self.pos += len(words)
+                return Call(name, self.parse_args())
+
+        token = self.expect('word')
+        if token.value in FIELDS:
+            return Field(token.value)
+        if token.value in _FUNCTIONS:
+            if token.value in _NO_ARG_FUNCTIONS and not (self.peek().kind == 'op' and self.peek().value == '('):
+                return Call(token.value, ())
+            return Call(token.value, self.parse_args())
+        raise ScanClauseError(f"Unsupported indicator {token.value!r}")
+
+    def parse_args(self):
+        self.expect('op', '(')
+        args = []
+        if not self.accept('op', ')'):
+            args.append(self.parse_additive())
+            while self.accept('op', ','):
+                args.append(self.parse_additive())
+            self.expect('op', ')')
+        return tuple(args)
+
+
+def parse_expression(text):
+    parser = _Parser(tokenize(text))
+    node = parser.parse_additive()
+    if parser.peek().kind != 'eof':
+        raise ScanClauseError(f"Unexpected token {parser.peek().value!r} in {text!r}")
+    return node
+
+
+def parse(clause):
+    """Compile a Chartink scan_clause into an AST"""
+    parser = _Parser(tokenize(clause))
+    node = parser.parse_or()
+    if parser.peek().kind != 'eof':
+        raise ScanClauseError(f"Unexpected token {parser.peek().value!r}")
+    return node
+
+
+def canonicalize(node, timeframe=DAILY, series=False):
+    """
+    Rewrite an AST so equivalent terms compare equal: inherited timeframes
+    are made explicit and no-op offsets inside indicator arguments are
+    dropped, e.g. ``ema( latest close , 21 )`` and ``ema( close , 21 )``.
+    """
+    if isinstance(node, Num):
+        return node
+    if isinstance(node, Field):
+        return node if series else Offset(timeframe, 'ago', 0, node)
+    if isinstance(node, Offset):
+        inner_timeframe = node.timeframe or timeframe
+        inner = canonicalize(node.node, inner_timeframe, series=True)
+        if series and inner_timeframe == timeframe and (node.kind == 'session' or node.n == 0):
+            return inner
+        return Offset(inner_timeframe, node.kind, node.n, inner)
+    if isinstance(node, Call):
+        call = Call(node.name, tuple(canonicalize(arg, timeframe, series=True) for arg in node.args))
+        return call if series else Offset(timeframe, 'ago', 0, call)
+    if isinstance(node, Neg):
+        return Neg(canonicalize(node.node, timeframe, series))
+    if isinstance(node, BinOp):
+        return BinOp(node.op, canonicalize(node.left, timeframe, series), canonicalize(node.right, timeframe, series))
+    if isinstance(node, Compare):
+        return Compare(node.op, canonicalize(node.left, timeframe), canonicalize(node.right, timeframe))
+    if isinstance(node, BoolOp):
+        return BoolOp(node.op, tuple(canonicalize(item, timeframe) for item in node.items))
+    if isinstance(node, Not):
+        return Not(canonicalize(node.node, timeframe))
+    if isinstance(node, Segment):
+        return Segment(node.universe, canonicalize(node.node, timeframe))
+    raise ScanClauseError(f"Unknown node {type(node).__name__}")
+
+
+def timeframes(clause):
+    """
+    Timeframes a clause reads bars from.
+
+    Returns:
+    set: e.g. {'daily', '15 minute'}
+    """
+    found = set()
+
+    def walk(node):
+        if isinstance(node, Offset):
+            found.add(node.timeframe)
+        for child in node if isinstance(node, tuple) and not isinstance(node, (Num, Field)) else ():
+            if isinstance(child, tuple):
+                walk(child)
+
+    walk(canonicalize(parse(clause) if isinstance(clause, str) else clause))
+    return found
+
+
+# --- Data panel ------------------------------------------------------------
+
+class OhlcvPanel:
+    """
+    OHLCV history for a universe of symbols.
+
+    Args:
+        frames: {timeframe: {field: DataFrame}} where timeframe is 'daily' or
+            'N minute', and each DataFrame has a DatetimeIndex of bars and
+            one column per symbol
+        universes: optional {segment id: iterable of symbols} for {id} segments
+    """
+
+    def __init__(self, frames, universes=None):
+        self.frames = {timeframe: dict(fields) for timeframe, fields in frames.items()}
+        self.universes = {str(key): set(value) for key, value in (universes or {}).items()}
+        symbols = set()
+        for fields in self.frames.values():
+            for frame in fields.values():
+                symbols.update(frame.columns)
+        self.symbols = pd.Index(sorted(symbols))
+
+    @classmethod
+    def from_long(cls, df, timeframe=DAILY, universes=None):
+        """Build a single-timeframe panel from rows of (symbol, timestamp, open, high, low, close, volume)"""
+        fields = {field: df.pivot(index='timestamp', columns='symbol', values=field).sort_index() for field in FIELDS}
+        return cls({timeframe: fields}, universes)
+
+    def field(self, timeframe, name):
+        fields = self.frames.get(timeframe)
+        if fields is None:
+            fields = self._resample(timeframe)
+        frame = fields.get(name)
+        if frame is None:
+            raise ScanClauseError(f"No {name} data for timeframe {timeframe}")
+        return frame.reindex(columns=self.symbols)
+
+    def _resample(self, timeframe):
+        """Build a coarser intraday timeframe from the finest one that divides it"""
+        minutes = int(timeframe.split()[0])
+        candidates = sorted(
+            int(key.split()[0]) for key in self.frames
+            if key != DAILY and minutes % int(key.split()[0]) == 0
+        )
+        if not candidates:
+            raise ScanClauseError(f"No data for timeframe {timeframe}")
+        source = self.frames[f"{candidates[0]} minute"]
+        # NSE sessions open at 09:15, so candles are anchored there
+        rule = dict(rule=f"{minutes}min", origin='start_day', offset=pd.Timedelta(hours=9, minutes=15),
+                    label='left', closed='left')
+        aggregations = {'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last', 'volume': 'sum'}
+        fields = {
+            name: source[name].resample(**rule).agg(how).dropna(how='all')
+            for name, how in aggregations.items() if name in source
+        }
+        self.frames[timeframe] = fields
+        return fields
+
+
+# --- Indicators (vectorized over symbols) ----------------------------------
+
+def _period(value):
+    if isinstance(value, pd.DataFrame):
+        raise ScanClauseError("Indicator periods must be numbers")
+    return max(1, int(round(value)))
+
+
+def _frame(values, like):
+    return pd.DataFrame(values, index=like.index, columns=like.columns)
+
+
+def _windows(series, n):
+    """(bars - n + 1, symbols, n) view of trailing windows, or None if there is too little history"""
+    values = series.to_numpy(dtype=float)
+    if len(values) < n:
+        return values, None
+    return values, np.lib.stride_tricks.sliding_window_view(values, n, axis=0)
+
+
+def rolling_sum(series, n):
+    n = _period(n)
+    values = series.to_numpy(dtype=float)
+    out = np.full(values.shape, np.nan)
+    if len(values) >= n:
+        # Cumulative sums give every window in one pass; windows containing a gap stay NaN
+        missing = np.isnan(values)
+        totals = np.cumsum(np.where(missing, 0.0, values), axis=0)
+        gaps = np.cumsum(missing, axis=0)
+        totals = np.vstack([np.zeros((1, values.shape[1])), totals])
+        gaps = np.vstack([np.zeros((1, values.shape[1])), gaps])
+        window = totals[n:] - totals[:-n]
+        out[n - 1:] = np.where(gaps[n:] - gaps[:-n] > 0, np.nan, window)
+    return _frame(out, series)
+
+
+def rolling_max(series, n):
+    values, windows = _windows(series, _period(n))
+    out = np.full(values.shape, np.nan)
+    if windows is not None:
+        out[_period(n) - 1:] = windows.max(axis=-1)
+    return _frame(out, series)
+
+
+def rolling_min(series, n):
+    values, windows = _windows(series, _period(n))
+    out = np.full(values.shape, np.nan)
+    if windows is not None:
+        out[_period(n) - 1:] = windows.min(axis=-1)
+    return _frame(out, series)
+
+
+def _ewm(series, alpha, min_periods):
+    """Recursive moving average stepped over bars, all symbols at once"""
+    values = series.to_numpy(dtype=float)
+    out = np.empty(values.shape)
+    previous = np.full(values.shape[1], np.nan)
+    for i, row in enumerate(values):
+        # Seed each symbol with its first value; carry the average across gaps
+        step = np.where(np.isnan(previous), row, previous + alpha * (row - previous))
+        previous = np.where(np.isnan(row), previous, step)
+        out[i] = previous
+    seen = np.cumsum(~np.isnan(values), axis=0)
+    out[seen < min_periods] = np.nan
+    return _frame(out, series)
+
+
+def ema(series, n):
+    n = _period(n)
+    return _ewm(series, 2.0 / (n + 1), n)
+
+
+def sma(series, n):
+    return rolling_sum(series, n) / _period(n)
+
+
+def wma(series, n):
+    n = _period(n)
+    values, windows = _windows(series, n)
+    out = np.full(values.shape, np.nan)
+    if windows is not None:
+        weights = np.arange(1, n + 1, dtype=float)
+        out[n - 1:] = windows @ weights / weights.sum()
+    return _frame(out, series)
+
+
+def tma(series, n):
+    n = _period(n)
+    first = math.ceil((n + 1) / 2)
+    return sma(sma(series, first), n + 1 - first)
+
+
+def true_range(high, low, close):
+    previous = close.shift(1)
+    # The first bar has no previous close, so its range is just high - low
+    return np.fmax(high - low, np.fmax((high - previous).abs(), (low - previous).abs()))
+
+
+def wilder(series, n):
+    return _ewm(series, 1.0 / _period(n), _period(n))
+
+
+def rsi(close, n):
+    change = close.diff()
+    gain = wilder(change.clip(lower=0), n)
+    loss = wilder(-change.clip(upper=0), n)
+    return 100 - 100 / (1 + gain / loss)
+
+
+def atr(high, low, close, n):
+    return wilder(true_range(high, low, close), n)
+
+
+def adx(high, low, close, n):
+    up = high.diff()
+    down = -low.diff()
+    plus_dm = up.where((up > down) & (up > 0), 0.0)
+    minus_dm = down.where((down > up) & (down > 0), 0.0)
+    range_ = atr(high, low, close, n)
+    plus_di = 100 * wilder(plus_dm, n) / range_
+    minus_di = 100 * wilder(minus_dm, n) / range_
+    dx = 100 * (plus_di - minus_di).abs() / (plus_di + minus_di)
+    return wilder(dx, n)
+
+
+def vwap(high, low, close, volume, intraday):
+    typical = (high + low + close) / 3
+    if not intraday:
+        return typical
+    # Intraday VWAP resets every session
+    session = high.index.normalize()
+    cumulative_pv = (typical * volume).groupby(session).cumsum()
+    cumulative_volume = volume.groupby(session).cumsum()
+    return cumulative_pv / cumulative_volume
+
+
+def supertrend(high, low, close, period, multiplier):
+    range_ = atr(high, low, close, period).to_numpy()
+    mid = ((high + low) / 2).to_numpy()
+    closes = close.to_numpy(dtype=float)
+    upper_basic = mid + multiplier * range_
+    lower_basic = mid - multiplier * range_
+
+    rows, cols = closes.shape
+    upper = np.full((rows, cols), np.nan)
+    lower = np.full((rows, cols), np.nan)
+    trend = np.full((rows, cols), np.nan)
+    direction = np.ones(cols)  # 1 = up trend (line below price), -1 = down trend
+
+    for i in range(rows):
+        if i == 0:
+            upper[i], lower[i] = upper_basic[i], lower_basic[i]
+        else:
+            prev_close = closes[i - 1]
+            # Bands only tighten while price stays inside them
+            upper[i] = np.where(
+                (upper_basic[i] < upper[i - 1]) | (prev_close > upper[i - 1]) | np.isnan(upper[i - 1]),
+                upper_basic[i], upper[i - 1])
+            lower[i] = np.where(
+                (lower_basic[i] > lower[i - 1]) | (prev_close < lower[i - 1]) | np.isnan(lower[i - 1]),
+                lower_basic[i], lower[i - 1])
+            direction = np.where(closes[i] > upper[i - 1], 1, np.where(closes[i] < lower[i - 1], -1, direction))
+        trend[i] = np.where(direction > 0, lower[i], upper[i])
+
+    return pd.DataFrame(trend, index=close.index, columns=close.columns)
+
+
+def macd(close, slow, fast, signal):
+    line = ema(close, fast) - ema(close, slow)
+    signal_line = ema(line, signal)
+    return line, signal_line
+
+
+# --- Evaluator -------------------------------------------------------------
+
+class Evaluator:
+    """
+    Evaluates parsed clauses against an OhlcvPanel.
+
+    Indicator series are memoized by (node, timeframe), so terms repeated
+    within a clause, or across clauses evaluated with the same Evaluator,
+    are computed once.
+    """
+
+    def __init__(self, panel):
+        self.panel = panel
+        self.cache = {}
+        self.cache_hits = 0
+
+    # Full history (bars x symbols) for a series node
+    def series(self, node, timeframe):
+        key = (node, timeframe)
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.cache_hits += 1
+            return cached
+        result = self._series(node, timeframe)
+        self.cache[key] = result
+        return result
+
+    def _series(self, node, timeframe):
+        if isinstance(node, Num):
+            return node.value
+        if isinstance(node, Field):
+            return self.panel.field(timeframe, node.name)
+        if isinstance(node, Offset):
+            inner_timeframe = node.timeframe or timeframe
+            inner = self.series(node.node, inner_timeframe)
+            if node.kind == 'ago' and node.n and isinstance(inner, pd.DataFrame):
+                return inner.shift(node.n)
+            return inner
+        if isinstance(node, Neg):
+            return -self.series(node.node, timeframe)
+        if isinstance(node, BinOp):
+            return _arith(node.op, self.series(node.left, timeframe), self.series(node.right, timeframe))
+        if isinstance(node, Call):
+            return self._call(node, timeframe)
+        raise ScanClauseError(f"{type(node).__name__} cannot be used as a series")
+
+    def _call(self, node, timeframe):
+        name, args = node.name, node.args
+        field = lambda column: self.panel.field(timeframe, column)
+        number = lambda arg: self.series(arg, timeframe)
+
+        if name in ('ema', 'sma', 'wma', 'tma', 'sum'):
+            source, period = self.series(args[0], timeframe), number(args[1])
+            if name == 'sum':
+                return rolling_sum(source, period)
+            return {'ema': ema, 'sma': sma, 'wma': wma, 'tma': tma}[name](source, period)
+        if name in ('max', 'min'):
+            # Chartink puts the period first: max( 20 , close )
+            period, source = number(args[0]), self.series(args[1], timeframe)
+            return rolling_max(source, period) if name == 'max' else rolling_min(source, period)
+        if name in ('greatest', 'least'):
+            values = [self.series(arg, timeframe) for arg in args]
+            frames = [value for value in values if isinstance(value, pd.DataFrame)]
+            result = frames[0] if frames else values[0]
+            for value in values:
+                result = np.maximum(result, value) if name == 'greatest' else np.minimum(result, value)
+            return result
+        if name == 'rsi':
+            return rsi(field('close'), number(args[0]))
+        if name == 'atr':
+            return atr(field('high'), field('low'), field('close'), number(args[0]))
+        if name == 'adx':
+            return adx(field('high'), field('low'), field('close'), number(args[0]))
+        if name == 'vwap':
+            return vwap(field('high'), field('low'), field('close'), field('volume'), timeframe != DAILY)
+        if name == 'supertrend':
+            return supertrend(field('high'), field('low'), field('close'), _period(number(args[0])), number(args[1]))
+        if name in ('macd_line', 'macd_signal', 'macd_histogram'):
+            slow, fast, signal = (number(arg) for arg in args)
+            line, signal_line = macd(field('close'), slow, fast, signal)
+            return {'macd_line': line, 'macd_signal': signal_line, 'macd_histogram': line - signal_line}[name]
+        raise ScanClauseError(f"Unsupported indicator {name!r}")
+
+    # One value per symbol for a node
+    def value(self, node, timeframe=DAILY, top_level=True):
+        if isinstance(node, Num):
+            return node.value
+        if isinstance(node, Offset):
+            timeframe = node.timeframe or timeframe
+            return _select(self.series(node.node, timeframe), node.kind, node.n, self.panel.symbols)
+        if isinstance(node, Neg):
+            return -self.value(node.node, timeframe, top_level)
+        if isinstance(node, BinOp):
+            return _arith(node.op, self.value(node.left, timeframe, top_level), self.value(node.right, timeframe, top_level))
+        if isinstance(node, Compare):
+            left = self.value(node.left, timeframe, top_level)
+            right = self.value(node.right, timeframe, top_level)
+            return _broadcast(_compare(node.op, left, right), self.panel.symbols)
+        if isinstance(node, BoolOp):
+            items = [_broadcast(self.value(item, timeframe, top_level), self.panel.symbols) for item in node.items]
+            result = items[0]
+            for item in items[1:]:
+                result = (result & item) if node.op == 'and' else (result | item)
+            return result
+        if isinstance(node, Not):
+            return ~_broadcast(self.value(node.node, timeframe, top_level), self.panel.symbols)
+        if isinstance(node, Segment):
+            inner = _broadcast(self.value(node.node, timeframe, top_level=False), self.panel.symbols)
+            members = self._members(node.universe)
+            if members is None:
+                return inner
+            # The outermost segment selects the universe; nested ones only constrain their members
+            return (inner & members) if top_level else (inner | ~members)
+        return self.value(Offset(None, 'ago', 0, node), timeframe, top_level)
+
+    def _members(self, universe):
+        if universe in MARKET_SEGMENTS:
+            return None
+        symbols = self.panel.universes.get(universe)
+        if symbols is None:
+            return None
+        return pd.Series(self.panel.symbols.isin(list(symbols)), index=self.panel.symbols)
+
+    def evaluate(self, clause):
+        """Boolean Series (indexed by symbol) of which symbols pass the clause"""
+        node = canonicalize(parse(clause) if isinstance(clause, str) else clause)
+        return _broadcast(self.value(node), self.panel.symbols).fillna(False).astype(bool)
+
+
+def _arith(op, left, right):
+    if op == '+':
+        return left + right
+    if op == '-':
+        return left - right
+    if op == '*':
+        return left * right
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result = left / right
+    if isinstance(result, (pd.Series, pd.DataFrame)):
+        return result.replace([np.inf, -np.inf], np.nan)
+    return result
+
+
+def _compare(op, left, right):
+    if op == '>':
+        return left > right
+    if op == '<':
+        return left < right
+    if op == '>=':
+        return left >= right
+    if op == '<=':
+        return left <= right
+    if op == '=':
+        return left == right
+    return left != right
+
+
+def _broadcast(value, symbols):
+    if isinstance(value, pd.Series):
+        return value.reindex(symbols)
+    return pd.Series(value, index=symbols)
+
+
+def _select(frame, kind, n, symbols):
+    """Pick one bar per symbol: n bars back, or the nth candle of the latest session"""
+    if not isinstance(frame, pd.DataFrame):
+        return frame
+    if kind == 'session':
+        if frame.empty:
+            return pd.Series(np.nan, index=symbols)
+        days = frame.index.normalize()
+        positions = np.flatnonzero(days == days[-1])
+        if n < 1 or n > len(positions):
+            return pd.Series(np.nan, index=symbols)
+        row = frame.iloc[positions[n - 1]]
+    else:
+        if n >= len(frame):
+            return pd.Series(np.nan, index=symbols)
+        row = frame.iloc[-1 - n]
+    return row.reindex(symbols)
+
+
+def evaluate(clause, panel):
+    """Boolean Series of which symbols in the panel pass the clause"""
+    return Evaluator(panel).evaluate(clause)
+
+
+def scan_rows(clause, panel, evaluator=None):
+    """
+    Run a clause locally and return rows shaped like Chartink's response
+    (nsecode, close, per_chg, volume) for every matching symbol.
+    """
+    evaluator = evaluator or Evaluator(panel)
+    return matching_rows(evaluator.evaluate(clause), panel)
+
+
+def matching_rows(mask, panel):
+    """Chartink-shaped rows for the symbols selected by a boolean mask"""
+    close = panel.field(DAILY, 'close')
+    volume = panel.field(DAILY, 'volume')
+    latest = close.iloc[-1]
+    previous = close.iloc[-2] if len(close) > 1 else latest
+    per_chg = ((latest / previous - 1) * 100).round(2)
+    matches = mask[mask].index
+    return [
+        {
+            'nsecode': symbol,
+            'close': float(latest[symbol]),
+            'per_chg': float(per_chg[symbol]),
+            'volume': float(volume.iloc[-1][symbol]),
+        }
+        for symbol in matches
+    ]
+
+
+# --- Batch planning --------------------------------------------------------
+
+class PlanReport:
+    """Term sharing and timings for one batch evaluation"""
+
+    def __init__(self, clauses, occurrences, unique):
+        self.clauses = clauses
+        self.occurrences = occurrences  # Indicator calls across all clauses, counting repeats
+        self.unique = unique  # Distinct indicator calls actually computed
+        self.compute_time = 0.0
+        self.evaluate_time = 0.0
+        self.saved_time = 0.0  # Estimated time the repeated indicator calls would have cost
+        self.errors = {}  # condition name -> error message
+
+    @property
+    def deduplicated(self):
+        return self.occurrences - self.unique
+
+    def as_dict(self):
+        return {
+            'clauses': self.clauses,
+            'terms': self.occurrences,
+            'unique_terms': self.unique,
+            'deduplicated': self.deduplicated,
+            'compute_time': round(self.compute_time, 4),
+            'evaluate_time': round(self.evaluate_time, 4),
+            'saved_time': round(self.saved_time, 4),
+            'errors': dict(self.errors),
+        }
+
+    def summary(self):
+        return (
+            f"{self.clauses} clauses, {self.occurrences} indicator calls, {self.unique} computed "
+            f"({self.deduplicated} shared) in {self.compute_time + self.evaluate_time:.3f}s, "
+            f"saved ~{self.saved_time:.3f}s, errors {len(self.errors)}"
+        )
+
+
+class ScanPlan:
+    """
+    Compiles a batch of clauses into one DAG of distinct indicator terms.
+
+    Terms are keyed by (canonical node, timeframe), so ``ema(close,21)``,
+    ``supertrend(10,1.5)`` or ``1 day ago high`` appearing in several
+    conditions are computed once per run and shared by all of them. The
+    report counts only indicator calls: fields, offsets and arithmetic are
+    cheap and would swamp the numbers.
+
+    Args:
+        conditions: {name: scan_clause string or parsed node}
+    """
+
+    def __init__(self, conditions):
+        self.clauses = {}
+        self.errors = {}
+        self.terms = {}  # (node, timeframe) -> occurrences; insertion order is dependency order
+        self.dependencies = {}  # (node, timeframe) -> child terms
+        for name, clause in conditions.items():
+            try:
+                node = canonicalize(parse(clause) if isinstance(clause, str) else clause)
+            except ScanClauseError as e:
+                self.errors[name] = str(e)
+                continue
+            self.clauses[name] = node
+            self._collect(node, DAILY, series=False)
+
+    def _collect(self, node, timeframe, series):
+        """Record series terms below node in post-order; returns the term key in series context"""
+        if isinstance(node, Num):
+            return None
+        children = []
+        if isinstance(node, Offset):
+            children.append(self._collect(node.node, node.timeframe, series=True))
+        elif isinstance(node, Call):
+            children.extend(self._collect(arg, timeframe, series=True) for arg in node.args)
+        elif isinstance(node, Neg):
+            children.append(self._collect(node.node, timeframe, series))
+        elif isinstance(node, (BinOp, Compare)):
+            children.append(self._collect(node.left, timeframe, series))
+            children.append(self._collect(node.right, timeframe, series))
+        elif isinstance(node, BoolOp):
+            children.extend(self._collect(item, timeframe, series) for item in node.items)
+        elif isinstance(node, (Not, Segment)):
+            children.append(self._collect(node.node, timeframe, series))
+
+        if not series:
+            return None
+        key = (node, timeframe)
+        self.terms[key] = self.terms.get(key, 0) + 1
+        self.dependencies[key] = tuple(child for child in children if child is not None)
+        return key
+
+    @property
+    def occurrences(self):
+        """Indicator calls across all clauses, counting repeats"""
+        return sum(count for (node, _), count in self.terms.items() if isinstance(node, Call))
+
+    @property
+    def unique(self):
+        """Distinct indicator calls (per timeframe) in the plan"""
+        return sum(1 for node, _ in self.terms if isinstance(node, Call))
+
+    def run(self, panel, evaluator=None):
+        """
+        Compute every distinct term once, then evaluate each clause.
+
+        Returns:
+        tuple: (dict of condition name -> boolean Series, PlanReport)
+        """
+        evaluator = evaluator or Evaluator(panel)
+        report = PlanReport(len(self.clauses), self.occurrences, self.unique)
+        report.errors.update(self.errors)
+
+        # Dependencies come first, so each timing covers only the term itself
+        for key, count in self.terms.items():
+            started = time.perf_counter()
+            try:
+                evaluator.series(*key)
+            except ScanClauseError:
+                continue  # Reported against the clause below
+            elapsed = time.perf_counter() - started
+            report.compute_time += elapsed
+            if isinstance(key[0], Call):
+                # Only repeated indicator calls, the ones the report counts as deduplicated
+                report.saved_time += elapsed * (count - 1)
+
+        results = {}
+        started = time.perf_counter()
+        for name, node in self.clauses.items():
+            try:
+                results[name] = evaluator.evaluate(node)
+            except ScanClauseError as e:
+                report.errors[name] = str(e)
+        report.evaluate_time = time.perf_counter() - started
+
+        logger.info(f"Local scan: {report.summary()}")
+        return results, report
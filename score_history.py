@@ -0,0 +1,225 @@
+"""
+Bounded per-symbol score history with vectorized jump detection.
+
+``ScoreHistory`` keeps the last ``depth`` observations of every symbol
+(timestamp, potential_score, price and volume) in fixed-size NumPy ring
+buffers. It is fed once per published scan snapshot from the snapshot's
+symbol table, so what counts as "the previous score" no longer depends on
+how often someone reloads the dashboard. Column ``k`` of the ring is the
+k-th recorded snapshot; a symbol missing from a snapshot gets NaN there.
+
+Rates of change over 1, 3 and 5 snapshots are computed for all symbols at
+once. A *jump* is a one-snapshot rise above ``jump_threshold`` (20% by
+default, the old rule); *accelerating* means the per-snapshot rate over
+the last snapshot beats the rate over the last 3, which beats the rate
+over the last 5.
+
+Symbols not seen for ``idle_expiry`` seconds are dropped and their slots
+reused, so memory is bounded by the symbols active in that window.
+"""
+import logging
+import threading
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DEPTH = 16  # Snapshots kept per symbol
+DEFAULT_IDLE_EXPIRY = 2 * 60 * 60  # Seconds without a sighting before a symbol is dropped
+JUMP_THRESHOLD = 0.2  # Relative one-snapshot score rise that counts as a jump
+RATE_LAGS = (1, 3, 5)  # Snapshots over which rates of change are reported
+INITIAL_CAPACITY = 256  # Symbol slots allocated up front; doubled when full
+
+
+class ScoreHistory:
+    """Ring buffers of (timestamp, score, price, volume) per symbol"""
+
+    def __init__(self, depth=DEFAULT_DEPTH, idle_expiry=DEFAULT_IDLE_EXPIRY,
+                 jump_threshold=JUMP_THRESHOLD, capacity=INITIAL_CAPACITY):
+        if depth <= max(RATE_LAGS):
+            raise ValueError(f"depth must exceed the longest rate lag ({max(RATE_LAGS)})")
+        self.depth = depth
+        self.idle_expiry = idle_expiry
+        self.jump_threshold = jump_threshold
+        self.slots = {}  # symbol -> row in the buffers
+        self.owners = []  # row -> symbol holding it (None when free)
+        self.recorded = 0  # Snapshots recorded; the next one goes to column recorded % depth
+        self.last_version = None
+        self.expired = 0
+        self._free = []
+        self._lock = threading.Lock()
+        self.timestamps = self.scores = self.prices = self.volumes = None
+        self.last_seen = np.zeros(0, dtype=np.float64)  # row -> time of the last sighting
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        """Create (or grow to) ``capacity`` symbol rows; caller holds the lock"""
+        def grown(old, fill):
+            new = np.full((capacity, self.depth), fill, dtype=np.float64)
+            if old is not None:
+                new[:len(old)] = old
+            return new
+
+        previous = len(self.last_seen)
+        self.timestamps = grown(self.timestamps, np.nan)
+        self.scores = grown(self.scores, np.nan)
+        self.prices = grown(self.prices, np.nan)
+        self.volumes = grown(self.volumes, np.nan)
+        last_seen = np.zeros(capacity, dtype=np.float64)
+        last_seen[:previous] = self.last_seen
+        self.last_seen = last_seen
+        self.owners.extend([None] * (capacity - previous))
+        self._free.extend(range(capacity - 1, previous - 1, -1))
+
+    def _slot(self, symbol):
+        slot = self.slots.get(symbol)
+        if slot is None:
+            if not self._free:
+                self._allocate(len(self.last_seen) * 2)
+            slot = self._free.pop()
+            self.slots[symbol] = slot
+            self.owners[slot] = symbol
+        return slot
+
+    def record(self, table, version=None, now=None):
+        """
+        Append one snapshot's symbol table. A version already recorded is
+        ignored, so calling this for every publish is safe.
+
+        Returns:
+        bool: True if a new column was written
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            if version is not None and version == self.last_version:
+                return False
+            column = self.recorded % self.depth
+            # Overwrite the oldest column; symbols absent from this snapshot read NaN there
+            for buffer in (self.timestamps, self.scores, self.prices, self.volumes):
+                buffer[:, column] = np.nan
+
+            rows = np.fromiter((self._slot(symbol) for symbol in table.symbols), dtype=np.intp, count=len(table))
+            self.timestamps[rows, column] = now
+            self.scores[rows, column] = table.best_scores
+            self.prices[rows, column] = table.close
+            self.volumes[rows, column] = table.volume
+            self.last_seen[rows] = now
+
+            self.recorded += 1
+            self.last_version = version
+            self._expire(now)
+            return True
+
+    def _expire(self, now):
+        """Free the slots of symbols idle longer than idle_expiry; caller holds the lock"""
+        occupied = np.fromiter(self.slots.values(), dtype=np.intp, count=len(self.slots))
+        idle = occupied[now - self.last_seen[occupied] > self.idle_expiry]
+        if not len(idle):
+            return
+        for buffer in (self.timestamps, self.scores, self.prices, self.volumes):
+            buffer[idle] = np.nan
+        self.last_seen[idle] = 0
+        for slot in idle.tolist():
+            del self.slots[self.owners[slot]]
+            self.owners[slot] = None
+            self._free.append(slot)
+        self.expired += len(idle)
+        logger.debug(f"Expired {len(idle)} idle symbols from the score history")
+
+    def _lagged(self, buffer, lag):
+        """Column recorded ``lag`` snapshots before the latest; caller holds the lock"""
+        return buffer[:, (self.recorded - 1 - lag) % self.depth]
+
+    def rates(self, lags=RATE_LAGS):
+        """
+        Relative score change of every tracked symbol over each lag.
+
+        Returns:
+        tuple: (symbols, {lag: float array}); NaN where the symbol is missing
+        from the latest snapshot or from the one ``lag`` snapshots back
+        """
+        with self._lock:
+            symbols = list(self.slots)
+            if not symbols or not self.recorded:
+                return symbols, {lag: np.empty(0) for lag in lags}
+            rows = np.fromiter(self.slots.values(), dtype=np.intp, count=len(symbols))
+            latest = self._lagged(self.scores, 0)[rows]
+            rates = {}
+            for lag in lags:
+                if lag >= min(self.recorded, self.depth):
+                    rates[lag] = np.full(len(rows), np.nan)
+                    continue
+                past = self._lagged(self.scores, lag)[rows]
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    rates[lag] = np.where(past != 0, (latest - past) / np.abs(past), np.nan)
+            return symbols, rates
+
+    def signals(self):
+        """
+        Rates of change and jump/acceleration flags per symbol in the latest snapshot.
+
+        Returns:
+        dict: symbol -> {'roc_1', 'roc_3', 'roc_5', 'jump', 'accelerating'}
+        """
+        symbols, rates = self.rates()
+        if not symbols:
+            return {}
+        roc_1, roc_3, roc_5 = rates[1], rates[3], rates[5]
+        with np.errstate(invalid='ignore'):
+            jump = roc_1 > self.jump_threshold
+            accelerating = (roc_1 > 0) & (roc_1 > roc_3 / 3) & (roc_3 / 3 > roc_5 / 5)
+
+        def _value(rate):
+            return None if np.isnan(rate) else round(float(rate), 4)
+
+        return {
+            symbol: {
+                'roc_1': _value(roc_1[i]),
+                'roc_3': _value(roc_3[i]),
+                'roc_5': _value(roc_5[i]),
+                'jump': bool(jump[i]),
+                'accelerating': bool(accelerating[i]),
+            }
+            for i, symbol in enumerate(symbols)
+            if not np.isnan(roc_1[i]) or not np.isnan(roc_3[i]) or not np.isnan(roc_5[i])
+        }
+
+    def jumps(self):
+        """Symbols whose score rose more than jump_threshold since the previous snapshot"""
+        symbols, rates = self.rates((1,))
+        if not symbols:
+            return []
+        with np.errstate(invalid='ignore'):
+            return [symbols[i] for i in np.flatnonzero(rates[1] > self.jump_threshold)]
+
+    def series(self, symbol):
+        """
+        Recorded observations of one symbol, oldest first.
+
+        Returns:
+        list: {'time', 'score', 'price', 'volume'} dicts
+        """
+        with self._lock:
+            slot = self.slots.get(symbol)
+            if slot is None:
+                return []
+            count = min(self.recorded, self.depth)
+            columns = [(self.recorded - count + i) % self.depth for i in range(count)]
+            return [
+                {'time': float(self.timestamps[slot, column]), 'score': float(self.scores[slot, column]),
+                 'price': float(self.prices[slot, column]), 'volume': float(self.volumes[slot, column])}
+                for column in columns
+                if not np.isnan(self.timestamps[slot, column])
+            ]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'symbols': len(self.slots),
+                'capacity': len(self.last_seen),
+                'depth': self.depth,
+                'snapshots': self.recorded,
+                'last_version': self.last_version,
+                'expired': self.expired,
+            }
@@ -0,0 +1,87 @@
+"""
+Single-flight coalescing for duplicate upstream fetches.
+
+``SingleFlight.do(key, fn)`` runs ``fn`` once per key at a time: callers
+arriving while a call for the same key is in flight wait for it and receive
+the same result (or exception) instead of starting a second fetch. Nothing
+is cached afterwards; the next call after completion runs ``fn`` again.
+"""
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    """One in-flight execution and the callers waiting on it"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Collapses concurrent calls with the same key into one execution"""
+
+    def __init__(self, name='default'):
+        self.name = name
+        self.calls = 0  # fn executions
+        self.collapsed = 0  # Callers that shared another caller's execution
+        self.collapsed_by_key = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        """
+        Run ``fn()`` for key, or wait for the run already in flight.
+
+        Returns:
+        The result of the shared execution; its exception is re-raised in
+        every waiting caller
+        """
+        with self._lock:
+            call = self._inflight.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.collapsed += 1
+                self.collapsed_by_key[key] = self.collapsed_by_key.get(key, 0) + 1
+                leader = False
+            else:
+                call = _Call()
+                self._inflight[key] = call
+                self.calls += 1
+                leader = True
+
+        if not leader:
+            logger.debug(f"{self.name}: waiting on in-flight {key!r}")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            call.done.set()
+            if call.waiters:
+                logger.info(f"{self.name}: {call.waiters} duplicate call(s) to {key!r} shared one fetch")
+
+    def in_flight(self):
+        with self._lock:
+            return list(self._inflight)
+
+    def stats(self):
+        return {
+            'calls': self.calls,
+            'collapsed': self.collapsed,
+            'collapsed_by_key': {str(key): count for key, count in self.collapsed_by_key.items()},
+            'in_flight': [str(key) for key in self.in_flight()],
+        }
@@ -0,0 +1,292 @@
+"""
+Versioned, immutable scan-result snapshots.
+
+The background updater publishes a new ``Snapshot`` whenever scan results
+change; Flask threads only ever read ``store.current``, which is swapped in
+a single assignment. Each condition's stock list is serialized to JSON once
+when it is published, and responses are assembled from those fragments, so
+serving a snapshot never re-encodes it. ETags are derived from the content
+of the selected conditions, so they stay stable across refreshes in which
+nothing changed.
+
+Clients that already hold a version can ask for a delta instead: per
+condition, the symbols added and removed, the fields that changed on the
+remaining symbols, and the new ranking order. A writer that publishes
+several versions per refresh cycle (one per condition as results arrive)
+should size the history with ``history_for`` so a client one poll behind
+still gets a delta rather than the full payload.
+
+When a refresh fails for a condition, its last good result stays in the
+snapshot and the condition is marked stale (``mark_stale``) until a fetch
+succeeds again, so the dashboard keeps showing data during an outage and
+can tell the user how old it is.
+
+Views derived from a snapshot (such as the merged symbol table) are built
+once per version with ``Snapshot.derived`` and cached on the snapshot.
+"""
+from collections import OrderedDict, deque
+import hashlib
+import json
+import threading
+import time
+from types import MappingProxyType
+
+DEFAULT_HISTORY = 32  # Snapshots kept for diffing
+HISTORY_CYCLES = 4  # Refresh cycles of versions kept by a store sized with history_for()
+DELTA_CACHE_SIZE = 16  # Serialized deltas kept per store
+SYMBOL_KEY = 'nsecode'
+
+
+class Snapshot:
+    """One published version of the scan results; treat as read-only"""
+
+    __slots__ = ('version', 'created_at', 'results', 'bodies', 'digests', '_derived', '_derived_lock')
+
+    def __init__(self, version, results, bodies, digests):
+        self.version = version
+        self.created_at = time.time()
+        self.results = results  # condition name -> tuple of stock dicts
+        self.bodies = bodies  # condition name -> JSON array of its stocks
+        self.digests = digests  # condition name -> content digest
+        self._derived = {}  # key -> value built from this snapshot by derived()
+        self._derived_lock = threading.RLock()  # Builders may derive other views of the same snapshot
+
+    @property
+    def age(self):
+        return time.time() - self.created_at
+
+    def names(self, selected=None):
+        """Condition names present in this snapshot, optionally restricted to a selection"""
+        if selected is None:
+            return list(self.results)
+        return [name for name in dict.fromkeys(selected) if name in self.results]
+
+    def to_json(self, selected=None):
+        """JSON object for the selected conditions, assembled from cached fragments"""
+        return '{' + ','.join(json.dumps(name) + ':' + self.bodies[name] for name in self.names(selected)) + '}'
+
+    def derived(self, key, build):
+        """
+        A value computed from this snapshot, built by ``build(snapshot)`` on
+        first use and shared by every later caller.
+        """
+        try:
+            return self._derived[key]
+        except KeyError:
+            pass
+        with self._derived_lock:
+            if key not in self._derived:
+                self._derived[key] = build(self)
+            return self._derived[key]
+
+    def etag(self, selected=None):
+        """Content-based ETag for the selected conditions"""
+        digest = hashlib.sha1()
+        for name in self.names(selected):
+            digest.update(self.digests[name].encode())
+        return digest.hexdigest()[:20]
+
+
+def history_for(versions_per_cycle, cycles=HISTORY_CYCLES):
+    """
+    History length covering ``cycles`` refresh cycles of a writer that
+    publishes up to ``versions_per_cycle`` versions per cycle.
+
+    Returns:
+    int: at least DEFAULT_HISTORY
+    """
+    return max(DEFAULT_HISTORY, versions_per_cycle * cycles)
+
+
+def _dumps(value):
+    return json.dumps(value, separators=(',', ':'), default=str)
+
+
+def _serialize(stocks):
+    body = _dumps(list(stocks))
+    return body, hashlib.sha1(body.encode()).hexdigest()
+
+
+def diff_stocks(old_stocks, new_stocks):
+    """
+    Symbol-level difference between two ranked stock lists.
+
+    Returns:
+    dict: added stock rows, removed symbols, changed fields per symbol and
+    the new order of symbols
+    """
+    old_by_symbol = {stock.get(SYMBOL_KEY): stock for stock in old_stocks}
+    new_symbols = set()
+    added = []
+    changed = {}
+    order = []
+    for stock in new_stocks:
+        symbol = stock.get(SYMBOL_KEY)
+        order.append(symbol)
+        new_symbols.add(symbol)
+        previous = old_by_symbol.get(symbol)
+        if previous is None:
+            added.append(stock)
+            continue
+        fields = {key: value for key, value in stock.items() if previous.get(key) != value}
+        if fields:
+            changed[symbol] = fields
+    removed = [symbol for symbol in old_by_symbol if symbol not in new_symbols]
+    return {'added': added, 'removed': removed, 'changed': changed, 'order': order}
+
+
+class SnapshotStore:
+    """Publishes snapshots atomically and keeps the last N for diffing"""
+
+    def __init__(self, history=DEFAULT_HISTORY):
+        self._lock = threading.Lock()
+        self._history = deque(maxlen=history)
+        self._current = Snapshot(0, MappingProxyType({}), {}, {})
+        self._history.append(self._current)
+        self.checked_at = None  # Last publish attempt, even if nothing changed
+        self._deltas = OrderedDict()  # (base version, version) -> (condition pieces, removed conditions), oldest first
+        self._stale = {}  # condition name -> (stale since, error message)
+        self.refreshed_at = {}  # condition name -> time of its last successful fetch
+
+    @property
+    def current(self):
+        return self._current
+
+    def get(self, version):
+        """Return a snapshot still held in history, or None"""
+        for snapshot in reversed(self._history):
+            if snapshot.version == version:
+                return snapshot
+        return None
+
+    def history(self):
+        return list(self._history)
+
+    def _build(self, base, changes, replace):
+        """Create the next snapshot from base plus changed conditions, or None if nothing changed"""
+        results = {} if replace else dict(base.results)
+        bodies = {} if replace else dict(base.bodies)
+        digests = {} if replace else dict(base.digests)
+
+        for name, stocks in changes.items():
+            stocks = tuple(stocks)
+            if base.results.get(name) == stocks:
+                # Unchanged condition: reuse the JSON serialized for the previous snapshot
+                body, digest = base.bodies[name], base.digests[name]
+            else:
+                body, digest = _serialize(stocks)
+            results[name] = stocks
+            bodies[name] = body
+            digests[name] = digest
+
+        if digests == base.digests:
+            return None
+        return Snapshot(base.version + 1, MappingProxyType(results), bodies, digests)
+
+    def _swap(self, changes, replace):
+        with self._lock:
+            self.checked_at = time.time()
+            snapshot = self._build(self._current, changes, replace)
+            if snapshot is None:
+                return self._current
+            self._history.append(snapshot)
+            self._current = snapshot
+            return snapshot
+
+    def publish(self, results):
+        """Publish a complete result set; returns the current snapshot (unchanged if identical)"""
+        return self._swap(results, replace=True)
+
+    def update(self, name, stocks):
+        """Publish a single condition on top of the current snapshot"""
+        return self._swap({name: stocks}, replace=False)
+
+    def mark_fresh(self, names):
+        """Record a successful fetch for the given conditions"""
+        now = time.time()
+        with self._lock:
+            for name in names:
+                self.refreshed_at[name] = now
+                self._stale.pop(name, None)
+
+    def mark_stale(self, name, error):
+        """Record a failed fetch; the condition keeps serving its last good result"""
+        with self._lock:
+            since = self._stale.get(name, (time.time(), None))[0]
+            self._stale[name] = (since, error)
+
+    def stale(self, selected=None):
+        """
+        Conditions currently served from an older fetch.
+
+        Returns:
+        dict: name -> {'stale_for': seconds since the first failure,
+        'age': seconds since the last good result (None if never), 'error': last error}
+        """
+        now = time.time()
+        with self._lock:
+            stale = dict(self._stale)
+            refreshed_at = dict(self.refreshed_at)
+        wanted = None if selected is None else set(selected)
+        return {
+            name: {
+                'stale_for': round(now - since, 1),
+                'age': round(now - refreshed_at[name], 1) if name in refreshed_at else None,
+                'error': error,
+            }
+            for name, (since, error) in stale.items()
+            if wanted is None or name in wanted
+        }
+
+
+    def _delta_pieces(self, base, snapshot):
+        """Per-condition delta JSON between two snapshots, computed once per version pair"""
+        key = (base.version if base is not None else None, snapshot.version)
+        with self._lock:
+            cached = self._deltas.get(key)
+        if cached is not None:
+            return cached
+
+        pieces = {}
+        for name in snapshot.names():
+            if base is None or name not in base.results:
+                pieces[name] = '{"stocks":' + snapshot.bodies[name] + '}'
+            elif base.digests[name] != snapshot.digests[name]:
+                pieces[name] = _dumps(diff_stocks(base.results[name], snapshot.results[name]))
+        removed = [] if base is None else [name for name in base.names() if name not in snapshot.results]
+
+        # Requests build deltas concurrently, so eviction and insertion happen under the lock
+        with self._lock:
+            if key not in self._deltas:
+                while len(self._deltas) >= DELTA_CACHE_SIZE:
+                    self._deltas.popitem(last=False)
+                self._deltas[key] = (pieces, removed)
+            return self._deltas[key]
+
+    def delta_json(self, since=None, selected=None, snapshot=None):
+        """
+        JSON delta from version ``since`` to the current snapshot.
+
+        Falls back to a full payload (``"full": true``, every condition sent
+        as ``{"stocks": [...]}``) when ``since`` is missing or no longer held
+        in history.
+
+        Returns:
+        str: {"version", "base", "full", "conditions": {name: delta}, "removed": [names]}
+        """
+        snapshot = snapshot or self._current
+        base = self.get(since) if since is not None else None
+        pieces, removed = self._delta_pieces(base, snapshot)
+        if selected is not None:
+            wanted = set(selected)
+            names = [name for name in snapshot.names(selected) if name in pieces]
+            removed = [name for name in removed if name in wanted]
+        else:
+            names = list(pieces)
+        return (
+            '{"version":' + _dumps(snapshot.version)
+            + ',"base":' + _dumps(base.version if base is not None else None)
+            + ',"full":' + _dumps(base is None)
+            + ',"conditions":{' + ','.join(_dumps(name) + ':' + pieces[name] for name in names) + '}'
+            + ',"removed":' + _dumps(removed) + '}'
+        )
@@ -0,0 +1,176 @@
+"""
+Indexed queries over a snapshot's symbol table.
+
+``StockIndex`` sorts each numeric field of the merged symbol table
+(potential_score, per_chg, close, volume) once per snapshot. A query is a
+list of predicates such as ``potential_score>100`` or ``close<=2000``:
+each one becomes a binary search into its field's sorted order, yielding a
+contiguous run of candidate rows. The narrowest run supplies the candidate
+row ids and the other runs only test those candidates, through each row's
+rank in their field's order. The survivors are ordered by any indexed field
+via the same ranks and paginated, so a filter costs a few binary searches
+plus work proportional to the narrowest run, not to the number of symbols
+the scans return.
+
+``potential_score`` is the symbol's best score across the conditions it
+matched.
+"""
+import logging
+import re
+
+import numpy as np
+
+import symbol_table
+
+logger = logging.getLogger(__name__)
+
+FIELDS = {  # query field -> SymbolTable attribute
+    'potential_score': 'best_scores',
+    'per_chg': 'per_chg',
+    'close': 'close',
+    'volume': 'volume',
+}
+OPERATORS = ('>=', '<=', '>', '<', '=')
+DEFAULT_SORT = 'potential_score'
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 1000
+
+_PREDICATE = re.compile(r'^\s*([a-z_]+)\s*(>=|<=|>|<|=)\s*(-?[0-9.]+(?:e-?[0-9]+)?)\s*$', re.IGNORECASE)
+
+
+class QueryError(ValueError):
+    """Raised for an unknown field, operator or malformed predicate"""
+
+
+def parse_where(text):
+    """
+    'potential_score>100,close<=2000' -> [('potential_score', '>', 100.0), ('close', '<=', 2000.0)]
+
+    Returns:
+    list: (field, operator, value) tuples
+    """
+    predicates = []
+    for part in (text or '').split(','):
+        if not part.strip():
+            continue
+        match = _PREDICATE.match(part)
+        if not match:
+            raise QueryError(f"Cannot parse predicate {part.strip()!r}")
+        field, operator, value = match.group(1).lower(), match.group(2), match.group(3)
+        if field not in FIELDS:
+            raise QueryError(f"Unknown field {field!r}; expected one of {', '.join(FIELDS)}")
+        try:
+            predicates.append((field, operator, float(value)))
+        except ValueError:
+            raise QueryError(f"Invalid number in predicate {part.strip()!r}")
+    return predicates
+
+
+class StockIndex:
+    """Per-field sorted orders over one symbol table; treat as read-only"""
+
+    def __init__(self, table):
+        self.table = table
+        self.values = {field: getattr(table, attribute) for field, attribute in FIELDS.items()}
+        self.orders = {}  # field -> row indices sorted by the field's value (NaN last)
+        self.ranks = {}  # field -> position of each row in that order
+        self.sorted = {}  # field -> the field's values in that order
+        self.valid = {}  # field -> number of non-NaN values
+        for field, values in self.values.items():
+            order = np.argsort(values, kind='stable')
+            self.orders[field] = order
+            self.ranks[field] = np.empty(len(order), dtype=np.intp)
+            self.ranks[field][order] = np.arange(len(order))
+            self.sorted[field] = values[order]
+            self.valid[field] = int(len(values) - np.isnan(values).sum())
+
+    def __len__(self):
+        return len(self.table)
+
+    def _bounds(self, field, predicates):
+        """The [start, end) run of the field's sorted order satisfying all its predicates"""
+        ordered = self.sorted[field]
+        start, end = 0, self.valid[field]
+        for _, operator, value in predicates:
+            if operator in ('>', '>=', '='):
+                start = max(start, int(np.searchsorted(ordered[:end], value, 'right' if operator == '>' else 'left')))
+            if operator in ('<', '<=', '='):
+                end = min(end, int(np.searchsorted(ordered[:end], value, 'left' if operator == '<' else 'right')))
+        return start, max(start, end)
+
+    def matching(self, predicates=(), conditions=None):
+        """
+        Rows satisfying every predicate (and matching at least one of
+        ``conditions`` if given).
+
+        Returns:
+        numpy.ndarray: row ids, ascending
+        """
+        by_field = {}
+        for predicate in predicates:
+            by_field.setdefault(predicate[0], []).append(predicate)
+
+        # The narrowest run supplies the candidates; a row is in another field's
+        # run exactly when its rank in that field's order falls inside the run
+        runs = sorted((self._bounds(field, group) + (field,) for field, group in by_field.items()),
+                      key=lambda run: run[1] - run[0])
+        if not runs:
+            rows = np.arange(len(self))
+        else:
+            start, end, field = runs[0]
+            rows = np.sort(self.orders[field][start:end])
+            for start, end, field in runs[1:]:
+                if not len(rows):
+                    break
+                ranks = self.ranks[field][rows]
+                rows = rows[(ranks >= start) & (ranks < end)]
+        if conditions is not None:
+            rows = rows[(self.table.masks[rows] & self.table.mask_for(set(conditions))) != 0]
+        return rows
+
+    def query(self, predicates=(), sort=DEFAULT_SORT, descending=True, offset=0, limit=DEFAULT_LIMIT,
+              conditions=None):
+        """
+        Filter, order and paginate the symbol table.
+
+        Returns:
+        dict: {'total', 'offset', 'limit', 'sort', 'descending', 'stocks': records}
+        """
+        if sort not in FIELDS:
+            raise QueryError(f"Cannot sort by {sort!r}; expected one of {', '.join(FIELDS)}")
+        limit = max(0, min(int(limit), MAX_LIMIT))
+        offset = max(0, int(offset))
+        rows = self.matching(predicates, conditions)
+
+        # Position of each match in the sort field's order; unique, so no ties
+        ranks = self.ranks[sort][rows]
+        if descending:
+            # Largest first, NaN still last
+            valid = self.valid[sort]
+            ranks = np.where(ranks < valid, valid - 1 - ranks, ranks)
+        wanted = offset + limit
+        if wanted < len(ranks):
+            # Only the rows up to the end of the page need ordering
+            top = np.argpartition(ranks, wanted)[:wanted]
+        else:
+            top = np.arange(len(ranks))
+        page = rows[top[np.argsort(ranks[top])]][offset:]
+        return {
+            'total': int(len(rows)),
+            'offset': offset,
+            'limit': limit,
+            'sort': sort,
+            'descending': descending,
+            'stocks': [self.table.record(row) for row in page.tolist()],
+        }
+
+
+def for_snapshot(snapshot, order=None):
+    """
+    The field indexes of a snapshot's symbol table, built on first use and
+    cached on the snapshot.
+
+    Returns:
+    StockIndex
+    """
+    return snapshot.derived('stock_index', lambda snap: StockIndex(symbol_table.for_snapshot(snap, order)))
@@ -7,6 +7,10 @@ from datetime import datetime
 import sys
 import signal
 
+import http_client
+import market_schedule
+import ranking
+
 # Define the scan conditions
 conditions = [
     {
@@ -91,8 +95,8 @@ def play_alert():
     except Exception as e:
         print(f"Could not play alert sound: {e}")
 
-def fetch_and_process_data(session):
-    """Fetch and process stock data using the provided session"""
+def fetch_and_process_data(session, selected=None):
+    """Fetch and process stock data using the provided session (all conditions unless selected)"""
     url = "https://chartink.com/screener/process"
     all_scans = []
 
@@ -108,7 +112,7 @@ def fetch_and_process_data(session):
         
         header = {"x-csrf-token": meta["content"]}
 
-        for cond in conditions:
+        for cond in (conditions if selected is None else selected):
             if not running:  # Check if we should continue
                 return
 
@@ -117,22 +121,9 @@ def fetch_and_process_data(session):
                 response.raise_for_status()
                 
                 data = response.json()
-                stock_list = pd.DataFrame(data["data"])
-
-                if not stock_list.empty:
-                    stock_list["per_chg"] = pd.to_numeric(stock_list["per_chg"])
-                    stock_list["potential_score"] = stock_list["per_chg"] * stock_list["close"]
-                    
-                    # For "STRONG" condition, only show top 10 based on potential_score
-                    if cond["name"] == "STRONG":
-                        sorted_stock_list = stock_list.sort_values(by="potential_score", ascending=False).head(10)
-                    else:
-                        sorted_stock_list = stock_list.sort_values(by="potential_score", ascending=False)
-                    
-                    top_stocks = sorted_stock_list.head(10)
-                    all_scans.append((cond["name"], top_stocks))
-                else:
-                    all_scans.append((cond["name"], pd.DataFrame()))
+                # Only the top 10 rows become a DataFrame, for printing
+                top_stocks = pd.DataFrame(ranking.rank(data["data"], cond["name"]))
+                all_scans.append((cond["name"], top_stocks))
 
             except requests.RequestException as e:
                 print(f"Network error for {cond['name']}: {e}")
@@ -166,23 +157,28 @@ def main():
     
     print("Starting stock scanner... Press Ctrl+C to exit.")
     
-    # Create a session for better performance
-    with requests.Session() as session:
-        session.headers.update({
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-        })
-        
-        while running:
-            try:
-                print("\nFetching data...")
-                fetch_and_process_data(session)
-                
-                if running:  # Only sleep if we're still meant to be running
-                    time.sleep(120)  # Wait 2 minutes before the next cycle
-            except Exception as e:
-                print(f"Error in main loop: {e}")
-                if running:
-                    time.sleep(30)  # Wait 30 seconds before retrying on error
+    # Shared keep-alive client with retries for better performance
+    session = http_client.chartink()
+    # Refresh each scan at its own cadence during market hours, back off outside them
+    schedule = market_schedule.RefreshScheduler()
+    
+    while running:
+        try:
+            due = schedule.due(conditions)
+            if due:
+                print(f"\nFetching data for {len(due)} scan(s)...")
+                fetch_and_process_data(session, due)
+                schedule.mark_refreshed([cond["name"] for cond in due])
+            
+            if running:  # Only sleep if we're still meant to be running
+                wait = schedule.next_wake(conditions)
+                if wait > 300:
+                    print(f"Market {schedule.calendar.phase()}; next check in {wait / 60:.0f} min")
+                time.sleep(wait)
+        except Exception as e:
+            print(f"Error in main loop: {e}")
+            if running:
+                time.sleep(30)  # Wait 30 seconds before retrying on error
 
 if __name__ == "__main__":
     main()
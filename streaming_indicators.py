@@ -0,0 +1,427 @@
+"""
+Incremental indicators for streaming bars.
+
+Each indicator keeps just enough running state to fold in one new bar in
+O(1): EMAs and Wilder averages keep their last value, rolling windows keep a
+running sum or a monotonic deque, VWAP keeps session accumulators. An
+``IndicatorBook`` holds one set of indicators per symbol for a timeframe and
+can be snapshotted to JSON, so a restart resumes from the saved state instead
+of replaying the full history.
+
+Warm-up matches ``scan_clause``: a value is reported only once ``period``
+bars have been seen.
+"""
+from collections import deque, namedtuple
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+Bar = namedtuple('Bar', 'timestamp open high low close volume')
+
+
+class Indicator:
+    """Base class; subclasses implement update() and list their state in STATE"""
+
+    kind = None
+    PARAMS = ()
+    STATE = ()
+
+    def update(self, bar):
+        raise NotImplementedError
+
+    @property
+    def value(self):
+        raise NotImplementedError
+
+    def state(self):
+        data = {'kind': self.kind}
+        for name in self.PARAMS + self.STATE:
+            data[name] = _encode(getattr(self, name))
+        return data
+
+    @classmethod
+    def from_state(cls, data):
+        indicator = cls(**{name: data[name] for name in cls.PARAMS})
+        for name in cls.STATE:
+            setattr(indicator, name, _decode(data[name], getattr(indicator, name)))
+        return indicator
+
+
+def _encode(value):
+    if isinstance(value, deque):
+        return [list(item) if isinstance(item, tuple) else item for item in value]
+    if isinstance(value, Indicator):
+        return value.state()
+    return value
+
+
+def _decode(value, template):
+    if isinstance(template, deque):
+        return deque((tuple(item) if isinstance(item, list) else item for item in value), maxlen=template.maxlen)
+    if isinstance(template, Indicator):
+        return indicator_from_state(value)
+    return value
+
+
+class EMA(Indicator):
+    kind = 'ema'
+    PARAMS = ('period', 'source')
+    STATE = ('current', 'count')
+
+    def __init__(self, period, source='close', alpha=None):
+        self.period = period
+        self.source = source
+        self.alpha = alpha if alpha is not None else 2.0 / (period + 1)
+        self.current = None
+        self.count = 0
+
+    def add(self, x):
+        self.current = x if self.current is None else self.current + self.alpha * (x - self.current)
+        self.count += 1
+        return self.value
+
+    def update(self, bar):
+        return self.add(getattr(bar, self.source))
+
+    @property
+    def value(self):
+        return self.current if self.count >= self.period else None
+
+
+class Wilder(EMA):
+    """Wilder's smoothing (RMA), an EMA with alpha = 1/period"""
+
+    kind = 'wilder'
+
+    def __init__(self, period, source='close'):
+        super().__init__(period, source, alpha=1.0 / period)
+
+
+class SMA(Indicator):
+    kind = 'sma'
+    PARAMS = ('period', 'source')
+    STATE = ('window', 'total')
+
+    def __init__(self, period, source='close'):
+        self.period = period
+        self.source = source
+        self.window = deque(maxlen=period)
+        self.total = 0.0
+
+    def add(self, x):
+        if len(self.window) == self.period:
+            self.total -= self.window[0]
+        self.window.append(x)
+        self.total += x
+        return self.value
+
+    def update(self, bar):
+        return self.add(getattr(bar, self.source))
+
+    @property
+    def value(self):
+        return self.total / self.period if len(self.window) == self.period else None
+
+
+class RollingMax(Indicator):
+    """Highest value of the last ``period`` bars via a monotonic deque"""
+
+    kind = 'max'
+    PARAMS = ('period', 'source')
+    STATE = ('window', 'index')
+
+    def __init__(self, period, source='high'):
+        self.period = period
+        self.source = source
+        self.window = deque()  # (index, value), values decreasing from the left
+        self.index = 0
+
+    def _dominates(self, new, old):
+        return new >= old
+
+    def add(self, x):
+        while self.window and self._dominates(x, self.window[-1][1]):
+            self.window.pop()
+        self.window.append((self.index, x))
+        # Drop the front once it slides out of the window
+        if self.window[0][0] <= self.index - self.period:
+            self.window.popleft()
+        self.index += 1
+        return self.value
+
+    def update(self, bar):
+        return self.add(getattr(bar, self.source))
+
+    @property
+    def value(self):
+        return self.window[0][1] if self.index >= self.period else None
+
+
+class RollingMin(RollingMax):
+    kind = 'min'
+
+    def __init__(self, period, source='low'):
+        super().__init__(period, source)
+
+    def _dominates(self, new, old):
+        return new <= old
+
+
+class RSI(Indicator):
+    kind = 'rsi'
+    PARAMS = ('period',)
+    STATE = ('gain', 'loss', 'previous')
+
+    def __init__(self, period):
+        self.period = period
+        self.gain = Wilder(period)
+        self.loss = Wilder(period)
+        self.previous = None
+
+    def update(self, bar):
+        if self.previous is not None:
+            change = bar.close - self.previous
+            self.gain.add(max(change, 0.0))
+            self.loss.add(max(-change, 0.0))
+        self.previous = bar.close
+        return self.value
+
+    @property
+    def value(self):
+        gain, loss = self.gain.value, self.loss.value
+        if gain is None or loss is None:
+            return None
+        if loss == 0:
+            return 100.0
+        return 100 - 100 / (1 + gain / loss)
+
+
+class ATR(Indicator):
+    kind = 'atr'
+    PARAMS = ('period',)
+    STATE = ('average', 'previous')
+
+    def __init__(self, period):
+        self.period = period
+        self.average = Wilder(period)
+        self.previous = None
+
+    def update(self, bar):
+        if self.previous is None:
+            true_range = bar.high - bar.low
+        else:
+            true_range = max(bar.high - bar.low, abs(bar.high - self.previous), abs(bar.low - self.previous))
+        self.previous = bar.close
+        self.average.add(true_range)
+        return self.value
+
+    @property
+    def value(self):
+        return self.average.value
+
+
+class VWAP(Indicator):
+    """Session VWAP of the typical price; resets when the bar date changes"""
+
+    kind = 'vwap'
+    STATE = ('session', 'price_volume', 'volume')
+
+    def __init__(self):
+        self.session = None
+        self.price_volume = 0.0
+        self.volume = 0.0
+
+    def update(self, bar):
+        session = str(bar.timestamp)[:10]
+        if session != self.session:
+            self.session = session
+            self.price_volume = 0.0
+            self.volume = 0.0
+        self.price_volume += (bar.high + bar.low + bar.close) / 3 * bar.volume
+        self.volume += bar.volume
+        return self.value
+
+    @property
+    def value(self):
+        return self.price_volume / self.volume if self.volume else None
+
+
+class Supertrend(Indicator):
+    kind = 'supertrend'
+    PARAMS = ('period', 'multiplier')
+    STATE = ('atr', 'upper', 'lower', 'direction', 'previous')
+
+    def __init__(self, period, multiplier):
+        self.period = period
+        self.multiplier = multiplier
+        self.atr = ATR(period)
+        self.upper = None
+        self.lower = None
+        self.direction = 1  # 1 = up trend (line below price), -1 = down trend
+        self.previous = None
+
+    def update(self, bar):
+        atr = self.atr.update(bar)
+        if atr is not None:
+            mid = (bar.high + bar.low) / 2
+            upper_basic = mid + self.multiplier * atr
+            lower_basic = mid - self.multiplier * atr
+            upper, lower = self.upper, self.lower
+            if upper is not None:
+                # Direction flips against the previous bar's bands
+                if bar.close > upper:
+                    self.direction = 1
+                elif bar.close < lower:
+                    self.direction = -1
+            # Bands only tighten while price stays inside them
+            if upper is None or upper_basic < upper or self.previous > upper:
+                upper = upper_basic
+            if lower is None or lower_basic > lower or self.previous < lower:
+                lower = lower_basic
+            self.upper, self.lower = upper, lower
+        self.previous = bar.close
+        return self.value
+
+    @property
+    def value(self):
+        if self.upper is None:
+            return None
+        return self.lower if self.direction > 0 else self.upper
+
+
+class MACD(Indicator):
+    kind = 'macd'
+    PARAMS = ('slow', 'fast', 'signal')
+    STATE = ('fast_ema', 'slow_ema', 'signal_ema')
+
+    def __init__(self, slow=26, fast=12, signal=9):
+        self.slow = slow
+        self.fast = fast
+        self.signal = signal
+        self.fast_ema = EMA(fast)
+        self.slow_ema = EMA(slow)
+        self.signal_ema = EMA(signal)
+
+    def update(self, bar):
+        fast = self.fast_ema.update(bar)
+        slow = self.slow_ema.update(bar)
+        if fast is not None and slow is not None:
+            self.signal_ema.add(fast - slow)
+        return self.value
+
+    @property
+    def line(self):
+        fast, slow = self.fast_ema.value, self.slow_ema.value
+        return fast - slow if fast is not None and slow is not None else None
+
+    @property
+    def signal_line(self):
+        return self.signal_ema.value
+
+    @property
+    def value(self):
+        return self.line
+
+
+INDICATORS = {cls.kind: cls for cls in (EMA, Wilder, SMA, RollingMax, RollingMin, RSI, ATR, VWAP, Supertrend, MACD)}
+
+
+def indicator_from_state(data):
+    return INDICATORS[data['kind']].from_state(data)
+
+
+def create_indicator(kind, **params):
+    if kind not in INDICATORS:
+        raise ValueError(f"Unknown indicator {kind!r}")
+    return INDICATORS[kind](**params)
+
+
+class IndicatorBook:
+    """
+    Running indicators for every symbol on one timeframe.
+
+    Args:
+        timeframe: label such as '15 minute'
+        specs: {name: (kind, params)}, e.g. {'ema21': ('ema', {'period': 21})}
+    """
+
+    def __init__(self, timeframe, specs):
+        self.timeframe = timeframe
+        self.specs = {name: (kind, dict(params)) for name, (kind, params) in specs.items()}
+        self.symbols = {}  # symbol -> {name: Indicator}
+        self.last_timestamp = {}  # symbol -> timestamp of the last bar folded in
+
+    def _indicators(self, symbol):
+        indicators = self.symbols.get(symbol)
+        if indicators is None:
+            indicators = {name: create_indicator(kind, **params) for name, (kind, params) in self.specs.items()}
+            self.symbols[symbol] = indicators
+        return indicators
+
+    def update(self, symbol, bar):
+        """
+        Fold one closed bar into every indicator for the symbol.
+
+        Bars at or before the last one seen are ignored, so replaying a feed
+        after restore() does not count bars twice.
+
+        Returns:
+        bool: True if the bar was applied
+        """
+        last = self.last_timestamp.get(symbol)
+        if last is not None and str(bar.timestamp) <= last:
+            return False
+        for indicator in self._indicators(symbol).values():
+            indicator.update(bar)
+        self.last_timestamp[symbol] = str(bar.timestamp)
+        return True
+
+    def update_many(self, bars):
+        """Apply {symbol: Bar}; returns the number of bars applied"""
+        return sum(self.update(symbol, bar) for symbol, bar in bars.items())
+
+    def values(self, symbol):
+        return {name: indicator.value for name, indicator in self.symbols.get(symbol, {}).items()}
+
+    def get(self, symbol, name):
+        indicator = self.symbols.get(symbol, {}).get(name)
+        return indicator.value if indicator is not None else None
+
+    def snapshot(self):
+        """JSON-serializable state of every indicator"""
+        return {
+            'timeframe': self.timeframe,
+            'specs': {name: [kind, params] for name, (kind, params) in self.specs.items()},
+            'last_timestamp': dict(self.last_timestamp),
+            'symbols': {
+                symbol: {name: indicator.state() for name, indicator in indicators.items()}
+                for symbol, indicators in self.symbols.items()
+            },
+        }
+
+    @classmethod
+    def restore(cls, data):
+        book = cls(data['timeframe'], {name: tuple(spec) for name, spec in data['specs'].items()})
+        book.last_timestamp = dict(data['last_timestamp'])
+        for symbol, states in data['symbols'].items():
+            indicators = {name: indicator_from_state(state) for name, state in states.items()}
+            # Indicators added to the specs since the snapshot start cold
+            for name, (kind, params) in book.specs.items():
+                indicators.setdefault(name, create_indicator(kind, **params))
+            book.symbols[symbol] = indicators
+        return book
+
+    def save(self, path):
+        """Write the snapshot atomically"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp_path, path)
+        logger.info(f"Saved {self.timeframe} indicator state for {len(self.symbols)} symbols to {path}")
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r') as f:
+            return cls.restore(json.load(f))
@@ -0,0 +1,175 @@
+"""
+Cross-condition symbol table built once per scan snapshot.
+
+The same stock often matches several scans. ``SymbolTable`` merges every
+condition's ranked list into one row per ``nsecode``: the conditions it
+matched (as a bitmask over the condition order), its best and worst
+``potential_score`` and its confluence (how many scans it hit). The buy and
+sell suggestions and the confluence view are then array slices of the
+table instead of Python walks over every list; ``stock_query`` indexes it
+for score and price filters.
+
+Build it through ``for_snapshot`` so it is computed once per snapshot
+version and shared by every request.
+"""
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SYMBOL_KEY = 'nsecode'
+MAX_SUGGESTION_PRICE = 2250  # Buy/sell suggestions skip stocks priced above this
+SUGGESTIONS = 20  # Rows in each of the buy and sell lists
+MIN_CONFLUENCE = 2  # Default scans a symbol must hit to enter the confluence view
+MAX_CONDITIONS = 64  # Bits in the condition mask
+
+
+class SymbolTable:
+    """One row per symbol across all conditions of a snapshot; treat as read-only"""
+
+    def __init__(self, results, order=None):
+        """
+        Args:
+            results: condition name -> ranked list of stock dicts
+            order: condition names fixing the bit of each condition in the mask
+                (default: the order of results); unlisted conditions follow
+        """
+        names = list(dict.fromkeys([name for name in (order or []) if name in results] + list(results)))
+        if len(names) > MAX_CONDITIONS:
+            logger.warning(f"Only the first {MAX_CONDITIONS} of {len(names)} conditions fit the symbol mask")
+            names = names[:MAX_CONDITIONS]
+        self.conditions = names  # bit i of a mask is conditions[i]
+
+        index = {}  # symbol -> row
+        rows = []  # representative stock dict per row
+        masks, best, worst, strongest = [], [], [], []
+        for bit, name in enumerate(names):
+            flag = 1 << bit
+            for stock in results.get(name) or ():
+                symbol = stock.get(SYMBOL_KEY)
+                if symbol is None:
+                    continue
+                score = float(stock.get('potential_score') or 0)
+                row = index.get(symbol)
+                if row is None:
+                    index[symbol] = len(rows)
+                    rows.append(stock)
+                    masks.append(flag)
+                    best.append(score)
+                    worst.append(score)
+                    strongest.append(abs(score))
+                    continue
+                masks[row] |= flag
+                best[row] = max(best[row], score)
+                worst[row] = min(worst[row], score)
+                if abs(score) > strongest[row]:
+                    # Show the strongest reading when conditions were fetched at different times
+                    rows[row] = stock
+                    strongest[row] = abs(score)
+
+        self.symbols = list(index)
+        self.rows = rows
+        self.index = index
+        self.masks = np.array(masks, dtype=np.uint64)
+        self.best_scores = np.array(best, dtype=np.float64)
+        self.worst_scores = np.array(worst, dtype=np.float64)
+        self.close = np.array([float(stock.get('close') or 0) for stock in rows], dtype=np.float64)
+        self.per_chg = np.array([float(stock.get('per_chg') or 0) for stock in rows], dtype=np.float64)
+        self.volume = np.array([float(stock.get('volume') or 0) for stock in rows], dtype=np.float64)
+        self.confluence = self._popcount(self.masks)
+
+    @staticmethod
+    def _popcount(masks):
+        counts = np.zeros(len(masks), dtype=np.int16)
+        remaining = masks.copy()
+        while remaining.any():
+            counts += (remaining & np.uint64(1)).astype(np.int16)
+            remaining >>= np.uint64(1)
+        return counts
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def matched(self, row):
+        """Names of the conditions the symbol in ``row`` matched"""
+        mask = int(self.masks[row])
+        return [name for bit, name in enumerate(self.conditions) if mask >> bit & 1]
+
+    def record(self, row, score=None):
+        """
+        The symbol's stock dict plus its merged fields.
+
+        Returns:
+        dict: the representative stock row with ``potential_score`` (``score``
+        if given), best_score, worst_score, confluence and conditions
+        """
+        return {
+            **self.rows[row],
+            'potential_score': float(self.best_scores[row] if score is None else score),
+            'best_score': float(self.best_scores[row]),
+            'worst_score': float(self.worst_scores[row]),
+            'confluence': int(self.confluence[row]),
+            'conditions': self.matched(row),
+        }
+
+    def mask_for(self, names):
+        """Bitmask of the given condition names (unknown names are ignored)"""
+        mask = 0
+        for bit, name in enumerate(self.conditions):
+            if name in names:
+                mask |= 1 << bit
+        return np.uint64(mask)
+
+    def _in(self, selected):
+        if selected is None:
+            return np.ones(len(self), dtype=bool)
+        return (self.masks & self.mask_for(set(selected))) != 0
+
+    def suggestions(self, limit=SUGGESTIONS, max_price=MAX_SUGGESTION_PRICE):
+        """
+        Buy (rising, best score first) and sell (falling, lowest score first)
+        suggestions, one row per symbol.
+
+        Returns:
+        tuple: (buy records, sell records)
+        """
+        affordable = self.close <= max_price
+        buy = np.flatnonzero(affordable & (self.per_chg > 0))
+        buy = buy[np.argsort(-self.best_scores[buy], kind='stable')][:limit]
+        sell = np.flatnonzero(affordable & (self.per_chg <= 0))
+        sell = sell[np.argsort(self.worst_scores[sell], kind='stable')][:limit]
+        return ([self.record(row, self.best_scores[row]) for row in buy],
+                [self.record(row, self.worst_scores[row]) for row in sell])
+
+    def confluent(self, min_count=MIN_CONFLUENCE, selected=None, limit=None):
+        """
+        Symbols hitting at least ``min_count`` scans, ranked by confluence
+        then best score.
+
+        Returns:
+        list: records
+        """
+        rows = np.flatnonzero((self.confluence >= min_count) & self._in(selected))
+        rows = rows[np.lexsort((-self.best_scores[rows], -self.confluence[rows]))]
+        if limit is not None:
+            rows = rows[:limit]
+        return [self.record(row) for row in rows]
+
+    def stats(self):
+        return {
+            'symbols': len(self),
+            'conditions': len(self.conditions),
+            'confluent': int((self.confluence >= MIN_CONFLUENCE).sum()),
+            'max_confluence': int(self.confluence.max()) if len(self) else 0,
+        }
+
+
+def for_snapshot(snapshot, order=None):
+    """
+    The symbol table of a snapshot, built on first use and cached on it.
+
+    Returns:
+    SymbolTable
+    """
+    return snapshot.derived('symbol_table', lambda snap: SymbolTable(snap.results, order))
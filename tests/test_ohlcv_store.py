@@ -0,0 +1,70 @@
+import glob
+import os
+
+import numpy as np
+import pandas as pd
+
+import ohlcv_store
+from ohlcv_store import OhlcvTable
+
+
+def bar(close, volume=1000.0):
+    return {'close': close, 'volume': volume}
+
+
+def test_append_and_update(tmp_path):
+    table = OhlcvTable(str(tmp_path / 'daily'))
+    assert table.upsert('2025-01-02', {'AAA': bar(10.0)}) == 0
+    assert table.upsert('2025-01-03', {'AAA': bar(11.0), 'BBB': bar(20.0)}) == 1
+    # An existing bar is updated in place; fields not given are kept
+    assert table.upsert('2025-01-03', {'AAA': {'close': 12.0}}) == 1
+    close = table.frame('close')
+    assert close.loc['2025-01-03', 'AAA'] == 12.0
+    assert table.frame('volume').loc['2025-01-03', 'AAA'] == 1000.0
+    # BBB did not exist on the first day
+    assert np.isnan(close.loc['2025-01-02', 'BBB'])
+
+
+def test_backfill_inserts_in_date_order(tmp_path):
+    table = OhlcvTable(str(tmp_path / 'daily'))
+    table.upsert_many({day: {'AAA': bar(float(i))} for i, day in enumerate(['2025-01-03', '2025-01-07', '2025-01-09'])})
+    written = table.upsert_many({'2025-01-02': {'AAA': bar(-1.0)}, '2025-01-08': {'AAA': bar(1.5)},
+                                 '2025-01-09': {'AAA': {'volume': 5.0}}})
+    assert sorted(written.values()) == [0, 3, 4]
+    close = table.frame('close')['AAA']
+    assert list(close.index.strftime('%m-%d')) == ['01-02', '01-03', '01-07', '01-08', '01-09']
+    assert close.tolist() == [-1.0, 0.0, 1.0, 1.5, 2.0]
+    assert table.frame('volume')['AAA'].iloc[-1] == 5.0
+
+
+def test_backfill_does_not_move_rows_under_readers(tmp_path):
+    path = str(tmp_path / 'daily')
+    writer = OhlcvTable(path)
+    writer.upsert_many({'2025-01-06': {'AAA': bar(6.0)}, '2025-01-07': {'AAA': bar(7.0)}})
+    reader = OhlcvTable(path, readonly=True)
+    held = reader.frame('close')
+
+    writer.upsert('2025-01-03', {'AAA': bar(3.0)})
+    # The mapped generation is never rewritten, so a held view keeps its rows
+    assert held['AAA'].tolist() == [6.0, 7.0]
+    assert held.index.equals(pd.to_datetime(['2025-01-06', '2025-01-07']))
+
+    reader.refresh()
+    assert reader.frame('close')['AAA'].tolist() == [3.0, 6.0, 7.0]
+    # Only the published generation is left on disk
+    assert sorted(os.path.basename(p) for p in glob.glob(os.path.join(path, 'close*'))) == ['close.g1.f8']
+
+
+def test_growing_symbols_keeps_history(tmp_path, monkeypatch):
+    monkeypatch.setattr(ohlcv_store, 'SYMBOL_CAPACITY', 2)
+    path = str(tmp_path / 'daily')
+    writer = OhlcvTable(path)
+    writer.upsert('2025-01-02', {'AAA': bar(1.0), 'BBB': bar(2.0)})
+    reader = OhlcvTable(path, readonly=True)
+    writer.upsert('2025-01-03', {'CCC': bar(3.0)})
+    reader.refresh()
+    close = reader.frame('close')
+    assert reader._meta['symbol_capacity'] == 4
+    assert close.loc['2025-01-02'].tolist()[:2] == [1.0, 2.0]
+    assert np.isnan(close.loc['2025-01-02', 'CCC'])
+    assert close.loc['2025-01-03', 'CCC'] == 3.0
@@ -0,0 +1,35 @@
+import json
+
+import numpy as np
+import pytest
+
+import ranking
+
+
+def test_rank_matches_pandas():
+    rows = ranking.sample_rows(500)
+    for condition in ('BULLISH', 'HARSH SELL STOCKS'):
+        expected = ranking._pandas_rank(rows, condition)
+        ranked = ranking.rank(rows, condition)
+        assert [row['nsecode'] for row in ranked] == [row['nsecode'] for row in expected]
+        assert [row['potential_score'] for row in ranked] == pytest.approx([row['potential_score'] for row in expected])
+
+
+@pytest.mark.parametrize('condition', ['BULLISH', 'HARSH SELL STOCKS'])
+def test_rows_without_a_score_are_dropped(condition):
+    rows = ranking.sample_rows(5)
+    rows[1]['per_chg'] = '-'
+    rows[3]['close'] = None
+    del rows[4]['per_chg']
+    ranked = ranking.rank(rows, condition)
+    assert sorted(row['nsecode'] for row in ranked) == ['SYM0', 'SYM2']
+    assert all(np.isfinite(row['potential_score']) for row in ranked)
+    # The payload stays valid JSON for the browser
+    json.dumps(ranked, allow_nan=False)
+
+
+def test_top_k_orders_best_first():
+    scores = np.array([3.0, -1.0, 7.0, 5.0])
+    assert ranking.top_k(scores, 2).tolist() == [2, 3]
+    assert ranking.top_k(scores, 2, ascending=True).tolist() == [1, 0]
+    assert ranking.top_k(scores, 10).tolist() == [2, 3, 0, 1]
@@ -0,0 +1,187 @@
+import ast
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import scan_clause
+from scan_clause import Call, Field, Offset, canonicalize, parse, parse_expression
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APPS = ('app.py', 'app3.py', 'app4.py', 'stock_scanner.py')
+
+
+def app_conditions(filename):
+    """The module-level ``conditions`` list of an app, read without importing it (app3 needs winsound)"""
+    with open(os.path.join(ROOT, filename), 'r', encoding='utf-8') as f:
+        tree = ast.parse(f.read())
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(getattr(target, 'id', None) == 'conditions' for target in node.targets):
+            return ast.literal_eval(node.value)
+    raise AssertionError(f"No conditions list in {filename}")
+
+
+ALL_CONDITIONS = [
+    pytest.param(condition, id=f"{filename}:{condition['name']}")
+    for filename in APPS
+    for condition in app_conditions(filename)
+]
+
+
+@pytest.mark.parametrize('condition', ALL_CONDITIONS)
+def test_app_clauses_parse(condition):
+    node = parse(condition['scan_clause'])
+    # Canonical form is stable and every clause reads at least one timeframe
+    assert canonicalize(canonicalize(node)) == canonicalize(node)
+    assert scan_clause.timeframes(node)
+
+
+def test_app_clauses_plan_without_errors():
+    clauses = {condition['name']: condition['scan_clause'] for condition in app_conditions('app3.py')}
+    plan = scan_clause.ScanPlan(clauses)
+    assert plan.errors == {}
+    assert len(plan.clauses) == len(clauses)
+
+
+@pytest.fixture
+def daily_panel():
+    """30 daily bars: AAA rises, BBB falls, CCC is flat until a spike on the last bar"""
+    index = pd.bdate_range('2025-01-01', periods=30)
+    close = pd.DataFrame({
+        'AAA': np.arange(100.0, 130.0),
+        'BBB': np.arange(200.0, 170.0, -1),
+        'CCC': np.r_[np.full(29, 50.0), 60.0],
+    }, index=index)
+    volume = pd.DataFrame({'AAA': 1000.0, 'BBB': 1000.0, 'CCC': np.r_[np.full(29, 1000.0), 5000.0]}, index=index)
+    fields = {'open': close - 1, 'high': close + 1, 'low': close - 2, 'close': close, 'volume': volume}
+    return scan_clause.OhlcvPanel({scan_clause.DAILY: fields}, universes={'42': ['AAA', 'BBB']})
+
+
+@pytest.fixture
+def intraday_panel():
+    """Two sessions of 5 minute bars; AAA's volume spikes on the last candle"""
+    index = pd.DatetimeIndex(
+        list(pd.date_range('2025-01-02 09:15', periods=6, freq='5min'))
+        + list(pd.date_range('2025-01-03 09:15', periods=6, freq='5min'))
+    )
+    close = pd.DataFrame({'AAA': np.arange(12) + 194.0, 'BBB': np.arange(12) + 294.0}, index=index)
+    volume = pd.DataFrame({'AAA': np.r_[np.full(11, 100.0), 500.0], 'BBB': 100.0}, index=index)
+    fields = {'open': close, 'high': close + 1, 'low': close - 1, 'close': close, 'volume': volume}
+    return scan_clause.OhlcvPanel({'5 minute': fields})
+
+
+# --- [=0] offsets ------------------------------------------------------------
+
+def test_session_zero_offset_is_current_candle():
+    assert parse_expression('[=0] 30 minute volume') == parse_expression('[0] 30 minute volume')
+    assert parse_expression('[=0] 30 minute volume') == Offset('30 minute', 'ago', 0, Field('volume'))
+    assert parse_expression('[=1] 30 minute volume') == Offset('30 minute', 'session', 1, Field('volume'))
+    assert parse_expression('[-1] 30 minute volume') == Offset('30 minute', 'ago', 1, Field('volume'))
+
+
+def test_session_zero_offset_evaluates_to_latest_bar(intraday_panel):
+    evaluator = scan_clause.Evaluator(intraday_panel)
+    current = evaluator.value(parse_expression('[=0] 5 minute volume'))
+    latest = evaluator.value(parse_expression('[0] 5 minute volume'))
+    assert not current.isna().any()
+    pd.testing.assert_series_equal(current, latest)
+    # The 30min Volume Spike shape of clause matches on the current candle
+    mask = scan_clause.evaluate('( {cash} ( [=0] 5 minute volume > [-1] 5 minute volume * 2 ) )', intraday_panel)
+    assert mask.to_dict() == {'AAA': True, 'BBB': False}
+
+
+def test_session_first_candle(intraday_panel):
+    first = scan_clause.Evaluator(intraday_panel).value(parse_expression('[=1] 5 minute close'))
+    # First candle of the latest session, not of the whole history
+    assert first.to_dict() == {'AAA': 200.0, 'BBB': 300.0}
+
+
+# --- canonicalize ------------------------------------------------------------
+
+@pytest.mark.parametrize('left, right', [
+    ('ema( latest close , 21 )', 'ema( close , 21 )'),
+    ('latest close', 'close'),
+    ('[0] 15 minute ema( [0] 15 minute close , 9 )', '[0] 15 minute ema( close , 9 )'),
+    ('latest supertrend( 10 , 1.5 )', 'supertrend( 10 , 1.5 )'),
+    ('avg true range( 14 )', 'atr( 14 )'),
+    ('latest sma( latest volume , 20 ) * 2', 'sma( volume , 20 ) * 2'),
+])
+def test_canonicalize_equal(left, right):
+    assert canonicalize(parse_expression(left)) == canonicalize(parse_expression(right))
+
+
+@pytest.mark.parametrize('left, right', [
+    ('ema( close , 21 )', 'ema( close , 20 )'),
+    ('1 day ago close', 'latest close'),
+    ('[0] 15 minute close', '[0] 5 minute close'),
+    ('ema( 1 day ago close , 21 )', 'ema( close , 21 )'),
+    ('[=1] 15 minute close', '[0] 15 minute close'),
+])
+def test_canonicalize_distinct(left, right):
+    assert canonicalize(parse_expression(left)) != canonicalize(parse_expression(right))
+
+
+def test_canonicalize_makes_timeframes_explicit():
+    node = canonicalize(parse_expression('[0] 15 minute ema( close , 9 )'))
+    assert node == Offset('15 minute', 'ago', 0, Call('ema', (Field('close'), scan_clause.Num(9.0))))
+
+
+# --- Evaluator on a fixed panel ---------------------------------------------
+
+@pytest.mark.parametrize('clause, expected', [
+    ('( {57960} ( latest close > 1 day ago close ) )', {'AAA': True, 'BBB': False, 'CCC': True}),
+    ('( {57960} ( latest close > latest ema( latest close , 5 ) ) )', {'AAA': True, 'BBB': False, 'CCC': True}),
+    ('( {57960} ( latest volume > latest sma( volume , 20 ) * 2 ) )', {'AAA': False, 'BBB': False, 'CCC': True}),
+    ('( {57960} ( latest close = latest max( 30 , latest close ) ) )', {'AAA': True, 'BBB': False, 'CCC': True}),
+    ('( {57960} ( not ( latest close > 1 day ago close ) ) )', {'AAA': False, 'BBB': True, 'CCC': False}),
+    ('( {57960} ( latest close > 100 and latest close < 150 ) )', {'AAA': True, 'BBB': False, 'CCC': False}),
+    ('( {57960} ( latest close < 60 or latest close > 190 ) )', {'AAA': False, 'BBB': False, 'CCC': False}),
+    ('( {42} ( latest close > 0 ) )', {'AAA': True, 'BBB': True, 'CCC': False}),
+    ('( {cash} ( 30 days ago close > 0 ) )', {'AAA': False, 'BBB': False, 'CCC': False}),
+    ('( {cash} ( 29 days ago close > 0 ) )', {'AAA': True, 'BBB': True, 'CCC': True}),
+])
+def test_evaluate(daily_panel, clause, expected):
+    assert scan_clause.evaluate(clause, daily_panel).to_dict() == expected
+
+
+def test_values(daily_panel):
+    evaluator = scan_clause.Evaluator(daily_panel)
+    assert evaluator.value(parse_expression('latest close')).to_dict() == {'AAA': 129.0, 'BBB': 171.0, 'CCC': 60.0}
+    assert evaluator.value(parse_expression('2 days ago high')).to_dict() == {'AAA': 128.0, 'BBB': 174.0, 'CCC': 51.0}
+    sma = evaluator.value(parse_expression('latest sma( close , 5 )'))
+    assert sma.to_dict() == {'AAA': 127.0, 'BBB': 173.0, 'CCC': 52.0}
+    # A straight line keeps RSI at the extremes
+    rsi = evaluator.value(parse_expression('latest rsi( 14 )'))
+    assert rsi['AAA'] == pytest.approx(100.0)
+    assert rsi['BBB'] == pytest.approx(0.0)
+
+
+def test_scan_rows(daily_panel):
+    rows = scan_clause.scan_rows('( {57960} ( latest volume > 2000 ) )', daily_panel)
+    assert rows == [{'nsecode': 'CCC', 'close': 60.0, 'per_chg': 20.0, 'volume': 5000.0}]
+
+
+def test_plan_matches_single_evaluation(daily_panel):
+    clauses = {
+        'above ema': '( {57960} ( latest close > latest ema( close , 5 ) ) )',
+        'below ema': '( {57960} ( latest close < latest ema( latest close , 5 ) and latest rsi( 14 ) < 50 ) )',
+        'volume': '( {57960} ( latest volume > latest sma( volume , 20 ) * 2 ) )',
+    }
+    results, report = scan_clause.ScanPlan(clauses).run(daily_panel)
+    for name, clause in clauses.items():
+        pd.testing.assert_series_equal(results[name], scan_clause.evaluate(clause, daily_panel), check_names=False)
+    # Only indicator calls are counted: ema twice (shared), rsi and sma once
+    assert (report.occurrences, report.unique, report.deduplicated) == (4, 3, 1)
+    assert report.errors == {}
+
+
+def test_plan_reports_bad_clauses(daily_panel):
+    results, report = scan_clause.ScanPlan({'good': 'latest close > 0', 'bad': 'latest foo > 0'}).run(daily_panel)
+    assert set(results) == {'good'}
+    assert 'bad' in report.errors
+
+
+def test_unknown_indicator_raises():
+    with pytest.raises(scan_clause.ScanClauseError):
+        parse('latest foo( 3 ) > 1')
@@ -0,0 +1,228 @@
+"""
+In-process LRU cache with per-key TTL and an optional disk tier.
+
+Used in front of every upstream call (NSE indices, Chartink scans, volume
+lookups). Entries expire after their TTL and the least recently used entry
+is evicted once ``maxsize`` is reached. With ``disk_dir`` set, values are
+also written as JSON under ``cache/`` so a restart can serve them until they
+expire.
+
+``get_or_load`` coalesces concurrent misses through a ``SingleFlight``: the
+first caller runs the loader and everyone else asking for the same key waits
+for that result instead of hitting the upstream again.
+"""
+from collections import OrderedDict
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+from single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAXSIZE = 256
+DEFAULT_TTL = 30  # Seconds
+DISK_ROOT = os.path.join('cache', 'ttl')
+
+_MISSING = object()
+_registry = {}  # name -> TTLCache, for the debug endpoint
+_registry_lock = threading.Lock()
+
+
+class TTLCache:
+    """LRU cache whose entries expire individually"""
+
+    def __init__(self, name, maxsize=DEFAULT_MAXSIZE, default_ttl=DEFAULT_TTL, disk_dir=None):
+        self.name = name
+        self.maxsize = maxsize
+        self.default_ttl = default_ttl
+        self.disk_dir = disk_dir
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.loads = 0
+        self.load_errors = 0
+        self._entries = OrderedDict()  # key -> (value, expires_at on the wall clock)
+        self._flights = SingleFlight(f"cache:{name}")
+        self._lock = threading.Lock()
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+        with _registry_lock:
+            _registry[name] = self
+
+    # --- disk tier ------------------------------------------------------------
+
+    def _disk_path(self, key):
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()
+        return os.path.join(self.disk_dir, f"{digest}.json")
+
+    def _disk_get(self, key):
+        try:
+            with open(self._disk_path(key), 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return _MISSING
+        if data.get('expires_at', 0) <= time.time():
+            return _MISSING
+        return data['value'], data['expires_at']
+
+    def _disk_set(self, key, value, expires_at):
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump({'key': repr(key), 'value': value, 'expires_at': expires_at}, f)
+            os.replace(tmp_path, path)
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"Cache {self.name} could not persist {key!r}: {e}")
+
+    def _disk_delete(self, key):
+        try:
+            os.remove(self._disk_path(key))
+        except OSError:
+            pass
+
+    # --- memory tier ----------------------------------------------------------
+
+    def _lookup(self, key):
+        """Return the cached value or _MISSING; caller holds the lock"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, expires_at = entry
+            if expires_at > time.time():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._entries[key]
+            self.expirations += 1
+
+        if self.disk_dir:
+            stored = self._disk_get(key)
+            if stored is not _MISSING:
+                self._store(key, *stored)
+                self.hits += 1
+                self.disk_hits += 1
+                return stored[0]
+
+        self.misses += 1
+        return _MISSING
+
+    def _store(self, key, value, expires_at):
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, key, default=None):
+        with self._lock:
+            value = self._lookup(key)
+        return default if value is _MISSING else value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + (self.default_ttl if ttl is None else ttl)
+        with self._lock:
+            self._store(key, value, expires_at)
+        if self.disk_dir:
+            self._disk_set(key, value, expires_at)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+        if self.disk_dir:
+            self._disk_delete(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.disk_dir:
+            for name in os.listdir(self.disk_dir):
+                if name.endswith('.json'):
+                    try:
+                        os.remove(os.path.join(self.disk_dir, name))
+                    except OSError:
+                        pass
+
+    def get_or_load(self, key, loader, ttl=None, cacheable=None):
+        """
+        Return the cached value for key, calling ``loader()`` on a miss.
+
+        Concurrent misses for the same key share a single loader call.
+
+        Args:
+            key: hashable cache key
+            loader: zero-argument callable producing the value
+            ttl: seconds to keep the value (default_ttl if None)
+            cacheable: optional predicate; values it rejects (e.g. empty
+                results from a failed upstream) are returned but not cached
+        """
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        def load():
+            # A load that finished between our miss and now already filled the entry
+            with self._lock:
+                entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.time():
+                return entry[0]
+            self.loads += 1
+            try:
+                value = loader()
+            except Exception:
+                self.load_errors += 1
+                raise
+            if cacheable is None or cacheable(value):
+                self.set(key, value, ttl)
+            return value
+
+        return self._flights.do(key, load)
+
+    def memoize(self, ttl=None, cacheable=None):
+        """Decorator caching a function's result per positional/keyword arguments"""
+        def decorator(func):
+            def wrapper(*args, **kwargs):
+                key = (func.__name__, args, tuple(sorted(kwargs.items())))
+                return self.get_or_load(key, lambda: func(*args, **kwargs), ttl=ttl, cacheable=cacheable)
+            wrapper.__name__ = func.__name__
+            wrapper.__doc__ = func.__doc__
+            wrapper.uncached = func
+            return wrapper
+        return decorator
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'default_ttl': self.default_ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+            'disk_hits': self.disk_hits,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'loads': self.loads,
+            'load_errors': self.load_errors,
+            'coalesced': self._flights.collapsed,
+            'disk': self.disk_dir,
+        }
+
+
+def stats():
+    """Metrics for every cache created in this process"""
+    with _registry_lock:
+        caches = list(_registry.values())
+    return {cache.name: cache.stats() for cache in caches}
+
+
+def clear_all():
+    with _registry_lock:
+        caches = list(_registry.values())
+    for cache in caches:
+        cache.clear()
@@ -0,0 +1,317 @@
+"""
+Daily volume lookup across several sources.
+
+A batch of symbols is resolved in one call. Symbols looked up recently are
+answered from memory and completed days from the ``cache/`` tier on disk;
+for the rest every healthy source is queried at once and the first valid
+answer per symbol wins, so a batch takes as long as the fastest working
+source rather than the sum of every fallback.
+
+Each source sits behind a ``CircuitBreaker``: a source that keeps failing is
+skipped until its cool-down expires instead of being retried on every
+lookup. A source that had no answer for a (symbol, date) is not asked again
+for that pair until the negative-cache TTL passes.
+"""
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime
+import json
+import logging
+import os
+import threading
+import time
+
+import bhavcopy_ingest
+from circuit_breaker import CircuitBreaker
+import http_client
+from market_schedule import IST, today_ist
+import ttl_cache
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = 'cache'
+DEFAULT_NEGATIVE_TTL = 15 * 60  # Seconds a (source, symbol, date) miss is remembered
+DEFAULT_BATCH_TIMEOUT = 20  # Seconds a resolve() call waits for sources
+DEFAULT_WORKERS = 8
+DEFAULT_MEMORY_TTL = 60  # Seconds a resolved volume is served from memory (intraday volumes keep moving)
+
+
+def session_closed(day):
+    """True once the day's volume is final (after the 15:30 close, with margin)"""
+    now = datetime.now(IST)
+    return day < now.date() or (day == now.date() and now.hour >= 16)
+
+
+class VolumeSource:
+    """
+    One place to look up daily volumes.
+
+    Per-symbol sources implement ``fetch(symbol, day)``; sources that answer
+    many symbols with one request set ``batch = True`` and implement
+    ``fetch_batch(symbols, day)``. Both return None / omit symbols they have
+    no data for and raise on transport or parse errors.
+    """
+
+    name = None
+    batch = False
+    local = False  # Local sources are consulted inline before any remote request
+
+    def available(self, day):
+        """Whether this source can answer for the given day at all"""
+        return True
+
+    def fetch(self, symbol, day):
+        raise NotImplementedError
+
+    def fetch_batch(self, symbols, day):
+        raise NotImplementedError
+
+
+class StoreSource(VolumeSource):
+    """Volumes already ingested into the local OHLCV store"""
+
+    name = 'store'
+    batch = True
+    local = True
+
+    def __init__(self, store=None):
+        self.store = store
+
+    def available(self, day):
+        return self.store is not None and 'daily' in self.store.timeframes()
+
+    def fetch_batch(self, symbols, day):
+        table = self.store.table('daily')
+        table.refresh()
+        row = table.locate(day)
+        if row is None:
+            return {}
+        volumes = table.column('volume')[row]
+        return {
+            symbol: int(volumes[table.symbol_index[symbol]])
+            for symbol in symbols
+            if symbol in table.symbol_index and volumes[table.symbol_index[symbol]] > 0
+        }
+
+
+class NseQuoteSource(VolumeSource):
+    """NSE's live quote API; only knows the current session"""
+
+    name = 'nse'
+    url = "https://www.nseindia.com/api/quote-equity?symbol={symbol}&section=trade_info"
+
+    def available(self, day):
+        return day == today_ist()
+
+    def fetch(self, symbol, day):
+        response = http_client.nse().get(self.url.format(symbol=symbol))
+        response.raise_for_status()
+        data = response.json()
+        volume = (data.get('securityWiseDP') or {}).get('quantityTraded')
+        return int(volume) if volume else None
+
+
+class YahooSource(VolumeSource):
+    """Yahoo Finance daily chart for the .NS listing"""
+
+    name = 'yahoo'
+    url = "https://query1.finance.yahoo.com/v8/finance/chart/{symbol}.NS?interval=1d&range=1mo"
+
+    def fetch(self, symbol, day):
+        response = http_client.yahoo().get(self.url.format(symbol=symbol))
+        response.raise_for_status()
+        result = (response.json().get('chart') or {}).get('result') or []
+        if not result:
+            return None
+        timestamps = result[0].get('timestamp') or []
+        volumes = result[0]['indicators']['quote'][0].get('volume') or []
+        for timestamp, volume in zip(timestamps, volumes):
+            if datetime.fromtimestamp(timestamp, IST).date() == day and volume:
+                return int(volume)
+        return None
+
+
+class BhavcopySource(VolumeSource):
+    """End-of-day bhavcopy; one download answers every symbol"""
+
+    name = 'bhavcopy'
+    batch = True
+
+    def available(self, day):
+        # Published after the close, never for the session in progress
+        return day < today_ist() or datetime.now(IST).hour >= 18
+
+    def fetch_batch(self, symbols, day):
+        path = bhavcopy_ingest.download(day)
+        if path is None:
+            return {}
+        bars = bhavcopy_ingest.parse_day(path)
+        return {symbol: bars[symbol]['volume'] for symbol in symbols if bars.get(symbol, {}).get('volume')}
+
+
+def default_sources(store=None):
+    """Sources in order of preference"""
+    return [StoreSource(store), NseQuoteSource(), YahooSource(), BhavcopySource()]
+
+
+class VolumeResolver:
+    """Resolves daily volumes for many symbols from the fastest healthy source"""
+
+    def __init__(self, sources=None, cache_dir=CACHE_DIR, negative_ttl=DEFAULT_NEGATIVE_TTL,
+                 workers=DEFAULT_WORKERS, timeout=DEFAULT_BATCH_TIMEOUT):
+        self.sources = sources if sources is not None else default_sources()
+        self.cache_dir = cache_dir
+        self.negative_ttl = negative_ttl
+        self.timeout = timeout
+        self.breakers = {source.name: CircuitBreaker(f"volume:{source.name}") for source in self.sources}
+        self.wins = {source.name: 0 for source in self.sources}
+        self.cache_hits = 0
+        self.memory = ttl_cache.TTLCache('volumes', maxsize=4096, default_ttl=DEFAULT_MEMORY_TTL)
+        self._negative = {}  # (source, symbol, date) -> expiry (monotonic)
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='volume')
+
+    # --- cache/ tier ----------------------------------------------------------
+
+    def _cache_path(self, symbol, day):
+        return os.path.join(self.cache_dir, f"volume_{symbol}_{day:%Y%m%d}.json")
+
+    def _read_cache(self, symbol, day):
+        for path in (self._cache_path(symbol, day),
+                     os.path.join(self.cache_dir, f"yesterday_volume_{symbol}_{day:%Y%m%d}.json")):
+            try:
+                with open(path, 'r') as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if data.get('volume'):
+                return {'volume': int(data['volume']), 'source': data.get('source', 'cache')}
+        return None
+
+    def _write_cache(self, symbol, day, volume, source):
+        # The current session's volume keeps growing, so only completed days are cached
+        if not session_closed(day):
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._cache_path(symbol, day)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'volume': volume, 'source': source, 'date': day.strftime('%d-%m-%Y')}, f)
+        os.replace(tmp_path, path)
+
+    # --- negative cache -------------------------------------------------------
+
+    def _is_negative(self, source, symbol, day):
+        key = (source, symbol, day)
+        with self._lock:
+            expiry = self._negative.get(key)
+            if expiry is None:
+                return False
+            if expiry < time.monotonic():
+                del self._negative[key]
+                return False
+            return True
+
+    def _remember_miss(self, source, symbols, day):
+        expiry = time.monotonic() + self.negative_ttl
+        with self._lock:
+            for symbol in symbols:
+                self._negative[(source, symbol, day)] = expiry
+
+    # --- resolution -----------------------------------------------------------
+
+    def _call(self, source, symbols, day):
+        """Run one source task; returns {symbol: volume} and updates its breaker"""
+        breaker = self.breakers[source.name]
+        try:
+            if source.batch:
+                found = source.fetch_batch(symbols, day)
+            else:
+                volume = source.fetch(symbols[0], day)
+                found = {symbols[0]: volume} if volume else {}
+        except Exception as e:
+            breaker.record_failure()
+            logger.warning(f"Volume source {source.name} failed for {len(symbols)} symbol(s): {e}")
+            raise
+        breaker.record_success()
+        self._remember_miss(source.name, [symbol for symbol in symbols if not found.get(symbol)], day)
+        return {symbol: int(volume) for symbol, volume in found.items() if volume and int(volume) > 0}
+
+    def resolve(self, symbols, day=None):
+        """
+        Look up the volume of each symbol on ``day`` (default: today, IST).
+
+        Returns:
+        dict: symbol -> {'volume': int, 'source': name}; unresolved symbols are omitted
+        """
+        day = day or today_ist()
+        symbols = list(dict.fromkeys(symbols))
+        resolved = {}
+        for symbol in symbols:
+            cached = self.memory.get((symbol, day)) or self._read_cache(symbol, day)
+            if cached:
+                resolved[symbol] = cached
+        self.cache_hits += len(resolved)
+
+        def record(source, found):
+            for symbol, volume in found.items():
+                # First valid answer wins; later ones are ignored
+                if symbol in resolved:
+                    continue
+                resolved[symbol] = {'volume': volume, 'source': source.name}
+                self.memory.set((symbol, day), resolved[symbol])
+                self.wins[source.name] += 1
+                self._write_cache(symbol, day, volume, source.name)
+
+        for source in self.sources:
+            pending = [symbol for symbol in symbols if symbol not in resolved]
+            if source.local and pending and source.available(day) and self.breakers[source.name].allow():
+                try:
+                    record(source, self._call(source, pending, day))
+                except Exception:
+                    pass
+
+        pending = [symbol for symbol in symbols if symbol not in resolved]
+        futures = {}
+        for source in self.sources:
+            if source.local or not pending or not source.available(day):
+                continue
+            wanted = [symbol for symbol in pending if not self._is_negative(source.name, symbol, day)]
+            if not wanted:
+                continue
+            groups = [wanted] if source.batch else [[symbol] for symbol in wanted]
+            for group in groups:
+                if not self.breakers[source.name].allow():
+                    break
+                futures[self._pool.submit(self._call, source, group, day)] = source
+
+        deadline = time.monotonic() + self.timeout
+        outstanding = set(futures)
+        while outstanding and len(resolved) < len(symbols):
+            done, outstanding = wait(outstanding, timeout=max(0.0, deadline - time.monotonic()),
+                                     return_when=FIRST_COMPLETED)
+            if not done:
+                logger.warning(f"Volume lookup timed out with {len(symbols) - len(resolved)} symbols unresolved")
+                break
+            for future in done:
+                source = futures[future]
+                try:
+                    record(source, future.result())
+                except Exception:
+                    continue
+
+        # Tasks that have not started yet are no longer needed; a cancelled one never
+        # reaches _call, so give back the breaker slot allow() reserved for it
+        for future in outstanding:
+            if future.cancel():
+                self.breakers[futures[future].name].release()
+        return resolved
+
+    def stats(self):
+        with self._lock:
+            negative = len(self._negative)
+        return {
+            'cache_hits': self.cache_hits,
+            'wins': dict(self.wins),
+            'negative_entries': negative,
+            'breakers': {name: breaker.stats() for name, breaker in self.breakers.items()},
+        }